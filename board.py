@@ -14,12 +14,22 @@ class Board:
     -------
         __init__()
         __repr__()
+        reset()
         initialize_pieces()
         update_zobrist_hash()
+        update_material_key()
+        make_null_move()
+        undo_null_move()
+        push_history()
+        pop_history()
+        is_repetition()
         update_white_controlled_squares()
         update_black_controlled_squares()
         find_sliding_controlled_squares()
         find_checking_pieces()
+        is_square_attacked()
+        find_attackers()
+        generate_attackers()
         find_interposition_squares()
         moves_must_escape_check_or_checkmate()
 
@@ -38,20 +48,13 @@ class Board:
         'h7': 55, 'a8': 56, 'b8': 57, 'c8': 58, 'd8': 59, 'e8': 60,
         'f8': 61, 'g8': 62, 'h8': 63}
     int_to_alg_notation = {v: k for k, v in ALGEBRAIC_NOTATION.items()}
+    # Four bits of the material key count each piece type, by first
+    # letter of the piece name. Kings are always present and not counted.
+    MATERIAL_KEY_SHIFTS = {'P': 0, 'N': 4, 'B': 8, 'R': 12, 'Q': 16,
+                           'p': 20, 'n': 24, 'b': 28, 'r': 32, 'q': 36}
 
     def __init__(self, rand_num_gen_seed=104):
-        self.squares = [' '] * 64
-        self.white_pieces = []
-        self.black_pieces = []
-        self.white_controlled_squares = []
-        self.black_controlled_squares = []
-        self.white_king = None
-        self.black_king = None
-        self.last_move_piece = None
-        self.last_move_from_to = (-1, -1)
-        self.zobrist_hash = 0
-        self.ep_hash_to_undo = None
-        self.applied_initial_castling_hash = False
+        self.reset()
 
         random.seed(rand_num_gen_seed)
         self.hash_nums = []
@@ -83,6 +86,30 @@ class Board:
             ranks_to_print.append(''.join(rank_x))
         return '\n'.join(ranks_to_print)
 
+    def reset(self):
+        """Remove every piece and forget the moves played, keeping the
+        Zobrist hash numbers.
+        """
+        self.squares = [' '] * 64
+        self.white_pieces = []
+        self.black_pieces = []
+        self.white_controlled_squares = []
+        self.black_controlled_squares = []
+        self.white_king = None
+        self.black_king = None
+        self.last_move_piece = None
+        self.last_move_from_to = (-1, -1)
+        self.zobrist_hash = 0
+        self.ep_hash_to_undo = None
+        self.applied_initial_castling_hash = False
+        # Zobrist hashes of earlier positions, oldest first, and the number
+        # of plies since the last capture or pawn move.
+        self.hash_history = []
+        self.halfmove_clock = 0
+        # Piece counts, see MATERIAL_KEY_SHIFTS. Updated on captures and
+        # promotions.
+        self.material_key = 0
+
     # Variable suffix corresponds to starting file (column) of the piece.
     def initialize_pieces(self, autopromote=[]):
         """Put all pieces on their initial squares. Adding a piece color
@@ -138,6 +165,8 @@ class Board:
                              black_pawn_e, black_pawn_f, black_pawn_g,
                              black_pawn_h, black_king]
 
+        # Pieces of an earlier game may remain elsewhere.
+        self.squares = [' '] * 64
         for piece in self.white_pieces + self.black_pieces:
             self.squares[piece.square] = piece
         self.white_king = white_king
@@ -161,6 +190,16 @@ class Board:
                                            'black',
                                            100)
         self.last_move_from_to = (-1, -1)
+        self.hash_history = []
+        self.halfmove_clock = 0
+        # Hash every piece and the castling rights now. Applying the
+        # castling rights on the first move left the initial position
+        # with a hash that no later position could repeat.
+        self.zobrist_hash = 0
+        self.ep_hash_to_undo = None
+        self.applied_initial_castling_hash = False
+        self.update_zobrist_hash()
+        self.update_material_key()
 
     def update_zobrist_hash(self, changed_pieces=None, switch_turn=False,
                             lose_castling=False):
@@ -252,6 +291,88 @@ class Board:
                         else:
                             raise ValueError('invalid rook square')
 
+    def update_material_key(self, removed_piece=None, added_piece=None):
+        """Return the material key and update the key attribute.
+
+        Without arguments, the key is counted from the piece lists.
+        Otherwise the key is updated for a captured or promoted piece
+        leaving the board and/or a promotion piece joining it.
+        """
+        shifts = self.MATERIAL_KEY_SHIFTS
+        if removed_piece is None and added_piece is None:
+            self.material_key = 0
+            for piece in self.white_pieces + self.black_pieces:
+                if piece.name[0] in shifts:
+                    self.material_key += 1 << shifts[piece.name[0]]
+            return self.material_key
+        if removed_piece is not None:
+            self.material_key -= 1 << shifts[removed_piece.name[0]]
+        if added_piece is not None:
+            self.material_key += 1 << shifts[added_piece.name[0]]
+        return self.material_key
+
+    def make_null_move(self):
+        """Pass the turn without moving a piece, for null move pruning.
+        Return the state which undo_null_move() restores.
+
+        The side to move is flipped and any en passant square is cleared
+        in the Zobrist hash. Repetitions are not looked for across a null
+        move.
+        """
+        saved_state = (self.last_move_piece, self.last_move_from_to,
+                       self.zobrist_hash, self.ep_hash_to_undo,
+                       self.push_history(True))
+        if self.ep_hash_to_undo is not None:
+            self.zobrist_hash ^= self.ep_hash_to_undo
+            self.ep_hash_to_undo = None
+        self.zobrist_hash ^= self.hash_nums[12]
+        if self.last_move_piece.color == 'white':
+            passing_color = 'black'
+        else:
+            passing_color = 'white'
+        self.last_move_piece = pieces.Pawn('placeholder', passing_color, 100)
+        self.last_move_from_to = (-1, -1)
+        return saved_state
+
+    def undo_null_move(self, saved_state):
+        """Restore the board from before make_null_move()."""
+        self.last_move_piece, self.last_move_from_to, self.zobrist_hash, \
+            self.ep_hash_to_undo, halfmove_clock = saved_state
+        self.pop_history(halfmove_clock)
+
+    def push_history(self, irreversible: bool) -> int:
+        """Record the current position before a move is made. Return the
+        halfmove clock for pop_history().
+
+        Captures and pawn moves are irreversible and reset the halfmove
+        clock.
+        """
+        halfmove_clock = self.halfmove_clock
+        self.hash_history.append(self.zobrist_hash)
+        if irreversible:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        return halfmove_clock
+
+    def pop_history(self, halfmove_clock: int):
+        """Forget the position recorded by the matching push_history()."""
+        self.hash_history.pop()
+        self.halfmove_clock = halfmove_clock
+
+    def is_repetition(self) -> bool:
+        """Return True if the current position occurred before with the
+        same side to move. Only positions since the last irreversible move
+        are compared.
+        """
+        history = self.hash_history
+        oldest = max(len(history) - self.halfmove_clock, 0)
+        # The same side was to move 4, 6, ... plies ago.
+        for i in range(len(history) - 4, oldest - 1, -2):
+            if history[i] == self.zobrist_hash:
+                return True
+        return False
+
     def update_white_controlled_squares(self):
         """Create a set to determine if black king is in check and limit
         black king moves which would put it in check.
@@ -342,6 +463,76 @@ class Board:
                     checking_pieces.append(piece)
         return checking_pieces
 
+    def is_square_attacked(self, square: int, attacker_color: str) -> bool:
+        """Return True if a piece of attacker_color attacks the square.
+
+        Much cheaper than updating the controlled squares when only one
+        square matters, such as a king square when detecting check.
+        """
+        for _ in self.generate_attackers(square, attacker_color):
+            return True
+        return False
+
+    def find_attackers(self, square: int, attacker_color: str,
+                       all_squares=None) -> list:
+        """Return the pieces of attacker_color which attack the square.
+
+        all_squares defaults to Board.squares. Static exchange evaluation
+        passes a copy with the pieces which already captured removed, so
+        that sliders behind them are found.
+        """
+        return list(self.generate_attackers(square, attacker_color,
+                                            all_squares))
+
+    def generate_attackers(self, square: int, attacker_color: str,
+                           all_squares=None):
+        """Yield the pieces of attacker_color which attack the square:
+        pawns, knights, then the first piece along each ray. See
+        find_attackers() for all_squares.
+        """
+        if all_squares is None:
+            all_squares = self.squares
+        rank, file_ = divmod(square, 8)
+        # Pawns attack toward the opposite side of the board.
+        if attacker_color == 'white':
+            pawn_rank = rank - 1
+        else:
+            pawn_rank = rank + 1
+        if 0 <= pawn_rank <= 7:
+            for pawn_file in (file_ - 1, file_ + 1):
+                if 0 <= pawn_file <= 7:
+                    piece = all_squares[pawn_rank * 8 + pawn_file]
+                    if piece != ' ' and piece.color == attacker_color \
+                            and isinstance(piece, pieces.Pawn):
+                        yield piece
+        for rank_step, file_step in ((1, 2), (2, 1), (-1, 2), (-2, 1),
+                                     (1, -2), (2, -1), (-1, -2), (-2, -1)):
+            if 0 <= rank + rank_step <= 7 and 0 <= file_ + file_step <= 7:
+                piece = all_squares[square + rank_step * 8 + file_step]
+                if piece != ' ' and piece.color == attacker_color \
+                        and isinstance(piece, pieces.Knight):
+                    yield piece
+        for rank_step, file_step in ((1, 0), (-1, 0), (0, 1), (0, -1),
+                                     (1, 1), (1, -1), (-1, 1), (-1, -1)):
+            if rank_step == 0 or file_step == 0:
+                sliding_pieces = (pieces.Rook, pieces.Queen)
+            else:
+                sliding_pieces = (pieces.Bishop, pieces.Queen)
+            ray_rank, ray_file = rank + rank_step, file_ + file_step
+            distance = 1
+            while 0 <= ray_rank <= 7 and 0 <= ray_file <= 7:
+                piece = all_squares[ray_rank * 8 + ray_file]
+                if piece != ' ':
+                    if piece.color == attacker_color \
+                            and (isinstance(piece, sliding_pieces)
+                                 or distance == 1
+                                 and isinstance(piece, pieces.King)):
+                        yield piece
+                    break
+                ray_rank += rank_step
+                ray_file += file_step
+                distance += 1
+
     def find_interposition_squares(self, checking_pieces: list,
                                    checked_king) -> list:
         """Assumes a king is in check. Return set of interposition squares
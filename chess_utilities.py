@@ -50,20 +50,22 @@ def print_fen_to_terminal(fen_string):
         print(row)
 
 
-def import_fen_to_board(fen: str, autopromote=False):
+def import_fen_to_board(fen: str, autopromote=False, chessboard=None):
     """Convert FEN string to board.Board object.
 
-    Does not consider en passant square, half-move count, or move count.
+    Fields after the side to move are optional. The en passant square
+    and half-move count are kept, the move count is ignored. A given
+    chessboard is reset and filled instead of a new board.
     """
-    chessboard = board.Board()
+    if chessboard is None:
+        chessboard = board.Board()
+    else:
+        chessboard.reset()
     fen = fen.strip().split(' ')
-    if len(fen) > 3:
-        raise ValueError('FEN en passant square and move counts not '
-                         'supported.')
-    castling_options = None
-    if len(fen) == 3:
-        castling_options = fen.pop()
-    turn_to_move = fen.pop()
+    if len(fen) > 6:
+        raise ValueError('Too many FEN fields.')
+    fen += [None] * (6 - len(fen))
+    fen, turn_to_move, castling_options, en_passant, halfmove_clock, _ = fen
     if turn_to_move == 'w':
         last_move_color = 'black'
     elif turn_to_move == 'b':
@@ -75,7 +77,7 @@ def import_fen_to_board(fen: str, autopromote=False):
                                              last_move_color,
                                              100)
 
-    fen = fen[0].split('/')
+    fen = fen.split('/')
 
     letter_to_piece = {'p': pieces.Pawn, 'n': pieces.Knight,
                        'b': pieces.Bishop, 'r': pieces.Rook,
@@ -147,6 +149,32 @@ def import_fen_to_board(fen: str, autopromote=False):
             chessboard.white_king.has_moved = True
         if 'k' not in castling_options and 'q' not in castling_options:
             chessboard.black_king.has_moved = True
+    chessboard.update_material_key()
+    # Hash the position as if it had been reached by play, where black to
+    # move follows a switch of turn.
+    chessboard.update_zobrist_hash()
+    if last_move_color == 'white':
+        chessboard.zobrist_hash ^= chessboard.hash_nums[12]
+
+    if en_passant not in (None, '-'):
+        # The double pawn push which allows en passant was the last move.
+        square = board.Board.ALGEBRAIC_NOTATION.get(en_passant)
+        if square in pieces.ranks_files.rank_3:
+            move_from_to = (square - 8, square + 8)
+        elif square in pieces.ranks_files.rank_6:
+            move_from_to = (square + 8, square - 8)
+        else:
+            raise ValueError('Invalid en passant square.')
+        pawn = chessboard.squares[move_from_to[1]]
+        if not isinstance(pawn, pieces.Pawn) \
+                or pawn.color != last_move_color:
+            raise ValueError('No pawn to capture en passant.')
+        chessboard.last_move_piece = pawn
+        chessboard.last_move_from_to = move_from_to
+        chessboard.ep_hash_to_undo = chessboard.hash_nums[13][square % 8]
+        chessboard.zobrist_hash ^= chessboard.ep_hash_to_undo
+    if halfmove_clock is not None:
+        chessboard.halfmove_clock = int(halfmove_clock)
 
     return chessboard
 
@@ -2,8 +2,17 @@
 a CLI.
 """
 
+import asyncio
+import atexit
+from collections import Counter
 from functools import reduce
-import logging
+import json
+import math
+import multiprocessing
+import os
+import stat
+import statistics
+import subprocess
 import sys
 import threading
 import time
@@ -11,8 +20,7 @@ import time
 import board
 import chess_utilities
 import pieces
-
-# logging.basicConfig(level=logging.DEBUG)
+import profiling
 
 
 def reorder_piece_square_table(pst, color):
@@ -171,20 +179,498 @@ for k, v in piece_square_tables_eg.items():
     white_pst_eg[k.upper()] = reorder_piece_square_table(v, 'white')
 
 transposition = {}
+# (phase, insufficient_material, white_scale, black_scale) by
+# Board.material_key. Filled by material_info() on the first lookup of
+# each key.
+material_table = {}
+# Counters for the most recent search, and its start time. Reset by
+# reset_search_stats(). See search_info().
+search_stats = Counter()
+search_start_time = time.time()
+# Search tree shape, recorded across searches while not None. See
+# start_search_analytics().
+search_analytics = None
+# Entries kept in a dict transposition table before the oldest are
+# trimmed, the capacity for UCI "hashfull".
+TT_MAX_ENTRIES = 700_000
+# Iterative deepening limit for searches without a depth, like "go infinite".
+MAX_DEPTH = 64
+# Aspiration windows around the previous iteration's score, in centipawns.
+# Without a quiescence search, scores swing between odd and even depths,
+# so shallow iterations search the full window.
+ASPIRATION_MIN_DEPTH = 4
+ASPIRATION_WINDOW = 100
+ASPIRATION_GROWTH = 4
+ASPIRATION_MAX_WINDOW = 1000
+# Null move pruning. The reduction grows by one past the adaptive depth.
+NULL_MOVE_MIN_DEPTH = 3
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_ADAPTIVE_DEPTH = 6
+# Confirm null move cutoffs with a reduced search of the node itself.
+NULL_MOVE_VERIFICATION = False
+NULL_MOVE_VERIFICATION_DEPTH = 4
+# Late move reductions for quiet moves, from LMR_TABLE[depth][move number].
+LMR_MIN_DEPTH = 3
+LMR_MIN_MOVES = 3
+LMR_BASE = 0.75
+LMR_DIVISOR = 2.25
+LMR_TABLE = [[0] * 64 for _ in range(MAX_DEPTH + 1)]
+for _depth in range(1, MAX_DEPTH + 1):
+    for _move_number in range(1, 64):
+        LMR_TABLE[_depth][_move_number] = int(
+            LMR_BASE
+            + math.log(_depth) * math.log(_move_number) / LMR_DIVISOR)
+# Move count pruning. Skip quiet moves after this many moves at depth 1-3.
+LATE_MOVE_PRUNING_COUNTS = (0, 6, 10, 16)
+# Extensions in plies, for moves that give check, recapture on the square
+# of the last capture, or push a pawn to the 7th rank. At most
+# EXTENSION_BUDGET plies are added along any path from the root. Without a
+# quiescence search, chains of extended captures and checks grow the tree
+# quickly, so the budget is small.
+CHECK_EXTENSION = 1
+RECAPTURE_EXTENSION = 1
+PAWN_PUSH_EXTENSION = 1
+EXTENSION_BUDGET = 1
+# Singular extensions. At depth SINGULAR_MIN_DEPTH and up, a TT move from
+# an entry at most SINGULAR_TT_DEPTH plies shallower is extended when every
+# other move fails low against the TT score minus SINGULAR_MARGIN per ply
+# of depth, in a search of half the depth. If that search fails high
+# against beta instead, several moves beat beta and the node is cut
+# (multi-cut).
+SINGULAR_MIN_DEPTH = 4
+SINGULAR_TT_DEPTH = 3
+SINGULAR_MARGIN = 25
+SINGULAR_EXTENSION = 1
+# ProbCut. From depth PROBCUT_MIN_DEPTH, captures which do not lose
+# material by static exchange evaluation are tried against beta plus
+# PROBCUT_MARGIN. A capture which holds that raised beta in a quiescence
+# search and then in a search PROBCUT_REDUCTION plies shallower cuts the
+# node.
+PROBCUT_MIN_DEPTH = 5
+PROBCUT_MARGIN = 200
+PROBCUT_REDUCTION = 3
+# Internal iterative deepening. Without a TT move, PV nodes and expected
+# cut nodes from depth IID_MIN_DEPTH first search IID_REDUCTION plies
+# shallower to find a move to order first.
+IID_MIN_DEPTH = 4
+IID_REDUCTION = 3
+# Being checkmated at ply p scores -MATE_SCORE + p, so shorter mates score
+# higher. Scores beyond MATE_BOUND are mates, so no margin applies to them.
+MATE_SCORE = 100000
+MATE_BOUND = MATE_SCORE - 2 * MAX_DEPTH
+# Margins in centipawns, indexed by remaining depth. Futility pruning skips
+# quiet moves at depth 1-2 when the static eval plus the margin cannot
+# reach alpha. Reverse futility returns beta when the static eval minus the
+# margin still beats it. Razoring takes a ply off depth 3 nodes far below
+# alpha, which leaves them to futility pruning.
+FUTILITY_MARGINS = (0, 200, 500)
+REVERSE_FUTILITY_MARGINS = (0, 200, 400, 600)
+RAZOR_MARGINS = (0, 0, 0, 900)
+# Benchmark positions: the start position, "Kiwipete", a middlegame and
+# a rook endgame.
+BENCH_FENS = (
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq',
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq',
+    'r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP3PPP/R2QKB1R w KQ',
+    '8/5pk1/6p1/1r6/4P3/5PK1/6P1/R7 w',
+)
+# Options set by the UCI "setoption" command. Threads above 1 searches
+# with parallel.search(), using the algorithm named by ParallelMode.
+# MultiPV above 1 searches with multipv_search() instead.
+uci_options = {'Threads': 1, 'ParallelMode': 'lazysmp', 'MultiPV': 1}
+UCI_MAX_THREADS = 16
+UCI_MAX_MULTIPV = 64
+PARALLEL_MODES = ('lazysmp', 'rootsplit', 'ybwc', 'threads')
+UCI_PROMOTIONS = {'q': 'queen', 'r': 'rook', 'b': 'bishop', 'n': 'knight'}
+# The board, start position and moves of the last UCI "position" command.
+# A command whose move list extends these moves only applies the new ones.
+uci_position = {'chessboard': None, 'start': None, 'moves': [],
+                'zobrist_hash': None}
+
+
+class TimeManager:
+    """Turn the limits of a UCI "go" command into search limits.
+
+    The soft limit is checked by iterative_deepening() before another
+    iteration starts. It grows when the best move changes between
+    iterations or the score drops (fail low), and it shrinks when the best
+    move is stable. The hard limit and node limit are polled by negamax()
+    every POLL_INTERVAL nodes and set the stop Event when exceeded.
+
+    With an output function, poll() also sends a progress info line every
+    INFO_INTERVAL seconds, naming the root move last passed to
+    root_move().
+
+    A "go ponder" search runs on the opponent's clock, without limits,
+    until the ponderhit Event is set. The limits then apply from that
+    moment, to the same search. ponder_time is the time searched before
+    the ponderhit.
+
+    UCI times are given in milliseconds. Attributes are in seconds.
+    """
+
+    # Nodes between clock checks. Roughly 5-10 ms at current speeds.
+    POLL_INTERVAL = 64
+    # Assumed number of moves left when "movestogo" is not given.
+    MOVES_TO_GO = 30
+    # Time reserved for GUI and pipe lag, in seconds.
+    MOVE_OVERHEAD = 0.05
+    HARD_LIMIT_FACTOR = 4
+    # Soft limit scaling between iterations.
+    FAIL_LOW_MARGIN = 30
+    FAIL_LOW_FACTOR = 1.5
+    INSTABILITY_FACTOR = 1.3
+    MAX_SOFT_SCALE = 3
+    STABLE_ITERATIONS = 4
+    STABLE_FACTOR = 0.5
+    # Seconds between progress info lines.
+    INFO_INTERVAL = 1.0
+
+    def __init__(self, color='white', wtime=None, btime=None, winc=0,
+                 binc=0, movestogo=None, movetime=None, depth=None,
+                 nodes=None, mate=None, infinite=False, ponder=False,
+                 stop=None, ponderhit=None, output=None):
+        self.stop = stop if stop is not None else threading.Event()
+        self.output = output
+        self.ponderhit = ponderhit if ponderhit is not None \
+            else threading.Event()
+        self.pondering = ponder
+        self.ponder_time = 0
+        self.nodes = nodes
+        self.max_depth = depth
+        if self.max_depth is None and mate is not None:
+            # Mate in N moves is found within 2N - 1 plies.
+            self.max_depth = 2 * mate - 1
+        self.soft = None
+        self.hard = None
+        if color == 'white':
+            time_left, increment = wtime, winc
+        else:
+            time_left, increment = btime, binc
+        if infinite:
+            pass
+        elif movetime is not None:
+            self.soft = max(movetime / 1000 - self.MOVE_OVERHEAD, 0.001)
+            self.hard = self.soft
+        elif time_left is not None:
+            time_left /= 1000
+            increment /= 1000
+            max_time = max(0.8 * (time_left - self.MOVE_OVERHEAD), 0.001)
+            moves_to_go = movestogo or self.MOVES_TO_GO
+            self.soft = min(time_left / moves_to_go + 0.75 * increment,
+                            max_time)
+            self.hard = min(self.soft * self.HARD_LIMIT_FACTOR, max_time)
+
+        self.soft_scale = 1.0
+        self.stable_iterations = 0
+        self.forced = False
+        self.scores = []
+        self.best_moves = []
+        self.start_time = time.time()
+        self.info_time = self.start_time + self.INFO_INTERVAL
+        self.currmove = None
+
+    def __repr__(self):
+        return f'TimeManager(soft={self.soft}, hard={self.hard}, ' \
+            f'nodes={self.nodes}, max_depth={self.max_depth})'
+
+    def is_timed(self):
+        """Return True if the search has a clock to respect."""
+        return self.hard is not None
+
+    def elapsed(self):
+        """Seconds since the search started, or since the ponderhit."""
+        return time.time() - self.start_time
+
+    def check_ponderhit(self):
+        """Return True while pondering. On a ponderhit, start the clock."""
+        if self.pondering and self.ponderhit.is_set():
+            self.pondering = False
+            self.ponder_time = self.elapsed()
+            self.start_time = time.time()
+        return self.pondering
+
+    def wait_for_ponderhit(self):
+        """Block a finished ponder search until the ponderhit or stop,
+        because its bestmove must not be sent before either.
+        """
+        while self.check_ponderhit() and not self.stop.is_set():
+            time.sleep(0.001)
+
+    def poll(self, nodes):
+        """Set the stop Event if the hard time or node limit is reached."""
+        if self.output is not None and time.time() >= self.info_time:
+            self.info_time = time.time() + self.INFO_INTERVAL
+            info = search_info()
+            line = 'info'
+            if self.currmove is not None:
+                depth, move_from_to, move_number = self.currmove
+                line += f' depth {depth} currmove ' \
+                    + ''.join(board.Board.int_to_alg_notation[i]
+                              for i in move_from_to) \
+                    + f' currmovenumber {move_number}'
+            self.output(f"{line} nodes {info['nodes']} nps {info['nps']} "
+                        f"hashfull {info['hashfull']} time {info['time']}")
+        if self.pondering and self.check_ponderhit():
+            return
+        if self.hard is not None and self.elapsed() >= self.hard:
+            self.stop.set()
+        elif self.nodes is not None and nodes >= self.nodes:
+            self.stop.set()
+
+    def root_move(self, depth, move_from_to, move_number):
+        """Record the root move about to be searched."""
+        self.currmove = (depth, move_from_to, move_number)
+
+    def iteration_done(self, score, best_move):
+        """Record a completed iteration. Return True if there is not
+        enough time left for another one.
+        """
+        if self.best_moves and best_move != self.best_moves[-1]:
+            self.soft_scale = min(self.soft_scale * self.INSTABILITY_FACTOR,
+                                  self.MAX_SOFT_SCALE)
+            self.stable_iterations = 0
+        elif self.best_moves:
+            self.stable_iterations += 1
+        if self.scores and score < self.scores[-1] - self.FAIL_LOW_MARGIN:
+            self.soft_scale = min(self.soft_scale * self.FAIL_LOW_FACTOR,
+                                  self.MAX_SOFT_SCALE)
+        self.scores.append(score)
+        self.best_moves.append(best_move)
+
+        if self.soft is None or self.check_ponderhit():
+            return False
+        if self.forced:
+            return True
+        soft_limit = self.soft * self.soft_scale
+        if self.stable_iterations >= self.STABLE_ITERATIONS:
+            soft_limit *= self.STABLE_FACTOR
+        return self.elapsed() >= soft_limit
+
+
+def parse_go_command(command):
+    """Return a dict of search limits from a split UCI "go" command.
+    Raise ValueError for unknown or malformed limits.
+    """
+    int_limits = ('wtime', 'btime', 'winc', 'binc', 'movestogo', 'movetime',
+                  'depth', 'nodes', 'mate')
+    limits = {}
+    words = iter(command[1:])
+    for word in words:
+        if word == 'searchmoves':
+            # Always the final limit. Moves are parsed by uci().
+            break
+        elif word == 'infinite':
+            limits['infinite'] = True
+        elif word == 'ponder':
+            limits['ponder'] = True
+        elif word in int_limits:
+            try:
+                limits[word] = int(next(words))
+            except StopIteration:
+                raise ValueError(f'Missing value for "{word}".')
+        else:
+            raise ValueError(f'Unknown limit: {word}')
+    return limits
+
+
+def parse_uci_move(chessboard, move):
+    """Return (piece, to square, promotion piece type or None) for a
+    legal move in UCI notation, like "e2e4" or "e7e8q". Return None for
+    an illegal or malformed move.
+
+    Only the moving piece's moves are updated, and the king's safety is
+    checked with Board.is_square_attacked() after the move, instead of
+    updating every controlled square of the opponent.
+    """
+    move = move.lower()
+    if len(move) not in (4, 5) \
+            or move[:2] not in board.Board.ALGEBRAIC_NOTATION \
+            or move[2:4] not in board.Board.ALGEBRAIC_NOTATION \
+            or len(move) == 5 and move[4] not in UCI_PROMOTIONS:
+        return None
+    square_from = board.Board.ALGEBRAIC_NOTATION[move[:2]]
+    square_to = board.Board.ALGEBRAIC_NOTATION[move[2:4]]
+    piece = chessboard.squares[square_from]
+    if piece == ' ' or piece.color == chessboard.last_move_piece.color:
+        return None
+    if piece.color == 'white':
+        friendly_king, opponent = chessboard.white_king, 'black'
+    else:
+        friendly_king, opponent = chessboard.black_king, 'white'
+
+    if piece is friendly_king and abs(square_to - square_from) == 2:
+        # Castling depends on every square the king crosses.
+        if opponent == 'black':
+            chessboard.update_black_controlled_squares()
+        else:
+            chessboard.update_white_controlled_squares()
+        piece.update_moves(chessboard)
+        if square_to not in piece.moves:
+            return None
+        return piece, square_to, None
+    elif piece is friendly_king:
+        occupant = chessboard.squares[square_to]
+        if abs(square_to // 8 - square_from // 8) > 1 \
+                or abs(square_to % 8 - square_from % 8) > 1 \
+                or occupant != ' ' and occupant.color == piece.color:
+            return None
+    else:
+        piece.update_moves(chessboard)
+        if square_to not in piece.moves:
+            return None
+
+    promote_to = None
+    if isinstance(piece, pieces.Pawn) and (square_to < 8 or square_to > 55):
+        promote_to = UCI_PROMOTIONS[move[4]] if len(move) == 5 else 'queen'
+    elif len(move) == 5:
+        return None
+
+    all_squares = chessboard.squares
+    captured_square = square_to
+    if isinstance(piece, pieces.Pawn) and square_to == piece.en_passant_move:
+        captured_square = chessboard.last_move_from_to[1]
+    captured_piece = all_squares[captured_square]
+    if isinstance(captured_piece, pieces.King):
+        return None
+    all_squares[square_from] = ' '
+    all_squares[captured_square] = ' '
+    all_squares[square_to] = piece
+    if piece is friendly_king:
+        king_square = square_to
+    else:
+        king_square = friendly_king.square
+    in_check = chessboard.is_square_attacked(king_square, opponent)
+    all_squares[square_to] = ' '
+    all_squares[captured_square] = captured_piece
+    all_squares[square_from] = piece
+    if in_check:
+        return None
+    return piece, square_to, promote_to
+
+
+def apply_uci_position(chessboard, command):
+    """Set up the board for a split UCI "position" command. Return False
+    if the FEN is invalid, or if a move is illegal, leaving the moves
+    before it applied.
+
+    When the board, start position and earlier moves match the last
+    command, only the new moves are made, so a GUI sending the whole game
+    before every "go" costs one move per command.
+    """
+    if 'moves' in command:
+        moves_ind = command.index('moves')
+    else:
+        moves_ind = len(command)
+    start = command[1:moves_ind]
+    moves = command[moves_ind + 1:]
+    applied = uci_position['moves']
+    if uci_position['chessboard'] is chessboard \
+            and uci_position['start'] == start \
+            and uci_position['zobrist_hash'] == chessboard.zobrist_hash \
+            and moves[:len(applied)] == applied:
+        new_moves = moves[len(applied):]
+    else:
+        # The search promotes to a queen unless told otherwise.
+        if start[:1] == ['startpos']:
+            chessboard.initialize_pieces(autopromote=['white', 'black'])
+        elif start[:1] == ['fen']:
+            try:
+                chess_utilities.import_fen_to_board(
+                    ' '.join(start[1:]), autopromote=True,
+                    chessboard=chessboard)
+            except ValueError:
+                uci_position['chessboard'] = None
+                return False
+        else:
+            return False
+        applied = []
+        uci_position.update(chessboard=chessboard, start=start,
+                            moves=applied)
+        new_moves = moves
+    # Stale until the moves are applied.
+    uci_position['zobrist_hash'] = None
+    for move in new_moves:
+        parsed_move = parse_uci_move(chessboard, move)
+        if parsed_move is None:
+            uci_position['chessboard'] = None
+            return False
+        piece, square_to, promote_to = parsed_move
+        chessboard.push_history(chessboard.squares[square_to] != ' '
+                                or isinstance(piece, pieces.Pawn))
+        # Validated above, as make_move() does for searched moves.
+        piece.moves = [square_to]
+        if promote_to is None:
+            piece.move_piece(chessboard, square_to)
+        else:
+            piece.move_piece(chessboard, square_to, promote_to)
+        applied.append(move)
+    uci_position['zobrist_hash'] = chessboard.zobrist_hash
+    return True
+
+
+def material_info(material_key):
+    """Return (phase, insufficient_material, white_scale, black_scale)
+    for a Board.material_key.
+
+    The phase is 0 (opening and middlegame) or 1 (endgame), rounded from
+    the piece_phase_values left on the board. Neither side can mate with
+    insufficient material. A scale multiplies the evaluation when that
+    side is ahead, for endings which are hard to win: no pawns and at
+    most a minor piece more than the opponent.
+    """
+    try:
+        return material_table[material_key]
+    except KeyError:
+        pass
+    counts = {name: (material_key >> shift) & 15
+              for name, shift in board.Board.MATERIAL_KEY_SHIFTS.items()}
+    phase = 24
+    for name, count in counts.items():
+        phase -= piece_phase_values[name] * count
+    phase = round(max(phase, 0) / 24)
+
+    minors = counts['N'] + counts['B'] + counts['n'] + counts['b']
+    insufficient_material = minors <= 1 and not any(
+        counts[name] for name in 'PRQprq')
+
+    non_pawn_material = [
+        sum(piece_values[name] * counts[name] for name in 'NBRQ'),
+        sum(piece_values[name] * counts[name] for name in 'nbrq')]
+    pawns = [counts['P'], counts['p']]
+    scales = [1, 1]
+    for side in (0, 1):
+        if pawns[side] or non_pawn_material[side] \
+                - non_pawn_material[1 - side] > piece_values['b']:
+            continue
+        # A lone minor piece cannot win, a rook or more rarely does.
+        if non_pawn_material[side] < piece_values['r']:
+            scales[side] = 0
+        else:
+            scales[side] = 0.25
+    # Two knights cannot force mate against a bare king.
+    for side, knight in ((0, 'N'), (1, 'n')):
+        if not pawns[side] and counts[knight] == 2 \
+                and non_pawn_material[side] == 2 * piece_values['n'] \
+                and not non_pawn_material[1 - side]:
+            scales[side] = 0
+    material_table[material_key] = (phase, insufficient_material,
+                                    scales[0], scales[1])
+    return material_table[material_key]
 
 
 def evaluate_pawns_and_phase(chessboard, piece_phase_values):
     """Return evaluation of doubled, blocked, and/or isolated pawns, in
     centipawns, and the current game phase.
 
-    Evaluating pawns and calculating the game phase in the same loop is
-    faster than two seperate loops/functions. n vs 2n.
+    The phase comes from the material table, in O(1). piece_phase_values
+    is kept for existing callers; material_info() uses the module table.
     """
     white_eval = 0
     black_eval = 0
     white_pawns_per_file = [0] * 8
     black_pawns_per_file = [0] * 8
-    phase = 24
+    phase = material_info(chessboard.material_key)[0]
     for piece in chessboard.white_pieces + chessboard.black_pieces:
         if piece.name[0] == 'p' or piece.name[0] == 'P':
             # Blocked pawns
@@ -196,10 +682,6 @@ def evaluate_pawns_and_phase(chessboard, piece_phase_values):
                 black_pawns_per_file[piece.square % 8] += 1
                 if piece.square - 8 not in piece.moves:
                     black_eval -= 50
-        else:
-            if not piece.name[0] == 'K' and not piece.name[0] == 'k':
-                phase -= piece_phase_values[piece.name[0].lower()]
-    phase = round(phase / 24)
 
     for color, pawns_per_file in enumerate([white_pawns_per_file,
                                             black_pawns_per_file]):
@@ -210,18 +692,9 @@ def evaluate_pawns_and_phase(chessboard, piece_phase_values):
                 pawn_eval -= 25 * pawn_count
             # Isolated pawns
             if pawn_count > 0:
-                try:
-                    lower_neighbor = pawns_per_file[i - 1]
-                except IndexError:
-                    # A-pawn(s)
-                    if pawns_per_file[i + 1] == 0:
-                        pawn_eval -= 50
-                try:
-                    higher_neighbor = pawns_per_file[i + 1]
-                except IndexError:
-                    # H-pawn(s)
-                    if pawns_per_file[i - 1] == 0:
-                        pawn_eval -= 50
+                # A-pawns and h-pawns have one neighboring file.
+                lower_neighbor = pawns_per_file[i - 1] if i > 0 else 0
+                higher_neighbor = pawns_per_file[i + 1] if i < 7 else 0
                 if lower_neighbor == 0 == higher_neighbor:
                     pawn_eval -= 50
         if color == 0:
@@ -262,6 +735,10 @@ def generate_move_tree(chessboard, pieces_to_move):
 
 def evaluate_position(chessboard):
     """Return board position evaluation in centipawns."""
+    _, insufficient_material, white_scale, black_scale = material_info(
+        chessboard.material_key)
+    if insufficient_material:
+        return 0
     # Piece values.
     white_position = sum([piece_values[piece.name[0]]
                           for piece in chessboard.white_pieces])
@@ -291,40 +768,452 @@ def evaluate_position(chessboard):
             + endgame_piece_eval * eg_percent
 
     total_evaluation += white_position - black_position
+    # Drawish endings count for less to the side which is ahead.
+    if total_evaluation > 0:
+        total_evaluation *= white_scale
+    else:
+        total_evaluation *= black_scale
     # Negation for negamax
     if chessboard.last_move_piece.color == 'white':
         total_evaluation *= -1
     return total_evaluation
 
 
-# TODO: Fix iter. deep. weird best moves.
-# Incorporate iterative deepening into search.
-def iterative_deepening(chessboard, depth, max_time=5, **kwargs):
-    """Move the best move piece to the front of its piece list for the
-    next depth calculation.
+def reset_search_stats():
+    """Clear search_stats and restart the search clock."""
+    global search_start_time
+    search_stats.clear()
+    search_start_time = time.time()
+
+
+def search_info():
+    """Return a dict of the most recent search's counters, with these
+    derived values:
+
+    time : int
+        Milliseconds since the search started.
+    nps : int
+        Nodes (including quiescence nodes) per second.
+    hashfull : int
+        Transposition table use, per mille.
+    tt_hit_rate : float
+        Share of transposition table probes which found an entry.
+    first_move_cutoff_rate : float
+        Share of beta cutoffs made by the first move searched, a measure
+        of move ordering.
+
+    """
+    info = dict(search_stats)
+    for key in ('nodes', 'qnodes', 'seldepth', 'tt_probes', 'tt_hits',
+                'beta_cutoffs', 'first_move_cutoffs'):
+        info.setdefault(key, 0)
+    elapsed = time.time() - search_start_time
+    info['time'] = int(elapsed * 1000)
+    info['nps'] = int(info['nodes'] / elapsed) if elapsed > 0 else 0
+    capacity = getattr(transposition, 'slots', TT_MAX_ENTRIES)
+    info['hashfull'] = min(len(transposition) * 1000 // capacity, 1000)
+    info['tt_hit_rate'] = info['tt_hits'] / max(info['tt_probes'], 1)
+    info['first_move_cutoff_rate'] = info['first_move_cutoffs'] \
+        / max(info['beta_cutoffs'], 1)
+    return info
+
+
+def format_uci_info(depth, score, line, multipv=None):
+    """Return a UCI info line for a completed iteration, with the
+    counters from search_info() and the principal variation, a list of
+    (from, to) moves.
+    """
+    info = search_info()
+    multipv = f'multipv {multipv} ' if multipv is not None else ''
+    pv = ' '.join(board.Board.int_to_alg_notation[square_from]
+                  + board.Board.int_to_alg_notation[square_to]
+                  for square_from, square_to in line)
+    return f"info depth {depth} seldepth {max(info['seldepth'], depth)} " \
+        f"{multipv}score {format_uci_score(score)} nodes {info['nodes']} " \
+        f"nps {info['nps']} hashfull {info['hashfull']} " \
+        f"time {info['time']} pv {pv}"
+
+
+def start_search_analytics():
+    """Record the shape of the search trees of following searches, until
+    stop_search_analytics(). Disabled, negamax() only checks that
+    search_analytics is None.
+
+    Recorded, summed over searches:
+
+    iteration_nodes : Counter
+        Nodes of each completed iterative deepening iteration by depth.
+    ply_nodes : Counter
+        Nodes by distance from the root.
+    cutoffs : Counter
+        Beta cutoffs by (remaining depth, number of the move which cut
+        off, from 1).
+
+    """
+    global search_analytics
+    search_analytics = {'searches': 0, 'iteration_nodes': Counter(),
+                        'ply_nodes': Counter(), 'cutoffs': Counter()}
+
+
+def stop_search_analytics():
+    """Stop recording and return search_analytics_report()."""
+    global search_analytics
+    report = search_analytics_report()
+    search_analytics = None
+    return report
+
+
+def search_analytics_report():
+    """Return the search tree shape recorded since
+    start_search_analytics() as a dict for JSON:
+
+    depths : list of dict
+        For each iteration depth, the nodes searched and the effective
+        branching factor, the ratio to the nodes of the previous depth.
+    plies : dict
+        Nodes by ply.
+    cut_nodes : int
+    first_move_cutoff_rate : float
+        Share of cut nodes where the first move searched cut off, a
+        measure of move ordering.
+    cutoff_move_numbers : dict
+        Cut nodes by the number of the move which cut off.
+    drafts : list of dict
+        Cut nodes and first move cutoff rate by remaining depth.
+
+    """
+    if search_analytics is None:
+        return None
+    iteration_nodes = search_analytics['iteration_nodes']
+    depths = []
+    for depth in sorted(iteration_nodes):
+        nodes = iteration_nodes[depth]
+        previous = iteration_nodes.get(depth - 1)
+        depths.append({'depth': depth, 'nodes': nodes,
+                       'ebf': round(nodes / previous, 3) if previous
+                       else None})
+    move_numbers = Counter()
+    draft_cuts = Counter()
+    draft_first_cuts = Counter()
+    for (draft, move_number), count in search_analytics['cutoffs'].items():
+        move_numbers[move_number] += count
+        draft_cuts[draft] += count
+        if move_number == 1:
+            draft_first_cuts[draft] += count
+    cut_nodes = sum(move_numbers.values())
+    return {
+        'searches': search_analytics['searches'],
+        'depths': depths,
+        'plies': {str(ply): nodes for ply, nodes
+                  in sorted(search_analytics['ply_nodes'].items())},
+        'cut_nodes': cut_nodes,
+        'first_move_cutoff_rate': round(move_numbers[1]
+                                        / max(cut_nodes, 1), 4),
+        'cutoff_move_numbers': {str(number): count for number, count
+                                in sorted(move_numbers.items())},
+        'drafts': [{'draft': draft, 'cut_nodes': draft_cuts[draft],
+                    'first_move_cutoff_rate': round(
+                        draft_first_cuts[draft] / draft_cuts[draft], 4)}
+                   for draft in sorted(draft_cuts)]}
+
+
+def dump_search_analytics(path):
+    """Write search_analytics_report() to path as JSON."""
+    with open(path, 'w') as report_file:
+        json.dump(search_analytics_report(), report_file, indent=2)
+
+
+def iterative_deepening(chessboard, depth, max_time=5, time_manager=None,
+                        info=None, **kwargs):
+    """Search to increasing depths. The transposition table orders the
+    previous iteration's best move first, and each iteration after the
+    first searches an aspiration window around the previous score.
+
+    With a TimeManager, stop between iterations based on its soft limit
+    and let negamax() abort at its hard limit. An aborted iteration is
+    discarded in favor of the last completed one. The search also ends
+    once it finds a mate within the depth searched.
+
+    info, if given, is called with (depth, score, best_move) after each
+    completed iteration.
     """
     start = time.time()
+    reset_search_stats()
+    if time_manager is not None:
+        if kwargs.get('stop') is None:
+            kwargs['stop'] = time_manager.stop
+        if time_manager.is_timed() and len(legal_moves(chessboard)) == 1:
+            time_manager.forced = True
+    stop = kwargs.get('stop')
+    if search_analytics is not None:
+        search_analytics['searches'] += 1
+    evaluation, best_move = float('-inf'), None
     for partial_depth in range(1, depth + 1):
-        evaluation, best_move = negamax(chessboard, partial_depth, **kwargs)
-        best_move_piece = chessboard.squares[best_move[0]]
-        if best_move_piece.name[0] != 'k' and best_move_piece.name[0] != 'K':
-            # Move ordering to speed up search function at deeper max
-            # depth, as in negamax(depth=1) then negamax(depth=2).
-            if best_move_piece.color == 'white':
-                chessboard.white_pieces.remove(best_move_piece)
-                chessboard.white_pieces.insert(0, best_move_piece)
-            else:
-                chessboard.black_pieces.remove(best_move_piece)
-                chessboard.black_pieces.insert(0, best_move_piece)
-        if max_time < (time.time() - start):
+        nodes_before = search_stats['nodes']
+        values = aspiration_search(chessboard, partial_depth, evaluation,
+                                   time_manager=time_manager, **kwargs)
+        if stop is not None and stop.is_set():
+            break
+        if search_analytics is not None:
+            search_analytics['iteration_nodes'][partial_depth] += \
+                search_stats['nodes'] - nodes_before
+        evaluation, best_move = values
+        if best_move is None:
+            break
+        if info is not None:
+            info(partial_depth, evaluation, best_move)
+        if abs(evaluation) >= MATE_BOUND \
+                and MATE_SCORE - abs(evaluation) <= partial_depth:
+            break
+        if time_manager is not None:
+            if time_manager.iteration_done(evaluation, best_move):
+                break
+        elif max_time < (time.time() - start):
             break
+    if best_move is None:
+        # Stopped before the first iteration finished.
+        root_moves = legal_moves(chessboard)
+        if root_moves:
+            best_move = root_moves[0]
     return evaluation, best_move
 
 
+def aspiration_search(chessboard, depth, prev_score, **kwargs):
+    """Search the root in a narrow window around the previous iteration's
+    score. Widen the failing side of the window and search again until
+    the score lands inside it.
+    """
+    if depth < ASPIRATION_MIN_DEPTH or abs(prev_score) >= MATE_BOUND:
+        return negamax(chessboard, depth, **kwargs)
+    stop = kwargs.get('stop')
+    delta = ASPIRATION_WINDOW
+    alpha = prev_score - delta
+    beta = prev_score + delta
+    while True:
+        score, best_move = negamax(chessboard, depth, alpha, beta, **kwargs)
+        if stop is not None and stop.is_set():
+            return score, best_move
+        delta *= ASPIRATION_GROWTH
+        if score <= alpha and alpha != float('-inf'):
+            alpha = prev_score - delta
+            if delta > ASPIRATION_MAX_WINDOW:
+                alpha = float('-inf')
+        elif score >= beta and beta != float('inf'):
+            beta = prev_score + delta
+            if delta > ASPIRATION_MAX_WINDOW:
+                beta = float('inf')
+        else:
+            return score, best_move
+        search_stats['aspiration_researches'] += 1
+
+
+def multipv_search(chessboard, depth, multipv, max_time=5,
+                   time_manager=None, info=None, stop=None, quit=None,
+                   searchmoves=None):
+    """Search to increasing depths for the best multipv root moves, each
+    with an exact score. Return a list of (score, (from, to)) lines, best
+    first.
+
+    Stopping works as in iterative_deepening(). info, if given, is called
+    with (depth, lines) after each completed iteration.
+    """
+    start = time.time()
+    reset_search_stats()
+    if time_manager is not None:
+        if stop is None:
+            stop = time_manager.stop
+        if time_manager.is_timed() and len(legal_moves(chessboard)) == 1:
+            time_manager.forced = True
+    lines = []
+    for partial_depth in range(1, depth + 1):
+        iteration_lines = multipv_root(
+            chessboard, partial_depth, multipv,
+            [move for _, move in lines], stop, quit, searchmoves,
+            time_manager)
+        if stop is not None and stop.is_set() or not iteration_lines:
+            break
+        lines = iteration_lines
+        if info is not None:
+            info(partial_depth, lines)
+        evaluation, best_move = lines[0]
+        if abs(evaluation) >= MATE_BOUND \
+                and MATE_SCORE - abs(evaluation) <= partial_depth:
+            break
+        if time_manager is not None:
+            if time_manager.iteration_done(evaluation, best_move):
+                break
+        elif max_time < (time.time() - start):
+            break
+    if not lines:
+        # Stopped before the first iteration finished.
+        lines = [(float('-inf'), move) for move in
+                 legal_moves(chessboard)[:1]]
+    return lines
+
+
+def multipv_root(chessboard, depth, multipv, previous_moves, stop=None,
+                 quit=None, searchmoves=None, time_manager=None):
+    """Search the root for multipv_search(). Return the best multipv
+    (score, (from, to)) lines, best first.
+
+    The previous iteration's moves are searched first, in their order.
+    Until there are multipv lines, each move is searched with a full
+    window. Later moves are searched with a null window at the worst
+    line's score, and again above it only if they beat it. Promotion
+    choices share one line, as in legal_moves().
+    """
+    if chessboard.last_move_piece.color == 'white':
+        friendly_king = chessboard.black_king
+        opponent_king = chessboard.white_king
+        pieces_to_move = chessboard.black_pieces
+    else:
+        friendly_king = chessboard.white_king
+        opponent_king = chessboard.black_king
+        pieces_to_move = chessboard.white_pieces
+    moves = generate_moves(chessboard, pieces_to_move, friendly_king)
+    if searchmoves is not None:
+        moves = [item for item in moves
+                 if (item[0], item[1]) in searchmoves]
+    order_moves(chessboard, moves)
+    previous_order = {move: i for i, move in enumerate(previous_moves)}
+
+    def previous_order_key(item):
+        piece, move = item[:2]
+        target_square = move if isinstance(move, int) else move[0]
+        return previous_order.get((piece.square, target_square),
+                                  len(previous_order))
+
+    moves.sort(key=previous_order_key)
+
+    lines = []
+    searched = set()
+    for piece, move, piece_moves, en_passant_move in moves:
+        target_square = move if isinstance(move, int) else move[0]
+        if (piece.square, target_square) in searched:
+            continue
+        if chessboard.squares[target_square] != ' ':
+            child_capture_square = target_square
+        else:
+            child_capture_square = None
+        saved_piece_loop, saved_move_loop = make_move(
+            chessboard, piece, move, piece_moves, en_passant_move,
+            pieces_to_move)
+        move_from_to = chessboard.last_move_from_to
+        if chessboard.is_square_attacked(friendly_king.square,
+                                         opponent_king.color):
+            undo_move(chessboard, saved_piece_loop, saved_move_loop)
+            continue
+        searched.add(move_from_to)
+        gives_check = chessboard.is_square_attacked(opponent_king.square,
+                                                    friendly_king.color)
+        extension = move_extension(piece, target_square, gives_check, None,
+                                   0)
+        child_kwargs = {'stop': stop, 'quit': quit,
+                        'time_manager': time_manager, 'ply': 1,
+                        'extensions': extension,
+                        'capture_square': child_capture_square}
+        if len(lines) < multipv:
+            score = -1 * negamax(chessboard, depth - 1 + extension,
+                                 **child_kwargs)[0]
+        else:
+            alpha = lines[-1][0]
+            score = -1 * negamax(chessboard, depth - 1 + extension,
+                                 -1 * alpha - 1, -1 * alpha,
+                                 **child_kwargs)[0]
+            if score > alpha:
+                search_stats['multipv_researches'] += 1
+                score = -1 * negamax(chessboard, depth - 1 + extension,
+                                     float('-inf'), -1 * alpha,
+                                     **child_kwargs)[0]
+        undo_move(chessboard, saved_piece_loop, saved_move_loop)
+        if stop is not None and stop.is_set():
+            return lines
+        if len(lines) < multipv or score > lines[-1][0]:
+            lines.append((score, move_from_to))
+            # Stable, so the earlier of two equal moves stays ahead.
+            lines.sort(key=lambda line: line[0], reverse=True)
+            del lines[multipv:]
+    if lines and searchmoves is None:
+        store_transposition(chessboard.zobrist_hash, lines[0][1],
+                            lines[0][0], 'pvnode', depth)
+    return lines
+
+
+def legal_moves(chessboard):
+    """Return the (from, to) squares of every legal move for the side to
+    move, in move generation order. Promotion choices share one entry.
+    """
+    if chessboard.last_move_piece.color == 'white':
+        friendly_king = chessboard.black_king
+        pieces_to_move = chessboard.black_pieces
+    else:
+        friendly_king = chessboard.white_king
+        pieces_to_move = chessboard.white_pieces
+    moves = []
+    for chessboard in generate_move_tree(chessboard, pieces_to_move):
+        if friendly_king.color == 'white':
+            chessboard.update_black_controlled_squares()
+        else:
+            chessboard.update_white_controlled_squares()
+        if friendly_king.check_if_in_check(
+                chessboard.white_controlled_squares,
+                chessboard.black_controlled_squares):
+            friendly_king.in_check = False
+        elif chessboard.last_move_from_to not in moves:
+            moves.append(chessboard.last_move_from_to)
+    return moves
+
+
+def principal_variation(chessboard, best_move):
+    """Return the principal variation, a list of (from, to) moves which
+    starts with best_move and follows transposition table moves. The line
+    ends at a missing or illegal move or a repeated position.
+    """
+    line = []
+    saved_states = []
+    seen_hashes = {chessboard.zobrist_hash}
+    move_from_to = best_move
+    while move_from_to is not None and len(line) < MAX_DEPTH:
+        if chessboard.last_move_piece.color == 'white':
+            friendly_king = chessboard.black_king
+            opponent_king = chessboard.white_king
+            pieces_to_move = chessboard.black_pieces
+        else:
+            friendly_king = chessboard.white_king
+            opponent_king = chessboard.black_king
+            pieces_to_move = chessboard.white_pieces
+        for piece, move, piece_moves, en_passant_move in generate_moves(
+                chessboard, pieces_to_move, friendly_king):
+            if (piece.square, move) == move_from_to:
+                break
+        else:
+            break
+        saved_states.append(make_move(chessboard, piece, move, piece_moves,
+                                      en_passant_move, pieces_to_move))
+        if chessboard.is_square_attacked(friendly_king.square,
+                                         opponent_king.color):
+            break
+        line.append(move_from_to)
+        if chessboard.zobrist_hash in seen_hashes:
+            break
+        seen_hashes.add(chessboard.zobrist_hash)
+        entry = transposition.get(chessboard.zobrist_hash)
+        move_from_to = entry[0] if entry is not None else None
+    for saved_piece_loop, saved_move_loop in reversed(saved_states):
+        undo_move(chessboard, saved_piece_loop, saved_move_loop)
+    return line
+
+
 def negamax(chessboard, depth, alpha=float('-inf'), beta=float('inf'),
-            stop=None, quit=None, searchmoves=None):
+            stop=None, quit=None, searchmoves=None, time_manager=None,
+            ply=0, allow_null=True, extensions=0, capture_square=None,
+            excluded_move=None):
     """DFS through move tree and evaluate leaves.
 
+    Principal variation search: the first legal move is searched with the
+    full (alpha, beta) window, later moves with a null window, and only
+    moves which fail high are searched again with the full window.
+
     Parameters
     ----------
     chessboard : board.Board
@@ -339,129 +1228,697 @@ def negamax(chessboard, depth, alpha=float('-inf'), beta=float('inf'),
     searchmoves : None or list of tuples [(piece_0, move), ...]
         Group of same-colored pieces to exclusively include in the move
         tree. For uci() "go" command.
+    time_manager : None or TimeManager
+        Polled for the hard time and node limits.
+    ply : int
+        Distance from the root of the search.
+    allow_null : bool
+        False directly after a null move, so two passes are never made in
+        a row.
+    extensions : int
+        Plies of extension already used on the path from the root.
+    capture_square : None or int
+        Square of the capture which led to this node, if any.
+    excluded_move : None or tuple (int, int)
+        Move to skip, for the singular extension search. The node's
+        transposition table entry is neither used nor replaced.
 
     """
+    search_stats['nodes'] += 1
+    if ply > search_stats['seldepth']:
+        search_stats['seldepth'] = ply
+    if search_analytics is not None:
+        search_analytics['ply_nodes'][ply] += 1
+    if time_manager is not None \
+            and not search_stats['nodes'] % time_manager.POLL_INTERVAL:
+        time_manager.poll(search_stats['nodes'])
+    if stop is not None and stop.is_set():
+        return alpha, None
+    if ply > 0:
+        if chessboard.is_repetition():
+            search_stats['repetition_draws'] += 1
+            return 0, None
+        if chessboard.halfmove_clock >= 100:
+            search_stats['fifty_move_draws'] += 1
+            return 0, None
+        if material_info(chessboard.material_key)[1]:
+            search_stats['insufficient_material_draws'] += 1
+            return 0, None
     if depth == 0:
         return evaluate_position(chessboard), chessboard.last_move_from_to
+    # Draw scores depend on the path to the node, so results which use
+    # them are not stored with a depth.
+    draws_before = search_stats['repetition_draws'] \
+        + search_stats['fifty_move_draws']
 
-    if searchmoves is None:
-        if chessboard.last_move_piece.color == 'white':
-            friendly_king = chessboard.black_king
-            pieces_to_move = chessboard.black_pieces
-        else:
-            friendly_king = chessboard.white_king
-            pieces_to_move = chessboard.white_pieces
+    # Mate distance pruning. Neither side can do better than mating, or
+    # worse than being mated, right here.
+    if ply > 0:
+        alpha = max(alpha, -1 * MATE_SCORE + ply)
+        beta = min(beta, MATE_SCORE - ply - 1)
+        if alpha >= beta:
+            search_stats['mate_distance_prunes'] += 1
+            return alpha, None
+
+    tt_move = None
+    entry = None
+    if excluded_move is None:
+        search_stats['tt_probes'] += 1
+        entry = transposition.get(chessboard.zobrist_hash)
+    if entry is not None:
+        search_stats['tt_hits'] += 1
+        tt_move, tt_score, node, tt_depth = entry
+        tt_score = score_from_transposition(tt_score, ply)
+        # The root always searches, so it can report a best move.
+        if ply > 0 and tt_depth >= depth:
+            if node == 'pvnode':
+                return tt_score, tt_move
+            elif node == 'cutnode' and tt_score >= beta:
+                return beta, tt_move
+            elif node == 'allnode' and tt_score <= alpha:
+                return alpha, tt_move
+
+    if chessboard.last_move_piece.color == 'white':
+        friendly_king = chessboard.black_king
+        opponent_king = chessboard.white_king
+        pieces_to_move = chessboard.black_pieces
     else:
-        pieces_to_move = []
-        moves_to_search = []
-        for search_piece, search_move in searchmoves:
-            pieces_to_move.append(search_piece)
-            moves_to_search.append(search_move)
-        if pieces_to_move[0].color == 'white':
-            friendly_king = chessboard.white_king
-        else:
-            friendly_king = chessboard.black_king
+        friendly_king = chessboard.white_king
+        opponent_king = chessboard.black_king
+        pieces_to_move = chessboard.white_pieces
+    in_check = chessboard.is_square_attacked(
+        friendly_king.square, chessboard.last_move_piece.color)
+    is_pv_node = beta - alpha > 1
+    static_eval = None
+    if not is_pv_node and not in_check:
+        static_eval = evaluate_position(chessboard)
+    # Bounds near mate scores are not moved by positional margins.
+    prune_near_leaves = static_eval is not None \
+        and abs(alpha) < MATE_BOUND and abs(beta) < MATE_BOUND
+
+    # Reverse futility pruning. Far above beta, any reasonable move keeps
+    # the score above it.
+    if prune_near_leaves and depth < len(REVERSE_FUTILITY_MARGINS) \
+            and static_eval - REVERSE_FUTILITY_MARGINS[depth] >= beta:
+        search_stats['reverse_futility_cutoffs'] += 1
+        return beta, None
+
+    # Razoring.
+    if prune_near_leaves and depth < len(RAZOR_MARGINS) \
+            and RAZOR_MARGINS[depth] \
+            and static_eval + RAZOR_MARGINS[depth] <= alpha:
+        search_stats['razoring_reductions'] += 1
+        depth -= 1
+
+    # Null move pruning. If passing still fails high, a real move almost
+    # certainly would. Zugzwang makes passing unsafe without non-pawn
+    # material or in check.
+    if allow_null and not is_pv_node and not in_check \
+            and depth >= NULL_MOVE_MIN_DEPTH \
+            and has_non_pawn_material(pieces_to_move) \
+            and static_eval >= beta:
+        search_stats['null_move_tries'] += 1
+        reduction = NULL_MOVE_REDUCTION
+        if depth > NULL_MOVE_ADAPTIVE_DEPTH:
+            reduction += 1
+        saved_null_move = chessboard.make_null_move()
+        score = -1 * negamax(chessboard, max(depth - 1 - reduction, 0),
+                             -1 * beta, -1 * beta + 1, stop, quit,
+                             time_manager=time_manager, ply=ply + 1,
+                             allow_null=False, extensions=extensions)[0]
+        chessboard.undo_null_move(saved_null_move)
+        if stop is not None and stop.is_set():
+            return alpha, None
+        if score >= beta and NULL_MOVE_VERIFICATION \
+                and depth > NULL_MOVE_VERIFICATION_DEPTH:
+            search_stats['null_move_verifications'] += 1
+            score = negamax(chessboard, depth - reduction, beta - 1, beta,
+                            stop, quit, time_manager=time_manager, ply=ply,
+                            allow_null=False, extensions=extensions,
+                            capture_square=capture_square)[0]
+        if score >= beta:
+            search_stats['null_move_cutoffs'] += 1
+            return beta, None
+
+    # ProbCut.
+    if not is_pv_node and not in_check and depth >= PROBCUT_MIN_DEPTH \
+            and abs(beta) < MATE_BOUND and excluded_move is None \
+            and searchmoves is None:
+        probcut_move = probcut(chessboard, depth, beta, pieces_to_move,
+                               friendly_king, opponent_king, stop, quit,
+                               time_manager, ply, extensions)
+        if stop is not None and stop.is_set():
+            return alpha, None
+        if probcut_move is not None:
+            return beta, probcut_move
+
+    # Internal iterative deepening.
+    iid_move = None
+    if tt_move is None and depth >= IID_MIN_DEPTH and excluded_move is None \
+            and (is_pv_node or static_eval is not None
+                 and static_eval >= beta):
+        search_stats['iid_searches'] += 1
+        nodes_before = search_stats['nodes']
+        iid_move = negamax(chessboard, depth - IID_REDUCTION, alpha, beta,
+                           stop, quit, searchmoves, time_manager=time_manager,
+                           ply=ply, allow_null=False, extensions=extensions,
+                           capture_square=capture_square)[1]
+        search_stats['iid_nodes'] += search_stats['nodes'] - nodes_before
+        if stop is not None and stop.is_set():
+            return alpha, None
+        if iid_move is None:
+            entry_after_iid = transposition.get(chessboard.zobrist_hash)
+            if entry_after_iid is not None:
+                iid_move = entry_after_iid[0]
+        tt_move = iid_move
+
+    # Singular extensions and multi-cut.
+    singular_move = None
+    if entry is not None and ply > 0 and depth >= SINGULAR_MIN_DEPTH \
+            and tt_move is not None and node in ('pvnode', 'cutnode') \
+            and tt_depth >= depth - SINGULAR_TT_DEPTH \
+            and abs(tt_score) < MATE_BOUND:
+        search_stats['singular_searches'] += 1
+        singular_beta = tt_score - SINGULAR_MARGIN * depth
+        score = negamax(chessboard, (depth - 1) // 2, singular_beta - 1,
+                        singular_beta, stop, quit,
+                        time_manager=time_manager, ply=ply,
+                        allow_null=False, extensions=extensions,
+                        capture_square=capture_square,
+                        excluded_move=tt_move)[0]
+        if stop is not None and stop.is_set():
+            return alpha, None
+        if score < singular_beta:
+            singular_move = tt_move
+        elif singular_beta >= beta:
+            search_stats['multi_cuts'] += 1
+            return beta, tt_move
+
+    moves = generate_moves(chessboard, pieces_to_move, friendly_king)
+    if excluded_move is not None:
+        moves = [item for item in moves
+                 if (item[0].square, item[1]) != excluded_move]
+    if searchmoves is not None:
+        moves = [item for item in moves
+                 if (item[0], item[1]) in searchmoves]
+    order_moves(chessboard, moves, tt_move)
 
     best_move = None
-    for i, piece in enumerate(pieces_to_move):
-        if piece is chessboard.white_king:
+    searched_moves = 0
+    has_legal_move = False
+    for piece, move, piece_moves, en_passant_move in moves:
+        if isinstance(move, int):
+            target_square = move
+        else:
+            target_square = move[0]
+        if chessboard.squares[target_square] != ' ':
+            child_capture_square = target_square
+        else:
+            child_capture_square = None
+        is_quiet = child_capture_square is None and isinstance(move, int) \
+            and not (isinstance(piece, pieces.Pawn)
+                     and (move == en_passant_move or move < 8 or move > 55))
+        is_singular = singular_move is not None \
+            and (piece.square, move) == singular_move
+        saved_piece_loop, saved_move_loop = make_move(
+            chessboard, piece, move, piece_moves, en_passant_move,
+            pieces_to_move)
+        # Ray scan first. Updating the controlled squares of a side whose
+        # king is in check, while the other king is also in check, never
+        # returns.
+        if chessboard.is_square_attacked(friendly_king.square,
+                                         opponent_king.color):
+            undo_move(chessboard, saved_piece_loop, saved_move_loop)
+            continue
+        has_legal_move = True
+        gives_check = chessboard.is_square_attacked(opponent_king.square,
+                                                    friendly_king.color)
+        extension = move_extension(piece, target_square, gives_check,
+                                   capture_square, extensions, is_singular)
+        is_late_quiet = is_quiet and not gives_check and not in_check \
+            and not extension
+
+        # Move count pruning. Near the leaves, late quiet moves rarely
+        # beat the moves ordered before them. Only moves which passed the
+        # ray scan are pruned, so has_legal_move still detects mates, but
+        # before the controlled squares update below.
+        if is_late_quiet and not is_pv_node \
+                and depth < len(LATE_MOVE_PRUNING_COUNTS) \
+                and searched_moves >= LATE_MOVE_PRUNING_COUNTS[depth]:
+            search_stats['late_move_prunes'] += 1
+            undo_move(chessboard, saved_piece_loop, saved_move_loop)
+            continue
+        # Futility pruning. A quiet move near the leaves cannot make up a
+        # static eval this far below alpha.
+        if is_late_quiet and prune_near_leaves \
+                and depth < len(FUTILITY_MARGINS) \
+                and static_eval + FUTILITY_MARGINS[depth] <= alpha:
+            search_stats['futility_prunes'] += 1
+            undo_move(chessboard, saved_piece_loop, saved_move_loop)
+            continue
+        if friendly_king.color == 'white':
             chessboard.update_black_controlled_squares()
-        elif piece is chessboard.black_king:
+        else:
             chessboard.update_white_controlled_squares()
-        piece.update_moves(chessboard)
-        if searchmoves:
-            for i, search_piece in enumerate(pieces_to_move):
-                search_piece.moves = [moves_to_search[i]]
-        if isinstance(piece, pieces.Pawn):
-            replicate_promotion_moves(chessboard)
+        if friendly_king.check_if_in_check(
+                chessboard.white_controlled_squares,
+                chessboard.black_controlled_squares):
+            friendly_king.in_check = False
+            undo_move(chessboard, saved_piece_loop, saved_move_loop)
+            continue
+        if ply == 0 and time_manager is not None:
+            time_manager.root_move(depth, chessboard.last_move_from_to,
+                                   searched_moves + 1)
 
-        saved_piece_loop = save_state_per_piece(chessboard, pieces_to_move[i],
-                                                i, pieces_to_move)
-        for move in piece.moves:
-            saved_move_loop = save_state_per_move(chessboard, move, piece)
-            piece.move_piece(chessboard, move)
-            if friendly_king.color == 'white':
-                chessboard.update_black_controlled_squares()
-            else:
-                chessboard.update_white_controlled_squares()
-            if friendly_king.check_if_in_check(
-                    chessboard.white_controlled_squares,
-                    chessboard.black_controlled_squares):
-                friendly_king.in_check = False
-            else:
-                try:
-                    _, score, node = transposition[chessboard.zobrist_hash]
-                    # Should PV nodes ever be overwritten as other node types?
-                    if node == 'cutnode':
-                        alpha = score
-                        undo_move(chessboard, saved_piece_loop,
-                                  saved_move_loop)
-                        continue
-                    elif node == 'allnode':
-                        beta = score
-                        undo_move(chessboard, saved_piece_loop,
-                                  saved_move_loop)
-                        continue
-                    elif node == 'pvnode':
-                        if score > beta:
-                            best_move = chessboard.last_move_from_to
-                            undo_move(chessboard, saved_piece_loop,
-                                      saved_move_loop)
-                            return beta, best_move
-                        elif score > alpha:
-                            alpha = score
-                            best_move = chessboard.last_move_from_to
-                            undo_move(chessboard, saved_piece_loop,
-                                      saved_move_loop)
-                        continue
-                except KeyError:
-                    values = negamax(chessboard, depth - 1, -1 * beta,
-                                     -1 * alpha, stop, quit)
-                    raw_score = values[0]
-                    score = -1 * raw_score
-                # Cut node/Type 2
-                # Fail hard when score exceeds beta boundary.
-                if score >= beta:
-                    best_move = chessboard.last_move_from_to
-                    undo_move(chessboard, saved_piece_loop, saved_move_loop)
-                    transposition[chessboard.zobrist_hash] = \
-                        (best_move, score, 'cutnode')
-                    return beta, best_move
-                # PV node/Type 1
-                elif score > alpha:
-                    alpha = score
-                    best_move = chessboard.last_move_from_to
-                    transposition[chessboard.zobrist_hash] = \
-                        (best_move, score, 'pvnode')
-                # All node/Type 3
-                elif chessboard.zobrist_hash not in transposition:
-                    transposition[chessboard.zobrist_hash] = \
-                        (best_move, score, 'allnode')
-                # Add depth and age to transposition table?
-                # Cache invalidation based on insertion order.
-                # Ideal hash table load is 0.6 to 0.75.
-                # Dicts refuse new entries past 1 million, use a growth
-                # factor of 3, and a starting size of 8.
-                # 8 * 3^10 = 472392
-                # Delete first 200,000 key/value pairs added to the
-                # transposition table.
-                if len(transposition) > 700_000:
-                    # Iterator would be nice but gives RuntimeError
-                    keys = list(transposition)[:200_000]
-                    for key in keys:
-                        del transposition[key]
+        new_depth = depth - 1 + extension
+        if searched_moves == 0 or alpha == float('-inf'):
+            score = -1 * negamax(chessboard, new_depth, -1 * beta,
+                                 -1 * alpha, stop, quit,
+                                 time_manager=time_manager,
+                                 ply=ply + 1,
+                                 extensions=extensions + extension,
+                                 capture_square=child_capture_square)[0]
+        else:
+            reduction = 0
+            # Root moves are never reduced. Their order is still rough.
+            if is_late_quiet and ply > 0 and depth >= LMR_MIN_DEPTH \
+                    and searched_moves >= LMR_MIN_MOVES:
+                reduction = late_move_reduction(depth, searched_moves,
+                                                is_pv_node)
+            # Null window. Only prove that the move does not beat alpha.
+            score = -1 * negamax(chessboard, new_depth - reduction,
+                                 -1 * alpha - 1, -1 * alpha, stop, quit,
+                                 time_manager=time_manager,
+                                 ply=ply + 1,
+                                 extensions=extensions + extension,
+                                 capture_square=child_capture_square)[0]
+            if reduction and score > alpha:
+                search_stats['lmr_researches'] += 1
+                score = -1 * negamax(chessboard, new_depth, -1 * alpha - 1,
+                                     -1 * alpha, stop, quit,
+                                     time_manager=time_manager,
+                                     ply=ply + 1,
+                                     extensions=extensions + extension,
+                                     capture_square=child_capture_square)[0]
+            if alpha < score < beta:
+                search_stats['pvs_researches'] += 1
+                score = -1 * negamax(chessboard, new_depth, -1 * beta,
+                                     -1 * alpha, stop, quit,
+                                     time_manager=time_manager,
+                                     ply=ply + 1,
+                                     extensions=extensions + extension,
+                                     capture_square=child_capture_square)[0]
+        searched_moves += 1
+        move_from_to = chessboard.last_move_from_to
+        undo_move(chessboard, saved_piece_loop, saved_move_loop)
+        try:
+            if quit.is_set():
+                sys.exit(0)
+            elif stop.is_set():
+                # Partial subtree scores are not trustworthy.
+                return alpha, best_move
+        except AttributeError:
+            pass
 
-            undo_move(chessboard, saved_piece_loop, saved_move_loop)
-            try:
-                if quit.is_set():
-                    sys.exit(0)
-                elif stop.is_set():
-                    return alpha, best_move
-            except AttributeError:
-                pass
+        # Cut node/Type 2
+        # Fail hard when score exceeds beta boundary.
+        if score >= beta:
+            search_stats['beta_cutoffs'] += 1
+            if searched_moves == 1:
+                search_stats['first_move_cutoffs'] += 1
+            if search_analytics is not None:
+                search_analytics['cutoffs'][depth, searched_moves] += 1
+            if singular_move is not None and move_from_to != singular_move:
+                search_stats['singular_best_move_changes'] += 1
+            if iid_move is not None and move_from_to == iid_move:
+                search_stats['iid_move_cutoffs'] += 1
+            if searchmoves is None and excluded_move is None:
+                store_transposition(chessboard.zobrist_hash, move_from_to,
+                                    score, 'cutnode',
+                                    tt_store_depth(depth, draws_before),
+                                    ply)
+            return beta, move_from_to
+        # PV node/Type 1
+        elif score > alpha:
+            alpha = score
+            best_move = move_from_to
+
+    if not has_legal_move and excluded_move is None \
+            and searchmoves is None:
+        # Checkmate or stalemate, which holds at any depth.
+        if in_check:
+            search_stats['checkmates'] += 1
+            score = -1 * MATE_SCORE + ply
+        else:
+            search_stats['stalemates'] += 1
+            score = 0
+        store_transposition(chessboard.zobrist_hash, None, score, 'pvnode',
+                            MAX_DEPTH, ply)
+        return score, None
+    if singular_move is not None and best_move != singular_move:
+        search_stats['singular_best_move_changes'] += 1
+    if iid_move is not None and best_move == iid_move:
+        search_stats['iid_move_best'] += 1
+    if searchmoves is None and excluded_move is None:
+        store_depth = tt_store_depth(depth, draws_before)
+        if best_move is not None:
+            store_transposition(chessboard.zobrist_hash, best_move, alpha,
+                                'pvnode', store_depth, ply)
+        else:
+            # All node/Type 3
+            store_transposition(chessboard.zobrist_hash, tt_move, alpha,
+                                'allnode', store_depth, ply)
     return alpha, best_move
 
 
+def move_extension(piece, target_square, gives_check, capture_square,
+                   extensions, is_singular=False):
+    """Return the number of plies to extend a move by, within what is
+    left of EXTENSION_BUDGET on the path from the root.
+
+    Parameters
+    ----------
+    piece : pieces._Piece
+        The moved piece, on target_square.
+    target_square : int
+    gives_check : bool
+    capture_square : None or int
+        Square of the capture which led to the current node, if any.
+    extensions : int
+        Plies of extension already used on the path from the root.
+    is_singular : bool
+        True for a transposition table move found to be singular.
+
+    """
+    budget = EXTENSION_BUDGET - extensions
+    if budget <= 0:
+        return 0
+    extension = 0
+    if is_singular and SINGULAR_EXTENSION:
+        extension = SINGULAR_EXTENSION
+        search_stats['singular_extensions'] += 1
+    elif gives_check and CHECK_EXTENSION:
+        extension = CHECK_EXTENSION
+        search_stats['check_extensions'] += 1
+    elif target_square == capture_square and RECAPTURE_EXTENSION:
+        extension = RECAPTURE_EXTENSION
+        search_stats['recapture_extensions'] += 1
+    elif isinstance(piece, pieces.Pawn) and PAWN_PUSH_EXTENSION \
+            and (48 <= target_square <= 55 and piece.color == 'white'
+                 or 8 <= target_square <= 15 and piece.color == 'black'):
+        extension = PAWN_PUSH_EXTENSION
+        search_stats['pawn_push_extensions'] += 1
+    return min(extension, budget)
+
+
+def probcut(chessboard, depth, beta, pieces_to_move, friendly_king,
+            opponent_king, stop, quit, time_manager, ply, extensions):
+    """Return a capture which holds beta plus PROBCUT_MARGIN in a
+    quiescence search and a reduced depth search, or None.
+    """
+    probcut_beta = beta + PROBCUT_MARGIN
+    search_stats['probcut_tries'] += 1
+    moves = [item for item in generate_moves(chessboard, pieces_to_move,
+                                             friendly_king)
+             if isinstance(item[1], int)
+             and chessboard.squares[item[1]] != ' '
+             and static_exchange_evaluation(chessboard, item[0],
+                                            item[1]) >= 0]
+    order_moves(chessboard, moves)
+    for piece, move, piece_moves, en_passant_move in moves:
+        saved_piece_loop, saved_move_loop = make_move(
+            chessboard, piece, move, piece_moves, en_passant_move,
+            pieces_to_move)
+        if chessboard.is_square_attacked(friendly_king.square,
+                                         opponent_king.color):
+            undo_move(chessboard, saved_piece_loop, saved_move_loop)
+            continue
+        if friendly_king.color == 'white':
+            chessboard.update_black_controlled_squares()
+        else:
+            chessboard.update_white_controlled_squares()
+        score = -1 * quiescence(chessboard, -1 * probcut_beta,
+                                -1 * probcut_beta + 1, stop, time_manager)
+        if score >= probcut_beta:
+            score = -1 * negamax(chessboard, depth - 1 - PROBCUT_REDUCTION,
+                                 -1 * probcut_beta, -1 * probcut_beta + 1,
+                                 stop, quit, time_manager=time_manager,
+                                 ply=ply + 1, extensions=extensions,
+                                 capture_square=move)[0]
+        move_from_to = chessboard.last_move_from_to
+        undo_move(chessboard, saved_piece_loop, saved_move_loop)
+        if stop is not None and stop.is_set():
+            return None
+        if score >= probcut_beta:
+            search_stats['probcut_cuts'] += 1
+            # And by depth, without formatting a key per cut.
+            search_stats['probcut_cuts', depth] += 1
+            return move_from_to
+    return None
+
+
+def quiescence(chessboard, alpha, beta, stop=None, time_manager=None):
+    """Search captures which do not lose material by static exchange
+    evaluation until the position is quiet, and return the score. The
+    side to move may stand pat on the static evaluation.
+    """
+    search_stats['nodes'] += 1
+    search_stats['qnodes'] += 1
+    if time_manager is not None \
+            and not search_stats['nodes'] % time_manager.POLL_INTERVAL:
+        time_manager.poll(search_stats['nodes'])
+    if stop is not None and stop.is_set():
+        return alpha
+    stand_pat = evaluate_position(chessboard)
+    if stand_pat >= beta:
+        return beta
+    alpha = max(alpha, stand_pat)
+
+    if chessboard.last_move_piece.color == 'white':
+        friendly_king = chessboard.black_king
+        opponent_king = chessboard.white_king
+        pieces_to_move = chessboard.black_pieces
+    else:
+        friendly_king = chessboard.white_king
+        opponent_king = chessboard.black_king
+        pieces_to_move = chessboard.white_pieces
+    moves = [item for item in generate_moves(chessboard, pieces_to_move,
+                                             friendly_king)
+             if isinstance(item[1], int)
+             and chessboard.squares[item[1]] != ' '
+             and static_exchange_evaluation(chessboard, item[0],
+                                            item[1]) >= 0]
+    order_moves(chessboard, moves)
+    for piece, move, piece_moves, en_passant_move in moves:
+        saved_piece_loop, saved_move_loop = make_move(
+            chessboard, piece, move, piece_moves, en_passant_move,
+            pieces_to_move)
+        if chessboard.is_square_attacked(friendly_king.square,
+                                         opponent_king.color):
+            undo_move(chessboard, saved_piece_loop, saved_move_loop)
+            continue
+        if friendly_king.color == 'white':
+            chessboard.update_black_controlled_squares()
+        else:
+            chessboard.update_white_controlled_squares()
+        score = -1 * quiescence(chessboard, -1 * beta, -1 * alpha, stop,
+                                time_manager)
+        undo_move(chessboard, saved_piece_loop, saved_move_loop)
+        if score >= beta:
+            return beta
+        alpha = max(alpha, score)
+    return alpha
+
+
+def static_exchange_evaluation(chessboard, piece, target_square):
+    """Return the material won in centipawns by capturing on
+    target_square with piece, when both sides keep recapturing with their
+    least valuable attacker and may stop at any point.
+    """
+    all_squares = list(chessboard.squares)
+    gains = [piece_values[all_squares[target_square].name[0]]]
+    attacker = piece
+    color = piece.color
+    while True:
+        all_squares[attacker.square] = ' '
+        all_squares[target_square] = attacker
+        if color == 'white':
+            color = 'black'
+        else:
+            color = 'white'
+        attackers = chessboard.find_attackers(target_square, color,
+                                              all_squares)
+        if not attackers:
+            break
+        if isinstance(attacker, pieces.King):
+            # The king cannot capture onto an attacked square.
+            if len(gains) > 1:
+                gains.pop()
+            break
+        gains.append(piece_values[attacker.name[0]] - gains[-1])
+        attacker = min(attackers,
+                       key=lambda item: piece_values[item.name[0]])
+    # Either side may decline to recapture.
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = -1 * max(-1 * gains[i - 1], gains[i])
+    return gains[0]
+
+
+def late_move_reduction(depth, move_number, is_pv_node):
+    """Return the number of plies to reduce a late quiet move by. At
+    least one ply of search is always left.
+    """
+    reduction = LMR_TABLE[min(depth, MAX_DEPTH)][min(move_number, 63)]
+    if is_pv_node:
+        reduction -= 1
+    reduction = max(0, min(reduction, depth - 2))
+    if reduction:
+        search_stats['lmr_reductions'] += 1
+    return reduction
+
+
+def tt_store_depth(depth, draws_before):
+    """Return the depth to store a search result with. A result which
+    used a repetition or fifty-move draw is only valid along this path,
+    so it is stored at depth -1, where it still orders moves but never
+    cuts.
+    """
+    if search_stats['repetition_draws'] + search_stats['fifty_move_draws'] \
+            > draws_before:
+        search_stats['draw_tainted_stores'] += 1
+        return -1
+    return depth
+
+
+def score_from_transposition(score, ply):
+    """Return a transposition table score relative to the root, for a
+    node at the given ply.
+    """
+    if score >= MATE_BOUND:
+        return score - ply
+    elif score <= -1 * MATE_BOUND:
+        return score + ply
+    return score
+
+
+def format_uci_score(score):
+    """Return the UCI "score" value, "cp <x>" or "mate <moves>". Moves
+    are negative when the side to move is getting mated.
+    """
+    if score >= MATE_BOUND:
+        return f'mate {(MATE_SCORE - score + 1) // 2}'
+    elif score <= -1 * MATE_BOUND:
+        return f'mate {-1 * ((MATE_SCORE + score) // 2)}'
+    return f'cp {int(score)}'
+
+
+def has_non_pawn_material(pieces_to_move):
+    """Return True if any piece besides pawns and the king is present."""
+    for piece in pieces_to_move:
+        if not isinstance(piece, (pieces.Pawn, pieces.King)):
+            return True
+    return False
+
+
+def store_transposition(zobrist_hash, best_move, score, node, depth,
+                        ply=0):
+    """Add a search result to the transposition table.
+
+    Node types are the bound of the score: 'pvnode' is exact, 'cutnode'
+    is a lower bound (failed high) and 'allnode' is an upper bound (failed
+    low). Mate scores are stored relative to the node rather than the
+    root, since the node can be reached at other plies.
+    """
+    if score >= MATE_BOUND:
+        score += ply
+    elif score <= -1 * MATE_BOUND:
+        score -= ply
+    transposition[zobrist_hash] = (best_move, score, node, depth)
+    # Add age to transposition table?
+    # Cache invalidation based on insertion order.
+    # Ideal hash table load is 0.6 to 0.75.
+    # Dicts refuse new entries past 1 million, use a growth
+    # factor of 3, and a starting size of 8.
+    # 8 * 3^10 = 472392
+    # Delete first 200,000 key/value pairs added to the
+    # transposition table.
+    # A parallel.SharedTranspositionTable has a fixed size instead.
+    if isinstance(transposition, dict) \
+            and len(transposition) > TT_MAX_ENTRIES:
+        # Iterator would be nice but gives RuntimeError. Copied first and
+        # popped since search threads may store at the same time.
+        keys = list(transposition.copy())[:200_000]
+        for key in keys:
+            transposition.pop(key, None)
+
+
+def generate_moves(chessboard, pieces_to_move, friendly_king):
+    """Return a list of (piece, move, piece_moves, en_passant_move) for
+    each pseudo-legal move of the side to move.
+
+    The last two items are the piece's move state when the list was made.
+    make_move() restores them, since deeper nodes overwrite them.
+    """
+    if friendly_king.color == 'white':
+        chessboard.update_black_controlled_squares()
+    else:
+        chessboard.update_white_controlled_squares()
+    for piece in pieces_to_move:
+        if piece is not friendly_king:
+            piece.update_moves(chessboard)
+    # Kings last, they may limit other moves when in check.
+    friendly_king.update_moves(chessboard)
+    replicate_promotion_moves(chessboard)
+    moves = []
+    for piece in pieces_to_move:
+        en_passant_move = getattr(piece, 'en_passant_move', None)
+        for move in piece.moves:
+            moves.append((piece, move, piece.moves, en_passant_move))
+    return moves
+
+
+def order_moves(chessboard, moves, tt_move=None):
+    """Sort moves in place. The transposition table move is first, then
+    captures by most valuable victim/least valuable attacker (MVV-LVA),
+    then queen promotions, then other moves in generation order.
+    """
+    squares = chessboard.squares
+
+    def move_order_key(item):
+        piece, move = item[0], item[1]
+        if isinstance(move, tuple):
+            # Underpromotion.
+            return 0
+        if (piece.square, move) == tt_move:
+            return 100_000
+        victim = squares[move]
+        if victim != ' ':
+            return 10 * piece_values[victim.name[0]] \
+                - piece_values[piece.name[0]] // 100
+        elif isinstance(piece, pieces.Pawn) \
+                and (move < 8 or move > 55):
+            return piece_values['q']
+        return 0
+
+    moves.sort(key=move_order_key, reverse=True)
+
+
+def make_move(chessboard, piece, move, piece_moves, en_passant_move,
+              pieces_to_move):
+    """Make a move from generate_moves(). Return the saved states for
+    undo_move().
+    """
+    piece.moves = piece_moves
+    if isinstance(piece, pieces.Pawn):
+        piece.en_passant_move = en_passant_move
+    saved_piece_loop = save_state_per_piece(chessboard, piece,
+                                            pieces_to_move.index(piece),
+                                            pieces_to_move)
+    saved_move_loop = save_state_per_move(chessboard, move, piece)
+    piece.move_piece(chessboard, move)
+    return saved_piece_loop, saved_move_loop
+
+
 def save_state_per_piece(chessboard, piece, i, pieces_to_move):
     """Store once per Perft piece loop."""
     prev_move_piece = chessboard.last_move_piece
@@ -479,10 +1936,14 @@ def save_state_per_piece(chessboard, piece, i, pieces_to_move):
 
 
 def save_state_per_move(chessboard, move, piece):
-    """Store once per Perft move loop."""
+    """Store once per Perft move loop. Also push the position onto the
+    board's hash history, which undo_move() pops.
+    """
     if isinstance(move, tuple):
         move, _ = move
     prev_occupant = chessboard.squares[move]
+    halfmove_clock = chessboard.push_history(
+        prev_occupant != ' ' or isinstance(piece, pieces.Pawn))
     prev_occupant_ind = None
     try:
         if prev_occupant.color == 'white':
@@ -506,7 +1967,8 @@ def save_state_per_move(chessboard, move, piece):
     en_passant_hash = chessboard.ep_hash_to_undo
 
     return prev_occupant, prev_occupant_ind, ep_captured_piece_ind, \
-        zobrist_hash, en_passant_hash
+        zobrist_hash, en_passant_hash, halfmove_clock, \
+        chessboard.material_key
 
 
 def replicate_promotion_moves(chessboard):
@@ -533,7 +1995,7 @@ def undo_move(chessboard, saved_piece_loop, saved_move_loop):
         switch_has_moved_to_False, piece, i, pieces_to_move = saved_piece_loop
 
     prev_occupant, prev_occupant_ind, ep_captured_piece_ind, zobrist_hash,\
-        en_passant_hash = saved_move_loop
+        en_passant_hash, halfmove_clock, material_key = saved_move_loop
 
     if switch_has_moved_to_False:
         piece.has_moved = False
@@ -587,9 +2049,7 @@ def undo_move(chessboard, saved_piece_loop, saved_move_loop):
             pieces_to_move.remove(chessboard.last_move_piece)
             removed_piece = chessboard.last_move_piece
             assert removed_piece.color == piece.color
-            logging.debug(f"Undo: removing {removed_piece} from piece list")
             pieces_to_move.insert(i, piece)
-            logging.debug(f"Undo: adding {piece} to piece list")
             assert piece is not removed_piece
             assert len_before_changes == len(pieces_to_move)
     except IndexError:
@@ -610,15 +2070,106 @@ def undo_move(chessboard, saved_piece_loop, saved_move_loop):
     # Undo hashing.
     chessboard.zobrist_hash = zobrist_hash
     chessboard.ep_hash_to_undo = en_passant_hash
+    chessboard.pop_history(halfmove_clock)
+    chessboard.material_key = material_key
 
     chessboard.last_move_piece = prev_move_piece
     chessboard.last_move_from_to = prev_move_from_to
 
 
+def divide(chessboard, depth):
+    """DFS through move tree and print subtree node counts, to find
+    which move's subtree a perft() mismatch is in.
+    """
+    if chessboard.last_move_piece.color == 'white':
+        friendly_king = chessboard.black_king
+        pieces_to_move = chessboard.black_pieces
+    else:
+        friendly_king = chessboard.white_king
+        pieces_to_move = chessboard.white_pieces
+
+    divided = Counter()
+    nodes = 0
+    for chessboard in generate_move_tree(chessboard, pieces_to_move):
+        if friendly_king.color == 'white':
+            chessboard.update_black_controlled_squares()
+        else:
+            chessboard.update_white_controlled_squares()
+        if friendly_king.check_if_in_check(
+                chessboard.white_controlled_squares,
+                chessboard.black_controlled_squares):
+            friendly_king.in_check = False
+            continue
+        else:
+            nodes = perft(chessboard, depth - 1)
+
+        piece_symbol = ''
+        try:
+            # Last move was a pawn promotion.
+            if chessboard.last_move_piece.name[1] == 'p':
+                move = chessboard.last_move_from_to[1]
+                piece_symbol = chessboard.last_move_piece.name[0].lower()
+        except IndexError:
+            move = chessboard.last_move_from_to[1]
+        prev_square = chessboard.last_move_from_to[0]
+        piece_name = chessboard.last_move_piece.name[0]
+        move = ' '.join([piece_name,
+                         board.Board.int_to_alg_notation[prev_square],
+                         board.Board.int_to_alg_notation[move],
+                         piece_symbol, ':'])
+        divided[move] += nodes
+    print('\n')
+    for k, v in divided.items():
+        print(k, v)
+    print('Total:', sum(divided.values()))
+
+
+def perft(chessboard, depth):
+    """DFS through move tree and return the node count, for checking
+    move generation against known counts.
+    """
+    if chessboard.last_move_piece.color == 'white':
+        friendly_king = chessboard.black_king
+        pieces_to_move = chessboard.black_pieces
+    else:
+        friendly_king = chessboard.white_king
+        pieces_to_move = chessboard.white_pieces
+
+    nodes = 0
+    if depth == 1:
+        chessboard.update_white_controlled_squares()
+        chessboard.update_black_controlled_squares()
+        chessboard.white_king.update_moves(chessboard)
+        if chessboard.last_move_piece.color == 'white':
+            chessboard.remove_illegal_moves_for_pinned_pieces('black')
+        else:
+            chessboard.remove_illegal_moves_for_pinned_pieces('white')
+        replicate_promotion_moves(chessboard)
+        n_moves = sum([len(piece.moves) for piece in pieces_to_move])
+        return n_moves
+    # For divide(depth=1)
+    elif depth == 0:
+        return 1
+
+    for chessboard in generate_move_tree(chessboard, pieces_to_move):
+        if friendly_king.color == 'white':
+            chessboard.update_black_controlled_squares()
+        else:
+            chessboard.update_white_controlled_squares()
+        if friendly_king.check_if_in_check(
+                chessboard.white_controlled_squares,
+                chessboard.black_controlled_squares):
+            friendly_king.in_check = False
+        else:
+            nodes += perft(chessboard, depth - 1)
+    return nodes
+
+
 def uci(command: str, stop: threading.Event, quit: threading.Event,
-        chessboard):
+        chessboard, search_worker=None):
     """Interact with the engine using the Universal Chess Interface
-    (UCI).
+    (UCI). "go" searches on a second thread, or in the SearchWorker if one
+    is given.
     """
     # TODO: Complete UCI
     engine_name = 'Unnamed Engine 0.x'
@@ -631,13 +2182,25 @@ def uci(command: str, stop: threading.Event, quit: threading.Event,
         if command[0] == 'uci':
             print('id name', engine_name)
             print('id author j1642')
+            print('option name Threads type spin default 1 min 1 max',
+                  UCI_MAX_THREADS)
+            print('option name ParallelMode type combo default lazysmp',
+                  *[f'var {mode}' for mode in PARALLEL_MODES])
+            print('option name Ponder type check default false')
+            print('option name MultiPV type spin default 1 min 1 max',
+                  UCI_MAX_MULTIPV)
             print('uciok')
             return
         elif command[0] == 'isready':
             print('readyok')
             return
         elif command[0] == 'ucinewgame':
-            print('readyok')
+            # Positions of the last game are not worth keeping.
+            uci_position['chessboard'] = None
+            if search_worker is not None:
+                search_worker.new_game()
+            else:
+                transposition.clear()
             return
         elif command[0] == 'd':
             print('\n', chessboard, sep='')
@@ -645,135 +2208,569 @@ def uci(command: str, stop: threading.Event, quit: threading.Event,
         elif command[0] == 'register':
             # Not planned.
             return
-        elif command[0] == 'ucinewgame':
-            # Not planned.
+        elif command[0] == 'position':
             return
-        else:
-            if command[0] in ['position', 'go']:
-                return
-            else:
-                print('Unknown command.')
-    if command[0] == 'position':
-        if command[1] == 'fen':
-            fen = None
-            # fen = command[3:...]
-            # TODO: utils cannot handle full FEN string
-            chessboard = chess_utilities.import_fen_to_board(fen)
-        elif command[1] == 'startpos':
-            chessboard.initialize_pieces()
-        elif any([chessboard.white_king is None,
-                 chessboard.black_king is None,
-                 len(chessboard.white_pieces + chessboard.black_pieces) < 2]):
+        elif command[0] not in ('go', 'bench'):
+            # "go" and "bench" without arguments use their defaults.
+            print('Unknown command.')
             return
-        if 'moves' in command:
-            moves_ind = command.index('moves')
-            for move in command[moves_ind + 1:]:
-                move = move.lower()
-                if not all([move[0].isalpha(), move[2].isalpha(),
-                            move[1].isdigit(), move[3].isdigit,
-                            len(move) == 4]):
-                    return
-                square_from = board.Board.ALGEBRAIC_NOTATION[move[:2]]
-                square_to = board.Board.ALGEBRAIC_NOTATION[move[2:]]
-                moving_piece = chessboard.squares[square_from]
-                if moving_piece.color == chessboard.last_move_piece.color:
-                    return
-                if moving_piece == chessboard.white_king:
-                    chessboard.update_black_controlled_squares()
-                    chessboard.white_king.update_moves(chessboard)
-                elif moving_piece == chessboard.black_king:
-                    chessboard.update_white_controlled_squares()
-                    chessboard.black_king.update_moves(chessboard)
-                else:
-                    moving_piece.update_moves(chessboard)
-                if square_to not in moving_piece.moves:
-                    return
-                else:
-                    moving_piece.move_piece(chessboard, square_to)
+    if command[0] == 'position':
+        apply_uci_position(chessboard, command)
 
+    elif command[0] == 'setoption':
+        # setoption name <id> value <x>
+        if len(command) != 5 or command[1] != 'name' \
+                or command[3] != 'value':
+            print('Unknown command.')
+        elif command[2] in ('Threads', 'MultiPV'):
+            try:
+                value = int(command[4])
+            except ValueError:
+                print('Unknown command.')
+                return
+            if command[2] == 'Threads':
+                uci_options['Threads'] = max(1, min(value, UCI_MAX_THREADS))
+            else:
+                uci_options['MultiPV'] = max(1, min(value, UCI_MAX_MULTIPV))
+        elif command[2] == 'ParallelMode' and command[4] in PARALLEL_MODES:
+            uci_options['ParallelMode'] = command[4]
+        elif command[2] == 'Ponder':
+            # The GUI decides when to send "go ponder".
+            pass
+        else:
+            print('Unknown option.')
     elif command[0] == 'go':
-        # TODO: info stdout, time commands.
         searchmoves = None
         if 'searchmoves' in command:
             # Only look at subtrees of given moves.
             searchmoves = []
             searchmoves_ind = command.index('searchmoves')
             for move in command[searchmoves_ind + 1:]:
-                move = move.lower()
-                if not all([move[0].isalpha(), move[2].isalpha(),
-                            move[1].isdigit(), move[3].isdigit,
-                            len(move) == 4]):
-                    return
-                square_from = board.Board.ALGEBRAIC_NOTATION[move[:2]]
-                square_to = board.Board.ALGEBRAIC_NOTATION[move[2:]]
-                moving_piece = chessboard.squares[square_from]
-                if moving_piece.color == chessboard.last_move_piece.color:
+                parsed_move = parse_uci_move(chessboard, move)
+                if parsed_move is None:
                     return
-                if moving_piece == chessboard.white_king:
-                    chessboard.update_black_controlled_squares()
-                    chessboard.white_king.update_moves(chessboard)
-                elif moving_piece == chessboard.black_king:
-                    chessboard.update_white_controlled_squares()
-                    chessboard.black_king.update_moves(chessboard)
-                else:
-                    moving_piece.update_moves(chessboard)
-                if square_to not in moving_piece.moves:
-                    return
-                searchmoves.append((moving_piece, square_to))
+                searchmoves.append(parsed_move[:2])
 
-        depth = float('inf')
-        if command[1] == 'depth':
-            try:
-                if command[2].isdigit():
-                    # TODO: print "info depth 1 seldepth 0", ...
-                    depth = int(command[2])
-                else:
-                    print('Unknown command')
-                    return
-            except IndexError:
-                return
+        try:
+            limits = parse_go_command(command)
+        except ValueError:
+            print('Unknown command')
+            return
+        if search_worker is not None:
+            search_worker.go(chessboard, limits, searchmoves)
+            return
+
+        def print_bestmove(stop, quit):
+            """Second thread, may be interrupted by Events."""
+            run_search(chessboard, limits, searchmoves, stop, quit)
+            stop.clear()
 
-            def print_bestmove(depth, stop, quit):
-                """Second thread, may be interrupted by Events."""
-                bestmove = negamax(chessboard, depth,
-                                   stop=stop, quit=quit,
-                                   searchmoves=searchmoves)[1]
-                bestmove = [board.Board.int_to_alg_notation[i]
-                            for i in bestmove]
-                print('bestmove', ''.join(bestmove))
-                stop.clear()
-
-            t2 = threading.Thread(target=print_bestmove,
-                                  args=(depth, stop, quit))
-            t2.start()
+        t2 = threading.Thread(target=print_bestmove, args=(stop, quit))
+        t2.start()
+    elif command[0] == 'bench':
+        # bench [depth]
+        try:
+            depth = int(command[1]) if len(command) > 1 else 4
+        except ValueError:
+            print('Unknown command.')
+            return
+        if search_worker is not None:
+            search_worker.bench(depth)
+        else:
+            print(format_bench(depth, bench(depth)))
     elif len(command) > 1:
         print('Unknown command.')
 
 
-def get_uci_input(stop: threading.Event, quit: threading.Event, chessboard):
-    """Control threading.Events, pass on other inputs."""
-    command = input().strip()
-    if command == 'quit':
-        quit.set()
-        sys.exit(0)
-    elif command == 'stop':
-        stop.set()
+def run_search(chessboard, limits, searchmoves=None, stop=None, quit=None,
+               output=print, ponderhit=None):
+    """Search for a UCI "go" command with limits from parse_go_command().
+    Pass an info line for each completed iteration, then the bestmove
+    line, to output. The bestmove line names the expected reply from the
+    principal variation of the last info line to ponder on, when there is
+    one.
+    """
+    if chessboard.last_move_piece.color == 'white':
+        color = 'black'
+    else:
+        color = 'white'
+    time_manager = TimeManager(color, stop=stop, ponderhit=ponderhit,
+                               output=output, **limits)
+    depth = time_manager.max_depth or MAX_DEPTH
+    # Principal variation of the last info line, for the ponder move. The
+    # transposition table may no longer hold it once a stopped iteration
+    # has replaced entries.
+    last_pv = []
+    # Principal variation of the best move, when the search returns one.
+    pv = None
+
+    def send_info(depth, score, best_move):
+        last_pv[:] = principal_variation(chessboard, best_move)
+        output(format_uci_info(depth, score, last_pv))
+
+    def send_multipv_info(depth, lines):
+        for k, (score, move) in enumerate(lines, start=1):
+            pv = principal_variation(chessboard, move)
+            if k == 1:
+                last_pv[:] = pv
+            output(format_uci_info(depth, score, pv, multipv=k))
+
+    if uci_options['MultiPV'] > 1:
+        lines = multipv_search(chessboard, depth, uci_options['MultiPV'],
+                               time_manager=time_manager,
+                               info=send_multipv_info,
+                               stop=time_manager.stop, quit=quit,
+                               searchmoves=searchmoves)
+        bestmove = lines[0][1] if lines else None
+    elif uci_options['Threads'] > 1 and searchmoves is None:
+        import parallel
+        bestmove, pv = parallel.search(
+            chessboard, depth, uci_options['Threads'],
+            mode=uci_options['ParallelMode'], time_manager=time_manager,
+            info=send_info, stop=time_manager.stop)[1:]
+    else:
+        bestmove = iterative_deepening(chessboard, depth,
+                                       time_manager=time_manager,
+                                       info=send_info, stop=time_manager.stop,
+                                       quit=quit, searchmoves=searchmoves)[1]
+    time_manager.wait_for_ponderhit()
+    if bestmove is None:
+        output('bestmove 0000')
+        return
+    if last_pv[:1] == [bestmove]:
+        line = last_pv
+    elif pv is not None:
+        # A parallel search may return a helper's best move.
+        line = pv
     else:
-        uci(command, stop, quit, chessboard)
+        line = principal_variation(chessboard, bestmove)
+    response = 'bestmove ' + ''.join(board.Board.int_to_alg_notation[i]
+                                     for i in bestmove)
+    if len(line) > 1:
+        response += ' ponder ' + ''.join(board.Board.int_to_alg_notation[i]
+                                         for i in line[1])
+    output(response)
+
+
+class SearchWorker:
+    """Searches in a long-lived process, so the UCI front end never waits
+    on the search for the GIL.
+
+    Positions and limits go to the process over a pipe, and its info and
+    bestmove lines come back over the same pipe to a reader thread, which
+    prints them. The stop Event is shared with the process and polled by
+    negamax() at every node. The time from stop() to the bestmove line is
+    kept in stop_latencies, in seconds.
+
+    A "go ponder" search is a hit if ponderhit() is called before its
+    bestmove, and a miss otherwise. ponder_stats counts the ponder
+    searches, hits and misses, and the seconds searched before hits
+    ("saved_time"). They are sent as an info string before the bestmove
+    of each ponder search.
+
+    With a profile path, the process runs its searches and benchmarks
+    under a profiling.Profiler, which writes profile.pstats and
+    profile.collapsed after each one and prints its report to standard
+    error on quit.
+
+    Methods
+    -------
+        __init__()
+        __repr__()
+        go()
+        ponderhit()
+        stop()
+        wait()
+        new_game()
+        bench()
+        quit()
+
+    """
+
+    def __init__(self, profile=None):
+        self.connection, worker_connection = multiprocessing.Pipe()
+        self.stop_event = multiprocessing.Event()
+        self.ponderhit_event = multiprocessing.Event()
+        self.searching = threading.Event()
+        self.stop_time = None
+        self.stop_latencies = []
+        self.pondering = False
+        self.ponder_start = None
+        self.ponder_stats = Counter()
+        # Not a daemon, so parallel searches may start their own workers.
+        self.process = multiprocessing.Process(
+            target=search_worker_loop,
+            args=(worker_connection, self.stop_event, self.ponderhit_event,
+                  profile))
+        self.process.start()
+        self.reader = threading.Thread(target=self._print_output,
+                                       daemon=True)
+        self.reader.start()
+        atexit.register(self.quit)
+
+    def __repr__(self):
+        return f'SearchWorker(pid={self.process.pid}, ' \
+            f'searching={self.searching.is_set()})'
+
+    def go(self, chessboard, limits, searchmoves=None):
+        """Start searching a position, unless a search is running."""
+        if self.searching.is_set():
+            return
+        self.stop_event.clear()
+        self.ponderhit_event.clear()
+        self.stop_time = None
+        self.pondering = limits.get('ponder', False)
+        if self.pondering:
+            self.ponder_start = time.perf_counter()
+            self.ponder_stats['searches'] += 1
+        self.searching.set()
+        self.connection.send(('go', chessboard, limits, searchmoves,
+                              dict(uci_options)))
+
+    def ponderhit(self):
+        """Tell the ponder search that the opponent played the expected
+        move. It goes on with its time limits, on our clock.
+        """
+        if self.ponder_start is not None:
+            self.ponder_stats['hits'] += 1
+            self.ponder_stats['saved_time'] += (time.perf_counter()
+                                                - self.ponder_start)
+            self.ponder_start = None
+        self.ponderhit_event.set()
+
+    def stop(self):
+        """Stop the search. Its bestmove line follows shortly."""
+        if self.searching.is_set() and self.stop_time is None:
+            self.stop_time = time.perf_counter()
+        self.stop_event.set()
+
+    def wait(self, timeout=None):
+        """Wait for the search's bestmove line. Return False on timeout."""
+        start = time.time()
+        while self.searching.is_set():
+            if timeout is not None and time.time() - start > timeout:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def new_game(self):
+        """Clear the process's transposition table. It is otherwise kept
+        between searches of the same game.
+        """
+        self.connection.send(('ucinewgame',))
+
+    def bench(self, depth):
+        """Run the benchmark in the process and print its result as an
+        info string.
+        """
+        self.connection.send(('bench', depth))
+
+    def quit(self):
+        """Stop any search, print its bestmove, and end the process."""
+        if not self.process.is_alive():
+            return
+        self.stop()
+        self.wait(timeout=5)
+        self.connection.send(('quit',))
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+    def _print_output(self):
+        """Reader thread, print each line the process sends."""
+        while True:
+            try:
+                line = self.connection.recv()
+            except (EOFError, OSError):
+                return
+            if line.startswith('bestmove'):
+                if self.stop_time is not None:
+                    self.stop_latencies.append(time.perf_counter()
+                                               - self.stop_time)
+                if self.pondering:
+                    if self.ponder_start is not None:
+                        self.ponder_stats['misses'] += 1
+                        self.ponder_start = None
+                    stats = self.ponder_stats
+                    print(f"info string ponder hits {stats['hits']} misses "
+                          f"{stats['misses']} saved "
+                          f"{stats['saved_time']:.2f}s", flush=True)
+                print(line, flush=True)
+                self.searching.clear()
+            else:
+                print(line, flush=True)
+
+
+def search_worker_loop(connection, stop, ponderhit=None, profile=None):
+    """Run by the SearchWorker process. Search each position received over
+    the connection and send back its output lines, until "quit".
+    """
+    profiler = profiling.Profiler(profile) if profile is not None else None
+
+    def run(function, *args, **kwargs):
+        """Call function, under the profiler if there is one."""
+        if profiler is None:
+            return function(*args, **kwargs)
+        result = profiler.run(function, *args, **kwargs)
+        profiler.dump()
+        return result
+
+    try:
+        while True:
+            message = connection.recv()
+            if message[0] == 'quit':
+                if profiler is not None:
+                    profiler.report(stream=sys.stderr)
+                return
+            elif message[0] == 'ucinewgame':
+                transposition.clear()
+                continue
+            elif message[0] == 'bench':
+                connection.send(format_bench(message[1], run(bench,
+                                                             message[1])))
+                continue
+            _, chessboard, limits, searchmoves, options = message
+            uci_options.update(options)
+            run(run_search, chessboard, limits, searchmoves, stop,
+                output=connection.send, ponderhit=ponderhit)
+    finally:
+        # The process exits without running atexit handlers.
+        if 'parallel' in sys.modules:
+            sys.modules['parallel'].close_shared_table()
+
+
+# Commands that change what the next search sees. A search still running
+# when one arrives is stopped, and its bestmove printed, first.
+UCI_SEARCH_COMMANDS = ('position', 'go', 'setoption', 'ucinewgame')
+
+
+async def stdin_reader():
+    """Return an asyncio.StreamReader fed from standard input.
+
+    A pipe or socket is watched by the event loop. Anything else,
+    including a terminal, a file, or a replaced or closed sys.stdin, is
+    read with input() on a thread.
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    try:
+        mode = os.fstat(sys.stdin.fileno()).st_mode
+    except (AttributeError, OSError, ValueError):
+        # No file descriptor, like a test runner's captured stdin.
+        mode = None
+    if mode is not None and (stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode)):
+        try:
+            # A GUI's pipe, watched by the event loop.
+            await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+            return reader
+        except (OSError, ValueError):
+            pass
+
+    def feed():
+        """Read lines on a thread, until "quit" or end of input."""
+        while True:
+            try:
+                line = input()
+            except (EOFError, OSError, ValueError):
+                loop.call_soon_threadsafe(reader.feed_eof)
+                return
+            loop.call_soon_threadsafe(reader.feed_data,
+                                      (line + '\n').encode())
+            if line.strip() == 'quit':
+                return
+
+    threading.Thread(target=feed, daemon=True).start()
+    return reader
+
 
+async def uci_loop(chessboard, search_worker, reader=None):
+    """Read UCI commands from a stream and answer each as it arrives.
 
-def main():
-    """CLI engine."""
-    quit = threading.Event()
-    stop = threading.Event()
+    The search runs in the SearchWorker, and waits for its bestmove line
+    run in the event loop's executor, so "isready", "stop" and
+    "ponderhit" are handled while a search is running. Output is flushed
+    after every command. End of input is read as "quit".
+    """
+    loop = asyncio.get_running_loop()
+    if reader is None:
+        reader = await stdin_reader()
+    while True:
+        line = await reader.readline()
+        command = line.decode().strip() if line else 'quit'
+        words = command.split()
+        if command == 'quit':
+            await loop.run_in_executor(None, search_worker.quit)
+            return
+        elif command == 'stop':
+            search_worker.stop()
+        elif command == 'ponderhit':
+            search_worker.ponderhit()
+        elif words and words[0] in UCI_SEARCH_COMMANDS:
+            if search_worker.searching.is_set():
+                search_worker.stop()
+                await loop.run_in_executor(None, search_worker.wait)
+            uci(command, None, None, chessboard, search_worker)
+        elif words:
+            uci(command, None, None, chessboard, search_worker)
+        sys.stdout.flush()
+
+
+def uci_latency_benchmark(rounds=10, movetime=100):
+    """Time the engine's answers to a scripted GUI, which runs engine.py
+    over pipes. Return a dict of command: list of latencies in seconds.
+
+    Measured per round: "uci" to "uciok", "isready" to "readyok" with and
+    without a search running, "go movetime" to "bestmove" (at most
+    movetime when on time), and "stop" to "bestmove".
+    """
+    engine_process = subprocess.Popen(
+        [sys.executable, __file__], stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE, text=True, bufsize=1)
+    latencies = {'uci': [], 'isready': [], 'isready searching': [],
+                 'go movetime': [], 'stop': []}
+
+    def send(command, response=None):
+        """Send a command and return the time to a line starting with
+        response.
+        """
+        start = time.perf_counter()
+        engine_process.stdin.write(command + '\n')
+        engine_process.stdin.flush()
+        if response is None:
+            return None
+        while not engine_process.stdout.readline().startswith(response):
+            pass
+        return time.perf_counter() - start
+
+    try:
+        # Engine start up is not timed.
+        send('isready', 'readyok')
+        for _ in range(rounds):
+            latencies['uci'].append(send('uci', 'uciok'))
+            latencies['isready'].append(send('isready', 'readyok'))
+            send('position startpos')
+            latencies['go movetime'].append(
+                send(f'go movetime {movetime}', 'bestmove'))
+            send('go infinite')
+            time.sleep(movetime / 1000)
+            latencies['isready searching'].append(send('isready', 'readyok'))
+            latencies['stop'].append(send('stop', 'bestmove'))
+        send('quit')
+        engine_process.wait(timeout=10)
+    finally:
+        if engine_process.poll() is None:
+            engine_process.kill()
+    return latencies
+
+
+def bench(depth=4, fens=BENCH_FENS):
+    """Search each position to a depth with iterative_deepening(),
+    clearing the transposition table between positions. Return a dict of
+    the total nodes, seconds and nodes per second.
+    """
+    nodes = 0
+    start = time.time()
+    for fen in fens:
+        chessboard = chess_utilities.import_fen_to_board(fen,
+                                                         autopromote=True)
+        transposition.clear()
+        iterative_deepening(chessboard, depth, max_time=float('inf'))
+        nodes += search_stats['nodes']
+    seconds = time.time() - start
+    transposition.clear()
+    return {'nodes': nodes, 'seconds': seconds,
+            'nps': int(nodes / seconds) if seconds > 0 else 0}
+
+
+def format_bench(depth, result):
+    """Return a bench() result as a UCI info string."""
+    return f"info string bench depth {depth} nodes {result['nodes']} " \
+        f"time {int(result['seconds'] * 1000)} nps {result['nps']}"
+
+
+def pop_option(arguments, name):
+    """Remove "name value" from a list of command line arguments and
+    return the value, or None if name is not in the list.
+    """
+    if name not in arguments:
+        return None
+    index = arguments.index(name)
+    value = arguments[index + 1]
+    del arguments[index:index + 2]
+    return value
+
+
+def main(profile=None):
+    """CLI engine. Commands are read by an asyncio loop and searches run
+    in a SearchWorker process, so commands are answered as soon as they
+    are read. With a profile path, the SearchWorker profiles its searches.
+    """
     chessboard = board.Board()
-    while not quit.is_set():
-        get_uci_input(stop, quit, chessboard)
-        time.sleep(0.2)
+    search_worker = SearchWorker(profile)
+    asyncio.run(uci_loop(chessboard, search_worker))
+    sys.exit(0)
 
 
 if __name__ == '__main__':
-    print('Unnamed Engine 0.x')
-    # TODO: complete UCI
-    print('Incomplete UCI.')
-    main()
+    # Modules which import engine, like parallel, must share this module's
+    # globals rather than load a second copy.
+    sys.modules.setdefault('engine', sys.modules[__name__])
+    # --profile path runs the command, or the UCI engine's searches, under
+    # profiling.Profiler and writes path.pstats and path.collapsed.
+    arguments = sys.argv[1:]
+    profile_path = pop_option(arguments, '--profile')
+    if arguments[:1] == ['latency']:
+        rounds = int(arguments[1]) if len(arguments) > 1 else 10
+        for command, times in uci_latency_benchmark(rounds).items():
+            print(f'{command:<18} median '
+                  f'{statistics.median(times) * 1000:7.2f} ms  '
+                  f'max {max(times) * 1000:7.2f} ms')
+    elif arguments[:1] == ['bench']:
+        # python engine.py bench [depth] [--analytics report.json]
+        #     [--trace trace.bin [--trace-sample N]] [--profile path]
+        arguments = arguments[1:]
+        analytics_path = pop_option(arguments, '--analytics')
+        trace_path = pop_option(arguments, '--trace')
+        trace_sample = int(pop_option(arguments, '--trace-sample') or 1)
+        if analytics_path is not None:
+            start_search_analytics()
+        if trace_path is not None:
+            import search_trace
+            tracer = search_trace.Tracer(trace_path, sample=trace_sample,
+                                         search_module=sys.modules[__name__])
+            tracer.start()
+        bench_depth = int(arguments[0]) if arguments else 4
+        if profile_path is not None:
+            result = profiling.profile(bench, bench_depth, path=profile_path)
+        else:
+            result = bench(bench_depth)
+        print(f"nodes {result['nodes']} time {result['seconds']:.2f} s "
+              f"nps {result['nps']}")
+        if analytics_path is not None:
+            dump_search_analytics(analytics_path)
+            print(f'search analytics written to {analytics_path}')
+        if trace_path is not None:
+            tracer.stop()
+            print(f'{tracer.records} trace records written to {trace_path}')
+    elif arguments[:1] == ['perft']:
+        # python engine.py perft depth [fen] [--profile path]
+        perft_board = chess_utilities.import_fen_to_board(
+            ' '.join(arguments[2:]), autopromote=True) \
+            if len(arguments) > 2 else board.Board()
+        if len(arguments) <= 2:
+            perft_board.last_move_piece = pieces.Pawn('p', 'black', 100)
+            perft_board.initialize_pieces(autopromote=['white', 'black'])
+        start = time.time()
+        if profile_path is not None:
+            perft_nodes = profiling.profile(perft, perft_board,
+                                            int(arguments[1]),
+                                            path=profile_path)
+        else:
+            perft_nodes = perft(perft_board, int(arguments[1]))
+        print(f'nodes {perft_nodes} time {time.time() - start:.2f} s')
+    else:
+        print('Unnamed Engine 0.x')
+        # TODO: complete UCI
+        print('Incomplete UCI.')
+        main(profile_path)
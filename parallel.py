@@ -0,0 +1,817 @@
+"""Parallel searches over several processes, or threads without the GIL.
+
+Python threads do not search in parallel under the GIL, so each worker is
+a process, except on free-threaded builds. Lazy SMP workers search the
+same root position at slightly different depths and share a
+transposition table in shared memory. Root splitting divides the root
+moves between the workers of a process pool, which share the best score
+found so far. Young Brothers Wait splits deeper nodes the same way, once
+their first move has been searched. Threaded search is Lazy SMP over
+threads, each with its own board.
+
+Run this file to benchmark time to depth for 1 to 16 workers against the
+single process search.
+"""
+
+import atexit
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import copy
+import multiprocessing
+from multiprocessing import shared_memory
+import pickle
+import queue
+import sys
+import threading
+import time
+
+import chess_utilities
+import engine
+
+
+class SharedTranspositionTable:
+    """Fixed size transposition table in multiprocessing.shared_memory,
+    usable as engine.transposition.
+
+    Each slot is two 64-bit words, the Zobrist hash XOR the entry's data,
+    and the data. Writes are not locked. A slot torn by two processes
+    writing at once fails the XOR check on its next probe and reads as a
+    miss, as does a slot holding another position.
+
+    Methods
+    -------
+        __init__()
+        __repr__()
+        get()
+        __getitem__()
+        __setitem__()
+        __contains__()
+        __len__()
+        clear()
+        close()
+        unlink()
+
+    """
+
+    DEFAULT_SLOTS = 1 << 20
+    NODE_TYPES = ('pvnode', 'cutnode', 'allnode')
+    # Data word layout, low bits first: from square (6), to square (6),
+    # has move (1), node type (2), depth + 1 (8), score (32), valid (1).
+    SCORE_OFFSET = 1 << 31
+    SCORE_INFINITY = (1 << 32) - 1
+    VALID = 1 << 63
+
+    def __init__(self, slots=DEFAULT_SLOTS, name=None):
+        if slots & (slots - 1):
+            raise ValueError('slots must be a power of two')
+        self.slots = slots
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True,
+                                                  size=16 * slots)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.words = self.shm.buf.cast('Q')
+        self.stores = 0
+
+    def __repr__(self):
+        return f'SharedTranspositionTable(slots={self.slots}, ' \
+            f'name={self.name!r})'
+
+    def get(self, zobrist_hash, default=None):
+        """Return the (best_move, score, node, depth) entry for a hash, or
+        default if the slot holds another position or a torn write.
+        """
+        i = (zobrist_hash & (self.slots - 1)) << 1
+        check, data = self.words[i], self.words[i + 1]
+        if not data & self.VALID or check ^ data != zobrist_hash:
+            return default
+        if data >> 12 & 1:
+            best_move = (data & 63, data >> 6 & 63)
+        else:
+            best_move = None
+        node = self.NODE_TYPES[data >> 13 & 3]
+        depth = (data >> 15 & 255) - 1
+        score = data >> 23 & self.SCORE_INFINITY
+        if score == self.SCORE_INFINITY:
+            score = float('inf')
+        elif score == 0:
+            score = float('-inf')
+        else:
+            score -= self.SCORE_OFFSET
+        return best_move, score, node, depth
+
+    def __getitem__(self, zobrist_hash):
+        entry = self.get(zobrist_hash)
+        if entry is None:
+            raise KeyError(zobrist_hash)
+        return entry
+
+    def __setitem__(self, zobrist_hash, entry):
+        """Store an entry, replacing whatever is in its slot. Scores are
+        rounded to whole centipawns.
+        """
+        best_move, score, node, depth = entry
+        if score == float('inf'):
+            score = self.SCORE_INFINITY
+        elif score == float('-inf'):
+            score = 0
+        else:
+            score = int(round(score)) + self.SCORE_OFFSET
+        data = self.VALID | score << 23 | (depth + 1) << 15 \
+            | self.NODE_TYPES.index(node) << 13
+        if best_move is not None:
+            data |= 1 << 12 | best_move[1] << 6 | best_move[0]
+        i = (zobrist_hash & (self.slots - 1)) << 1
+        self.words[i] = zobrist_hash ^ data
+        self.words[i + 1] = data
+        self.stores += 1
+
+    def __contains__(self, zobrist_hash):
+        return self.get(zobrist_hash) is not None
+
+    def __len__(self):
+        """Return the number of stores by this process, at most the slot
+        count. Other processes' stores are not counted.
+        """
+        return min(self.stores, self.slots)
+
+    def clear(self):
+        """Empty every slot."""
+        self.shm.buf[:] = bytes(16 * self.slots)
+        self.stores = 0
+
+    def close(self):
+        """Detach this process from the shared memory."""
+        self.words.release()
+        self.shm.close()
+
+    def unlink(self):
+        """Free the shared memory once every process has closed it."""
+        self.shm.unlink()
+
+
+# Created by the first Lazy SMP search and kept between searches.
+shared_table = None
+# Nodes at least this deep on the main process's path are split points.
+YBWC_MIN_SPLIT_DEPTH = 3
+# Set in each pool worker by its initializer.
+_shared_alpha = None
+_shared_nodes = None
+_worker_stop = None
+_split_alphas = None
+_split_aborts = None
+
+
+def get_shared_table():
+    """Return the process's shared transposition table, creating it and
+    registering its cleanup on first use.
+    """
+    global shared_table
+    if shared_table is None:
+        shared_table = SharedTranspositionTable()
+        atexit.register(close_shared_table)
+    return shared_table
+
+
+def close_shared_table():
+    """Close and unlink the process's shared transposition table, if it
+    has one. A multiprocessing child process never runs atexit handlers,
+    so one which searched in parallel calls this before it exits.
+    """
+    global shared_table
+    if shared_table is not None:
+        shared_table.close()
+        shared_table.unlink()
+        shared_table = None
+
+
+def lazy_smp_search(chessboard, depth, threads, max_time=5,
+                    time_manager=None, info=None, stop=None):
+    """Search with the calling process and threads - 1 helper processes
+    sharing a transposition table. Return (score, best_move, pv) of the
+    deepest completed iteration, with the principal variation read from
+    the shared table.
+
+    The calling process runs engine.iterative_deepening() with the time
+    manager and info callback. Helpers search without limits until it
+    finishes, odd numbered helpers starting a ply deeper, and their
+    results only replace its own when they are deeper.
+    """
+    table = get_shared_table()
+    helper_stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    helpers = [multiprocessing.Process(
+        target=_lazy_smp_worker,
+        args=(chessboard, depth, worker_id, table.name, table.slots,
+              helper_stop, results),
+        daemon=True) for worker_id in range(1, threads)]
+    for helper in helpers:
+        helper.start()
+
+    completed = []
+
+    def record_iteration(partial_depth, score, best_move):
+        completed.append((partial_depth, 0, score, best_move))
+        if info is not None:
+            info(partial_depth, score, best_move)
+
+    saved_table = engine.transposition
+    engine.transposition = table
+    try:
+        try:
+            score, best_move = engine.iterative_deepening(
+                chessboard, depth, max_time=max_time,
+                time_manager=time_manager, info=record_iteration, stop=stop)
+        finally:
+            helper_stop.set()
+            helper_nodes = 0
+            while any(helper.is_alive() for helper in helpers) \
+                    or not results.empty():
+                try:
+                    worker_id, partial_depth, helper_score, helper_move, \
+                        nodes = results.get(timeout=0.01)
+                except queue.Empty:
+                    continue
+                if helper_move is None:
+                    helper_nodes += nodes
+                else:
+                    completed.append((partial_depth, -1 * worker_id,
+                                      helper_score, helper_move))
+            for helper in helpers:
+                helper.join()
+        engine.search_stats['helper_nodes'] += helper_nodes
+        if completed:
+            # Deepest first, then the calling process.
+            _, _, score, best_move = max(completed)
+        # A helper's move has its line in the shared table only.
+        pv = engine.principal_variation(chessboard, best_move)
+    finally:
+        engine.transposition = saved_table
+    return score, best_move, pv
+
+
+def _lazy_smp_worker(chessboard, depth, worker_id, table_name, slots,
+                     stop, results):
+    """Run a helper process for lazy_smp_search(). Put (worker_id, depth,
+    score, best_move, 0) on results after each completed iteration, and
+    (worker_id, 0, 0, None, nodes) when done.
+    """
+    table = SharedTranspositionTable(slots, name=table_name)
+    engine.transposition = table
+    engine.reset_search_stats()
+    try:
+        _helper_search(
+            chessboard, depth, worker_id, stop,
+            lambda partial_depth, score, best_move: results.put(
+                (worker_id, partial_depth, score, best_move, 0)))
+    finally:
+        results.put((worker_id, 0, 0, None, engine.search_stats['nodes']))
+        engine.transposition = {}
+        table.close()
+
+
+def _helper_search(chessboard, depth, worker_id, stop, report):
+    """Run iterative deepening for a Lazy SMP helper, odd numbered helpers
+    starting a ply deeper. Call report(depth, score, best_move) after each
+    completed iteration.
+    """
+    score = float('-inf')
+    for partial_depth in range(1 + worker_id % 2, depth + 1):
+        values = engine.aspiration_search(chessboard, partial_depth, score,
+                                          stop=stop)
+        if stop.is_set() or values[1] is None:
+            break
+        score, best_move = values
+        report(partial_depth, score, best_move)
+
+
+def gil_enabled():
+    """Return False only on a free-threaded build running without the
+    GIL.
+    """
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return is_gil_enabled is None or is_gil_enabled()
+
+
+class _ThreadLocalMapping(threading.local):
+    """Stands in for engine.search_stats or engine.search_analytics while
+    helper threads search. The thread which creates it uses mapping, and
+    every other thread its own new mapping from factory, also appended to
+    helper_mappings.
+    """
+
+    def __init__(self, owner, mapping, factory, helper_mappings):
+        if threading.get_ident() == owner:
+            self.mapping = mapping
+        else:
+            self.mapping = factory()
+            helper_mappings.append(self.mapping)
+
+    def __getitem__(self, key):
+        return self.mapping[key]
+
+    def __setitem__(self, key, value):
+        self.mapping[key] = value
+
+    def __getattr__(self, name):
+        return getattr(self.mapping, name)
+
+
+def threaded_search(chessboard, depth, threads, max_time=5,
+                    time_manager=None, info=None, stop=None):
+    """Lazy SMP over threads of this process. Return (score, best_move)
+    of the deepest completed iteration.
+
+    Each helper thread searches its own copy of the board, and all threads
+    share engine.transposition, whose entries are replaced whole. Helper
+    threads count in their own search_stats and search_analytics, so the
+    calling thread's counts are those of its own search, and their nodes
+    are added to its "helper_nodes" when they finish. With the GIL enabled
+    threads would only take turns, so the search falls back to one
+    thread. Otherwise as lazy_smp_search().
+    """
+    if gil_enabled():
+        threads = 1
+    helper_stop = threading.Event()
+    saved_stats = engine.search_stats
+    saved_analytics = engine.search_analytics
+    helper_stats = []
+    if threads > 1:
+        owner = threading.get_ident()
+        engine.search_stats = _ThreadLocalMapping(
+            owner, saved_stats, Counter, helper_stats)
+        if saved_analytics is not None:
+            # Recorded by helpers and dropped, like their iterations'
+            # nodes. A new mapping has the same keys, with zero values.
+            engine.search_analytics = _ThreadLocalMapping(
+                owner, saved_analytics,
+                lambda: {key: type(value)()
+                         for key, value in saved_analytics.items()},
+                [])
+    completed = []
+
+    def record_iteration(partial_depth, score, best_move):
+        completed.append((partial_depth, 0, score, best_move))
+        if info is not None:
+            info(partial_depth, score, best_move)
+
+    def helper_report(worker_id):
+        return lambda partial_depth, score, best_move: completed.append(
+            (partial_depth, -1 * worker_id, score, best_move))
+
+    helpers = [threading.Thread(
+        target=_helper_search,
+        args=(copy.deepcopy(chessboard), depth, worker_id, helper_stop,
+              helper_report(worker_id)),
+        daemon=True) for worker_id in range(1, threads)]
+    for helper in helpers:
+        helper.start()
+    try:
+        score, best_move = engine.iterative_deepening(
+            chessboard, depth, max_time=max_time, time_manager=time_manager,
+            info=record_iteration, stop=stop)
+    finally:
+        helper_stop.set()
+        for helper in helpers:
+            helper.join()
+        engine.search_stats = saved_stats
+        engine.search_analytics = saved_analytics
+    engine.search_stats['helper_nodes'] += sum(stats['nodes']
+                                               for stats in helper_stats)
+    engine.search_stats['search_threads'] = threads
+    if completed:
+        # Deepest first, then the calling thread.
+        _, _, score, best_move = max(completed)
+    return score, best_move
+
+
+def search(chessboard, depth, threads, mode='lazysmp', **kwargs):
+    """Return (score, best_move, pv) from the parallel search named by
+    mode, one of engine.PARALLEL_MODES. Keyword arguments are passed on.
+    """
+    if mode == 'lazysmp':
+        return lazy_smp_search(chessboard, depth, threads, **kwargs)
+    elif mode == 'rootsplit':
+        return root_split_search(chessboard, depth, threads, **kwargs)
+    elif mode == 'ybwc':
+        score, best_move = ybwc_search(chessboard, depth, threads, **kwargs)
+    elif mode == 'threads':
+        score, best_move = threaded_search(chessboard, depth, threads,
+                                           **kwargs)
+    else:
+        raise ValueError(f'Unknown parallel mode: {mode}')
+    return score, best_move, engine.principal_variation(chessboard,
+                                                        best_move)
+
+
+def root_split_search(chessboard, depth, workers, max_time=5,
+                      time_manager=None, info=None, stop=None):
+    """Run iterative deepening with each iteration splitting the root
+    moves between a pool of worker processes. Return (score, best_move,
+    pv) of the last completed iteration.
+
+    Workers search their moves one at a time, each with the best score
+    any worker has found so far as alpha. Moves are reordered by score
+    between iterations and dealt out in turn, so every worker gets some
+    of the best moves. Limits are as for engine.iterative_deepening().
+    Workers add their nodes to a shared count after each root move, so a
+    node limit counts them from then on.
+    """
+    start = time.time()
+    engine.reset_search_stats()
+    if stop is None and time_manager is not None:
+        stop = time_manager.stop
+    root_moves = engine.legal_moves(chessboard)
+    if time_manager is not None and time_manager.is_timed() \
+            and len(root_moves) == 1:
+        time_manager.forced = True
+    score, best_move, pv = float('-inf'), None, []
+    shared_alpha = multiprocessing.Value('d', float('-inf'))
+    shared_nodes = multiprocessing.Value('q', 0)
+    worker_stop = multiprocessing.Event()
+    with ProcessPoolExecutor(workers, initializer=_init_root_split_worker,
+                             initargs=(shared_alpha, shared_nodes,
+                                       worker_stop)) as pool:
+        for partial_depth in range(1, depth + 1):
+            if not root_moves:
+                break
+            shared_alpha.value = float('-inf')
+            shared_nodes.value = 0
+            futures = [pool.submit(_root_split_worker, chessboard,
+                                   partial_depth, root_moves[i::workers])
+                       for i in range(min(workers, len(root_moves)))]
+            pending = futures
+            while pending:
+                _, pending = wait(pending, timeout=0.01,
+                                  return_when=FIRST_COMPLETED)
+                if time_manager is not None:
+                    time_manager.poll(engine.search_stats['nodes']
+                                      + shared_nodes.value)
+                if stop is not None and stop.is_set():
+                    worker_stop.set()
+            results = [future.result() for future in futures]
+            for result in results:
+                engine.search_stats['nodes'] += result[5]
+            if worker_stop.is_set():
+                break
+            iteration_score, _, iteration_move, iteration_pv, _, _ = max(
+                results, key=lambda result: result[:2])
+            if iteration_move is None:
+                break
+            score, best_move, pv = iteration_score, iteration_move, \
+                iteration_pv
+            move_scores = dict(move_score for result in results
+                               for move_score in result[4])
+            root_moves.sort(key=lambda move: move_scores[move],
+                            reverse=True)
+            if info is not None:
+                info(partial_depth, score, best_move)
+            if abs(score) >= engine.MATE_BOUND \
+                    and engine.MATE_SCORE - abs(score) <= partial_depth:
+                break
+            if time_manager is not None:
+                if time_manager.iteration_done(score, best_move):
+                    break
+            elif max_time < (time.time() - start):
+                break
+    if best_move is None and root_moves:
+        # Stopped before the first iteration finished.
+        best_move = root_moves[0]
+        pv = [best_move]
+    return score, best_move, pv
+
+
+def _init_root_split_worker(shared_alpha, shared_nodes, worker_stop):
+    """Pool initializer, keep the shared alpha, node count and stop
+    Event.
+    """
+    global _shared_alpha, _shared_nodes, _worker_stop
+    _shared_alpha = shared_alpha
+    _shared_nodes = shared_nodes
+    _worker_stop = worker_stop
+
+
+def _root_split_worker(chessboard, depth, moves):
+    """Search some root moves for root_split_search(). Return (score,
+    raised_alpha, best_move, pv, [(move, score), ...], nodes).
+
+    A score which did not raise the shared alpha is only an upper bound.
+    """
+    engine.reset_search_stats()
+    move_scores = []
+    best = (float('-inf'), False, None)
+    for move_from_to in moves:
+        if _worker_stop.is_set():
+            break
+        alpha = _shared_alpha.value
+        searchmoves = [(chessboard.squares[move_from_to[0]],
+                        move_from_to[1])]
+        nodes = engine.search_stats['nodes']
+        score = engine.negamax(chessboard, depth, alpha, float('inf'),
+                               stop=_worker_stop, searchmoves=searchmoves)[0]
+        with _shared_nodes.get_lock():
+            _shared_nodes.value += engine.search_stats['nodes'] - nodes
+        if _worker_stop.is_set():
+            break
+        raised_alpha = score > alpha
+        if raised_alpha:
+            with _shared_alpha.get_lock():
+                if score > _shared_alpha.value:
+                    _shared_alpha.value = score
+        move_scores.append((move_from_to, score))
+        if (score, raised_alpha) > best[:2]:
+            best = (score, raised_alpha, move_from_to)
+    pv = []
+    if best[2] is not None:
+        pv = engine.principal_variation(chessboard, best[2])
+    return best + (pv, move_scores, engine.search_stats['nodes'])
+
+
+def ybwc_search(chessboard, depth, workers, max_time=5,
+                time_manager=None, info=None, stop=None):
+    """Run iterative deepening with Young Brothers Wait (YBWC) split
+    points. Return (score, best_move) of the last completed iteration.
+
+    The calling process searches the first move of a node itself. The
+    other moves of nodes at least YBWC_MIN_SPLIT_DEPTH deep then become
+    tasks for a pool of worker processes, which start from the best
+    score found at the split point so far. A fail high aborts the
+    split point's other tasks. Only the calling process splits, so split
+    points lie along the leftmost path of the tree. Limits are as for
+    engine.iterative_deepening().
+    """
+    start = time.time()
+    engine.reset_search_stats()
+    if stop is None and time_manager is not None:
+        stop = time_manager.stop
+    root_moves = engine.legal_moves(chessboard)
+    if time_manager is not None and time_manager.is_timed() \
+            and len(root_moves) == 1:
+        time_manager.forced = True
+    score, best_move = float('-inf'), None
+    split_alphas = multiprocessing.RawArray('d', engine.MAX_DEPTH + 1)
+    split_aborts = multiprocessing.RawArray('b', engine.MAX_DEPTH + 1)
+    worker_stop = multiprocessing.Event()
+    # The calling process sets split point bounds through the same globals.
+    _init_ybwc_worker(split_alphas, split_aborts, worker_stop)
+    with ProcessPoolExecutor(workers, initializer=_init_ybwc_worker,
+                             initargs=(split_alphas, split_aborts,
+                                       worker_stop)) as pool:
+        for partial_depth in range(1, depth + 1):
+            values = _ybwc(chessboard, partial_depth, float('-inf'),
+                           float('inf'), 0, pool, stop, worker_stop,
+                           time_manager)
+            if worker_stop.is_set() or stop is not None and stop.is_set():
+                break
+            if values[1] is None:
+                break
+            score, best_move = values
+            if info is not None:
+                info(partial_depth, score, best_move)
+            if abs(score) >= engine.MATE_BOUND \
+                    and engine.MATE_SCORE - abs(score) <= partial_depth:
+                break
+            if time_manager is not None:
+                if time_manager.iteration_done(score, best_move):
+                    break
+            elif max_time < (time.time() - start):
+                break
+    if best_move is None and root_moves:
+        # Stopped before the first iteration finished.
+        best_move = root_moves[0]
+    return score, best_move
+
+
+def _ybwc(chessboard, depth, alpha, beta, ply, pool, stop, worker_stop,
+          time_manager):
+    """Fail hard search of a node for ybwc_search(). Return (score,
+    best_move). Shallow nodes are left to engine.negamax().
+    """
+    if depth < YBWC_MIN_SPLIT_DEPTH or ply >= engine.MAX_DEPTH:
+        return engine.negamax(chessboard, depth, alpha, beta, stop=stop,
+                              time_manager=time_manager, ply=ply)
+    engine.search_stats['nodes'] += 1
+    if ply > 0:
+        if chessboard.is_repetition():
+            engine.search_stats['repetition_draws'] += 1
+            return 0, None
+        if chessboard.halfmove_clock >= 100:
+            engine.search_stats['fifty_move_draws'] += 1
+            return 0, None
+        if engine.material_info(chessboard.material_key)[1]:
+            engine.search_stats['insufficient_material_draws'] += 1
+            return 0, None
+    # As in engine.negamax(), results which use path dependent draw scores,
+    # here or in a worker's task, are not stored with a depth.
+    draws_before = engine.search_stats['repetition_draws'] \
+        + engine.search_stats['fifty_move_draws']
+    if chessboard.last_move_piece.color == 'white':
+        friendly_king = chessboard.black_king
+        opponent_king = chessboard.white_king
+        pieces_to_move = chessboard.black_pieces
+    else:
+        friendly_king = chessboard.white_king
+        opponent_king = chessboard.black_king
+        pieces_to_move = chessboard.white_pieces
+    tt_move = None
+    engine.search_stats['tt_probes'] += 1
+    entry = engine.transposition.get(chessboard.zobrist_hash)
+    if entry is not None:
+        engine.search_stats['tt_hits'] += 1
+        tt_move, tt_score, node, tt_depth = entry
+        tt_score = engine.score_from_transposition(tt_score, ply)
+        # The same cutoffs as engine.negamax(). The root always searches.
+        if ply > 0 and tt_depth >= depth:
+            if node == 'pvnode':
+                return tt_score, tt_move
+            elif node == 'cutnode' and tt_score >= beta:
+                return beta, tt_move
+            elif node == 'allnode' and tt_score <= alpha:
+                return alpha, tt_move
+    moves = engine.generate_moves(chessboard, pieces_to_move,
+                                  friendly_king)
+    engine.order_moves(chessboard, moves, tt_move)
+
+    best_move = None
+    legal_moves = 0
+    tasks = {}
+    for piece, move, piece_moves, en_passant_move in moves:
+        saved_piece_loop, saved_move_loop = engine.make_move(
+            chessboard, piece, move, piece_moves, en_passant_move,
+            pieces_to_move)
+        move_from_to = chessboard.last_move_from_to
+        if chessboard.is_square_attacked(friendly_king.square,
+                                         opponent_king.color):
+            engine.undo_move(chessboard, saved_piece_loop, saved_move_loop)
+            continue
+        legal_moves += 1
+        if ply == 0 and time_manager is not None:
+            # Younger brothers are named as they are handed out.
+            time_manager.root_move(depth, move_from_to, legal_moves)
+        if legal_moves > 1:
+            # Younger brother, searched by a worker.
+            tasks[pool.submit(_ybwc_worker, pickle.dumps(chessboard),
+                              depth - 1, ply, beta)] = move_from_to
+            engine.undo_move(chessboard, saved_piece_loop, saved_move_loop)
+            continue
+        # Eldest brother.
+        score = -1 * _ybwc(chessboard, depth - 1, -1 * beta, -1 * alpha,
+                           ply + 1, pool, stop, worker_stop,
+                           time_manager)[0]
+        engine.undo_move(chessboard, saved_piece_loop, saved_move_loop)
+        if stop is not None and stop.is_set():
+            return alpha, None
+        if score >= beta:
+            engine.store_transposition(
+                chessboard.zobrist_hash, move_from_to, score, 'cutnode',
+                engine.tt_store_depth(depth, draws_before), ply)
+            return beta, move_from_to
+        elif score > alpha:
+            alpha = score
+            best_move = move_from_to
+        # Later moves are tasks, which start from this alpha.
+        _split_alphas[ply] = alpha
+        _split_aborts[ply] = 0
+
+    if not legal_moves:
+        if chessboard.is_square_attacked(friendly_king.square,
+                                         opponent_king.color):
+            return -1 * engine.MATE_SCORE + ply, None
+        return 0, None
+
+    if tasks:
+        engine.search_stats['split_points'] += 1
+        engine.search_stats['split_tasks'] += len(tasks)
+    pending = set(tasks)
+    while pending:
+        done, pending = wait(pending, timeout=0.01,
+                             return_when=FIRST_COMPLETED)
+        if time_manager is not None:
+            time_manager.poll(engine.search_stats['nodes'])
+        if stop is not None and stop.is_set():
+            worker_stop.set()
+        for future in done:
+            score, nodes, repetition_draws, fifty_move_draws = \
+                future.result()
+            engine.search_stats['nodes'] += nodes
+            engine.search_stats['repetition_draws'] += repetition_draws
+            engine.search_stats['fifty_move_draws'] += fifty_move_draws
+            if score is None or score <= alpha:
+                continue
+            if score >= beta:
+                # Cutoff. Abort the split point's other tasks.
+                _split_aborts[ply] = 1
+                engine.search_stats['split_aborts'] += 1
+                for task in pending:
+                    task.cancel()
+                wait(pending)
+                _split_aborts[ply] = 0
+                engine.store_transposition(
+                    chessboard.zobrist_hash, tasks[future], score,
+                    'cutnode', engine.tt_store_depth(depth, draws_before),
+                    ply)
+                return beta, tasks[future]
+            alpha = score
+            best_move = tasks[future]
+            _split_alphas[ply] = alpha
+    if worker_stop.is_set():
+        return alpha, None
+    store_depth = engine.tt_store_depth(depth, draws_before)
+    if best_move is not None:
+        engine.store_transposition(chessboard.zobrist_hash, best_move,
+                                   alpha, 'pvnode', store_depth, ply)
+    else:
+        engine.store_transposition(chessboard.zobrist_hash, tt_move, alpha,
+                                   'allnode', store_depth, ply)
+    return alpha, best_move
+
+
+class _SplitPointStop:
+    """Stands in for the stop Event of a YBWC task. Set when the search
+    stops or the task's split point fails high.
+    """
+
+    def __init__(self, split_ply):
+        self.split_ply = split_ply
+
+    def is_set(self):
+        return _split_aborts[self.split_ply] or _worker_stop.is_set()
+
+
+def _init_ybwc_worker(split_alphas, split_aborts, worker_stop):
+    """Pool initializer, keep the split point bounds and stop Event."""
+    global _split_alphas, _split_aborts, _worker_stop
+    _split_alphas = split_alphas
+    _split_aborts = split_aborts
+    _worker_stop = worker_stop
+
+
+def _ybwc_worker(board_data, depth, split_ply, beta):
+    """Search a younger brother at a split point for _ybwc(). Return
+    (score, nodes, repetition_draws, fifty_move_draws) with the score from
+    the split point's side, or None for the score if the task was
+    aborted.
+    """
+    stop = _SplitPointStop(split_ply)
+    if stop.is_set():
+        return None, 0, 0, 0
+    chessboard = pickle.loads(board_data)
+    engine.reset_search_stats()
+    alpha = _split_alphas[split_ply]
+    # Principal variation search: a null window first, and the full
+    # window only for a move which beats alpha.
+    score = -1 * engine.negamax(chessboard, depth, -1 * alpha - 1,
+                                -1 * alpha, stop=stop,
+                                ply=split_ply + 1)[0]
+    if alpha < score < beta and not stop.is_set():
+        alpha = _split_alphas[split_ply]
+        score = -1 * engine.negamax(chessboard, depth, -1 * beta,
+                                    -1 * alpha, stop=stop,
+                                    ply=split_ply + 1)[0]
+    if stop.is_set():
+        score = None
+    return (score, engine.search_stats['nodes'],
+            engine.search_stats['repetition_draws'],
+            engine.search_stats['fifty_move_draws'])
+
+
+def benchmark(depth=4, workers=(1, 2, 4, 8, 16), fens=engine.BENCH_FENS,
+              mode='lazysmp'):
+    """Return [(workers, seconds), ...], the time for each number of
+    workers to search every position to a depth with the parallel search
+    named by mode. Zero workers is the single process
+    engine.iterative_deepening(). Tables are cleared between positions.
+    """
+    timings = []
+    for threads in workers:
+        start = time.time()
+        for fen in fens:
+            chessboard = chess_utilities.import_fen_to_board(
+                fen, autopromote=True)
+            engine.transposition = {}
+            get_shared_table().clear()
+            if threads:
+                search(chessboard, depth, threads, mode=mode,
+                       max_time=float('inf'))
+            else:
+                engine.iterative_deepening(chessboard, depth,
+                                           max_time=float('inf'))
+        timings.append((threads, time.time() - start))
+    engine.transposition = {}
+    return timings
+
+
+if __name__ == '__main__':
+    # python parallel.py [depth] [max_workers] [mode]
+    bench_depth = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    bench_mode = sys.argv[3] if len(sys.argv) > 3 else 'lazysmp'
+    worker_counts = [n for n in (0, 1, 2, 4, 8, 16) if n <= max_workers]
+    print(f'{bench_mode} time to depth {bench_depth}, '
+          f'{len(engine.BENCH_FENS)} positions, '
+          f'{multiprocessing.cpu_count()} CPUs, 0 workers is single process')
+    print('workers  seconds  speedup')
+    timings = benchmark(bench_depth, worker_counts, mode=bench_mode)
+    for threads, seconds in timings:
+        print(f'{threads:7}  {seconds:7.2f}  {timings[0][1] / seconds:7.2f}')
@@ -20,9 +20,6 @@ Equivalent integer representation.
 | 0  | 1  | 2  | ... | 7  |
 """
 
-import logging
-# logging.basicConfig(level=logging.DEBUG)
-
 
 class RanksFiles:
     """Holds sets for limiting piece movement."""
@@ -444,6 +441,8 @@ class Pawn(_Piece):
             all_squares[self.square] = Queen('Qp', self.color, self.square)
         elif new_piece_type == 'rook':
             all_squares[self.square] = Rook('Rp', self.color, self.square)
+            # A promoted rook never gives castling rights.
+            all_squares[self.square].has_moved = True
         elif new_piece_type == 'bishop':
             all_squares[self.square] = Bishop('Bp', self.color, self.square)
         elif new_piece_type == 'knight':
@@ -464,6 +463,7 @@ class Pawn(_Piece):
             new_piece.name = new_piece.name.lower()
             board.black_pieces.insert(0, new_piece)
             board.black_pieces.remove(self)
+        board.update_material_key(self, new_piece)
 
     def move_piece(self, board, new_square, promote_to=None):
         """Move the pawn.
@@ -506,18 +506,12 @@ class Pawn(_Piece):
             board.update_zobrist_hash([self])
         if captured_piece:
             assert captured_piece.color != self.color
+            board.update_material_key(captured_piece)
             board.update_zobrist_hash([captured_piece, self])
-            logging.debug(f"{self} captures {captured_piece}")
             if self.color == 'white':
                 board.black_pieces.remove(captured_piece)
-                logging.debug('removing captured_piece from black_pieces')
-                logging.debug('len(black_pieces) = '
-                              f'{len(board.black_pieces)}')
             else:
                 board.white_pieces.remove(captured_piece)
-                logging.debug('removing captured_piece from white_pieces')
-                logging.debug('len(white_pieces) = '
-                              f'{len(board.white_pieces)}')
             if en_passant:
                 board.squares[captured_piece_square] = ' '
 
@@ -529,7 +523,6 @@ class Pawn(_Piece):
             self.promote_pawn(board, promote_to)
             board.last_move_piece = board.squares[new_square]
         elif self.color == 'black' and self.square in ranks_files.rank_1:
-            logging.debug(f"{self} promotes ({promote_to})")
             self.promote_pawn(board, promote_to)
             board.last_move_piece = board.squares[new_square]
 
@@ -619,6 +612,7 @@ class Knight(_Piece):
             captured_piece = board.squares[new_square]
             board.update_zobrist_hash([captured_piece, self])
             assert captured_piece.color != self.color
+            board.update_material_key(captured_piece)
             if self.color == 'white':
                 board.black_pieces.remove(captured_piece)
             else:
@@ -704,6 +698,7 @@ class Bishop(_Piece):
                 captured_piece = board.squares[new_square]
                 board.update_zobrist_hash([captured_piece, self])
                 assert captured_piece.color != self.color
+                board.update_material_key(captured_piece)
                 if self.color == 'white':
                     board.black_pieces.remove(captured_piece)
                 else:
@@ -810,6 +805,7 @@ class Rook(_Piece):
                                                       Rook, Queen)):
                 captured_piece = board.squares[new_square]
                 assert captured_piece.color != self.color
+                board.update_material_key(captured_piece)
                 if self.color == 'white':
                     board.black_pieces.remove(captured_piece)
                 else:
@@ -911,6 +907,7 @@ class Queen(_Piece):
                 captured_piece = board.squares[new_square]
                 board.update_zobrist_hash([captured_piece, self])
                 assert captured_piece.color != self.color
+                board.update_material_key(captured_piece)
                 if self.color == 'white':
                     board.black_pieces.remove(captured_piece)
                 else:
@@ -1128,6 +1125,7 @@ class King:
                                                   Rook, Queen)):
             captured_piece = board.squares[new_square]
             assert captured_piece.color != self.color
+            board.update_material_key(captured_piece)
             if self.color == 'white':
                 board.black_pieces.remove(captured_piece)
             else:
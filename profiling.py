@@ -0,0 +1,162 @@
+"""Profile searches, benchmarks and perft.
+
+A Profiler runs a workload under cProfile, for a .pstats file, while a
+thread samples the workload's stack, for a .collapsed file of
+"function;function;... count" lines read by flame graph tools. Its report
+lists the top functions by cumulative and self time in each part of the
+engine: move generation, make/unmake, evaluation and hashing.
+
+Run this file on a .pstats file to print the report again.
+"""
+
+from collections import Counter
+import cProfile
+import os
+import pstats
+import sys
+import threading
+
+# Engine functions by part, for Profiler.report().
+PROFILE_CATEGORIES = {
+    'movegen': ('generate_move_tree', 'generate_moves', 'legal_moves',
+                'order_moves', 'replicate_promotion_moves', 'update_moves',
+                'add_castling_moves', 'add_en_passant_moves',
+                'find_sliding_controlled_squares',
+                'update_white_controlled_squares',
+                'update_black_controlled_squares',
+                'remove_illegal_moves_for_pinned_pieces',
+                'restrict_moves_when_pinned',
+                'remove_moves_to_attacked_squares',
+                'moves_must_escape_check_or_checkmate',
+                'find_interposition_squares', 'find_checking_pieces',
+                'find_attackers', 'check_if_in_check', 'is_square_attacked',
+                'is_pinned'),
+    'make/unmake': ('make_move', 'undo_move', 'move_piece',
+                    'update_board_after_move', 'promote_pawn',
+                    'save_state_per_piece', 'save_state_per_move',
+                    'make_null_move', 'undo_null_move', 'push_history',
+                    'pop_history'),
+    'eval': ('evaluate_position', 'evaluate_pawns_and_phase',
+             'material_info', 'static_exchange_evaluation'),
+    'hashing': ('update_zobrist_hash', 'update_material_key',
+                'store_transposition', 'score_from_transposition',
+                'is_repetition'),
+}
+ENGINE_FILES = ('board.py', 'engine.py', 'pieces.py')
+# Seconds between stack samples. Under the GIL, samples are taken at most
+# once per sys.getswitchinterval().
+SAMPLE_INTERVAL = 0.001
+
+
+class Profiler:
+    """cProfile and stack sampling of the workloads given to run(),
+    summed over runs.
+
+    Parameters
+    ----------
+    path : str
+        Output path without extension, for path.pstats and
+        path.collapsed.
+
+    Methods
+    -------
+        __init__()
+        run()
+        dump()
+        report()
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.profile = cProfile.Profile()
+        self.stacks = Counter()
+
+    def run(self, function, *args, **kwargs):
+        """Return function(*args, **kwargs), profiled."""
+        done = threading.Event()
+        sampler = threading.Thread(
+            target=self._sample, args=(threading.get_ident(), done),
+            daemon=True)
+        sampler.start()
+        self.profile.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self.profile.disable()
+            done.set()
+            sampler.join()
+
+    def _sample(self, thread_id, done):
+        """Count the stacks of a thread until done is set."""
+        while not done.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                # The profiler's own frames are left out.
+                if code.co_filename != __file__:
+                    stack.append(f'{os.path.basename(code.co_filename)}:'
+                                 f'{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def dump(self):
+        """Write path.pstats and path.collapsed."""
+        self.profile.dump_stats(self.path + '.pstats')
+        with open(self.path + '.collapsed', 'w') as collapsed:
+            for stack, count in sorted(self.stacks.items()):
+                collapsed.write(f'{stack} {count}\n')
+
+    def report(self, top=5, stream=None):
+        """Print the top functions of each category by cumulative and
+        self time.
+        """
+        report(pstats.Stats(self.profile), top, stream)
+
+
+def report(stats, top=5, stream=None):
+    """Print the top engine functions of each of PROFILE_CATEGORIES by
+    cumulative and self time, from a pstats.Stats.
+    """
+    stream = sys.stdout if stream is None else stream
+    total = stats.total_tt
+    print(f'{total:.3f} s profiled', file=stream)
+    print(f"    {'cumulative':>10} {'self':>10} {'calls':>9}  function",
+          file=stream)
+    for category, names in PROFILE_CATEGORIES.items():
+        rows = [(cumulative, own, calls,
+                 f'{os.path.basename(filename)}:{line}({name})')
+                for (filename, line, name), (_, calls, own, cumulative, _)
+                in stats.stats.items()
+                if name in names
+                and os.path.basename(filename) in ENGINE_FILES]
+        own_total = sum(row[1] for row in rows)
+        share = own_total / total * 100 if total else 0
+        print(f'{category}: {own_total:.3f} s self ({share:.1f}%)',
+              file=stream)
+        for title, column in (('cumulative', 0), ('self', 1)):
+            print(f'  by {title} time', file=stream)
+            for row in sorted(rows, key=lambda row: row[column],
+                              reverse=True)[:top]:
+                cumulative, own, calls, name = row
+                print(f'    {cumulative:10.3f} {own:10.3f} {calls:9}  '
+                      f'{name}', file=stream)
+
+
+def profile(function, *args, path='profile', top=5, stream=None, **kwargs):
+    """Return function(*args, **kwargs), run under a Profiler which
+    writes path.pstats and path.collapsed and prints its report.
+    """
+    profiler = Profiler(path)
+    result = profiler.run(function, *args, **kwargs)
+    profiler.dump()
+    profiler.report(top, stream)
+    return result
+
+
+if __name__ == '__main__':
+    # python profiling.py profile.pstats [top]
+    report(pstats.Stats(sys.argv[1]),
+           int(sys.argv[2]) if len(sys.argv) > 2 else 5)
@@ -0,0 +1,231 @@
+"""Binary traces of the search tree, for finding where a search spends its
+nodes.
+
+A Tracer replaces engine.negamax() with a wrapper which writes one fixed
+size record per node as the node returns: the position's Zobrist hash,
+the window, the score, the ply and remaining depth, the move which led to
+the node and the node type. Records go to a buffered file, so tracing
+costs one struct.pack() per node, and nothing once the Tracer is
+stopped. Sampling traces every Nth subtree from one ply, with all nodes
+above that ply.
+
+Run this file on a trace to rebuild its subtrees and report hot spots:
+the root moves and positions which took the most nodes.
+"""
+
+from collections import Counter, defaultdict, namedtuple
+import struct
+import sys
+
+import board
+import engine
+
+# Zobrist hash, alpha, beta, score, ply, depth, move from and to squares
+# (-1 for none), node type, padding.
+RECORD = struct.Struct('<QiiiBbbbB3x')
+NODE_TYPES = ('pvnode', 'cutnode', 'allnode')
+# Infinite scores are clamped to this.
+SCORE_INFINITY = (1 << 31) - 1
+BUFFER_SIZE = 1 << 20
+
+TraceRecord = namedtuple('TraceRecord', 'zobrist_hash alpha beta score ply '
+                                        'depth move node_type')
+TraceNode = namedtuple('TraceNode', 'record children size')
+
+
+class Tracer:
+    """Trace engine.negamax() nodes to a file while started. Also a
+    context manager.
+
+    Parameters
+    ----------
+    path : str
+        Trace file, overwritten.
+    sample : int
+        Trace every sample-th subtree at sample_ply. 1 traces every node.
+    sample_ply : int
+        Ply at which subtrees are sampled. Nodes above it are always
+        traced, so sampled subtrees keep their path to the root.
+    search_module : module
+        Module whose negamax() is traced, engine unless it runs as
+        __main__.
+
+    Methods
+    -------
+        __init__()
+        __enter__()
+        __exit__()
+        start()
+        stop()
+        negamax()
+
+    """
+
+    def __init__(self, path, sample=1, sample_ply=1, search_module=engine):
+        if sample < 1:
+            raise ValueError('sample must be at least 1')
+        self.path = path
+        self.sample = sample
+        self.sample_ply = sample_ply
+        self.search_module = search_module
+        self.sampled_subtrees = 0
+        self.active = True
+        self.records = 0
+        self.trace_file = None
+        self.search = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Open the trace file and install the negamax() wrapper."""
+        self.trace_file = open(self.path, 'wb', buffering=BUFFER_SIZE)
+        self.search = self.search_module.negamax
+        self.search_module.negamax = self.negamax
+
+    def stop(self):
+        """Restore negamax() and close the trace file."""
+        self.search_module.negamax = self.search
+        self.trace_file.close()
+
+    def negamax(self, chessboard, depth, alpha=float('-inf'),
+                beta=float('inf'), *args, ply=0, **kwargs):
+        """Search as engine.negamax does and write a record for the node."""
+        zobrist_hash = chessboard.zobrist_hash
+        move = chessboard.last_move_from_to
+        active = self.active
+        if ply == self.sample_ply:
+            self.active = not self.sampled_subtrees % self.sample
+            self.sampled_subtrees += 1
+        traced = self.active or ply < self.sample_ply
+        score, best_move = self.search(chessboard, depth, alpha, beta, *args,
+                                       ply=ply, **kwargs)
+        self.active = active
+        if traced:
+            if score >= beta:
+                node_type = 1
+            elif score <= alpha:
+                node_type = 2
+            else:
+                node_type = 0
+            self.trace_file.write(RECORD.pack(
+                zobrist_hash, clamp_score(alpha), clamp_score(beta),
+                clamp_score(score), ply, depth, move[0], move[1], node_type))
+            self.records += 1
+        return score, best_move
+
+
+def clamp_score(score):
+    """Return score as an int which fits in a record."""
+    return int(max(min(score, SCORE_INFINITY), -1 * SCORE_INFINITY))
+
+
+def read_trace(path):
+    """Return the TraceRecords of a trace file, in the order the nodes
+    returned.
+    """
+    with open(path, 'rb') as trace_file:
+        data = trace_file.read()
+    data = data[:len(data) - len(data) % RECORD.size]
+
+    def score(value):
+        if abs(value) == SCORE_INFINITY:
+            return float('inf') if value > 0 else float('-inf')
+        return value
+
+    return [TraceRecord(zobrist_hash, score(alpha), score(beta),
+                        score(value), ply, depth,
+                        (square_from, square_to) if square_from >= 0
+                        else None, NODE_TYPES[node_type])
+            for (zobrist_hash, alpha, beta, value, ply, depth, square_from,
+                 square_to, node_type) in RECORD.iter_unpack(data)]
+
+
+def build_subtrees(records):
+    """Return the root TraceNodes rebuilt from records.
+
+    Records are written as nodes return, so the children of a node at
+    ply p are the nodes at ply p + 1 which returned since the last node
+    at ply p. Searches of a node's own position, like internal iterative
+    deepening, become siblings of the node. Nodes left without a parent,
+    like those of an unfinished search, are also returned as roots.
+    """
+    pending = defaultdict(list)
+    for record in records:
+        children = pending.pop(record.ply + 1, [])
+        pending[record.ply].append(TraceNode(
+            record, children, 1 + sum(child.size for child in children)))
+    return [node for ply in sorted(pending) for node in pending[ply]]
+
+
+def hot_spots(roots, top=10):
+    """Return a dict of where the traced searches spent their nodes:
+
+    nodes : int
+    plies : dict
+        Nodes by ply.
+    node_types : dict
+        Nodes by node type.
+    root_moves : list of tuple
+        [(move, nodes), ...] for the top root moves by nodes in their
+        subtrees, summed over all root searches.
+    positions : list of tuple
+        [(zobrist_hash, visits, nodes), ...] for the top positions by
+        nodes in their subtrees, summed over all visits.
+
+    """
+    plies = Counter()
+    node_types = Counter()
+    root_moves = Counter()
+    visits = Counter()
+    position_nodes = Counter()
+    stack = list(roots)
+    for root in roots:
+        if root.record.ply == 0:
+            for child in root.children:
+                root_moves[child.record.move] += child.size
+    while stack:
+        node = stack.pop()
+        record = node.record
+        plies[record.ply] += 1
+        node_types[record.node_type] += 1
+        visits[record.zobrist_hash] += 1
+        position_nodes[record.zobrist_hash] += node.size
+        stack.extend(node.children)
+    return {'nodes': sum(plies.values()),
+            'plies': dict(sorted(plies.items())),
+            'node_types': dict(node_types),
+            'root_moves': root_moves.most_common(top),
+            'positions': [(zobrist_hash, visits[zobrist_hash], nodes)
+                          for zobrist_hash, nodes
+                          in position_nodes.most_common(top)]}
+
+
+def format_move(move):
+    """Return a (from, to) move in coordinate notation."""
+    if move is None:
+        return 'none'
+    return board.Board.int_to_alg_notation[move[0]] \
+        + board.Board.int_to_alg_notation[move[1]]
+
+
+if __name__ == '__main__':
+    # python search_trace.py trace.bin [top]
+    report = hot_spots(build_subtrees(read_trace(sys.argv[1])),
+                       int(sys.argv[2]) if len(sys.argv) > 2 else 10)
+    print(f"{report['nodes']} nodes")
+    print('ply  nodes')
+    for ply, nodes in report['plies'].items():
+        print(f'{ply:3}  {nodes}')
+    print('  '.join(f'{node_type} {nodes}' for node_type, nodes
+                    in sorted(report['node_types'].items())))
+    print('root move  nodes')
+    for move, nodes in report['root_moves']:
+        print(f'{format_move(move):9}  {nodes}')
+    print('position hash         visits  nodes')
+    for zobrist_hash, position_visits, nodes in report['positions']:
+        print(f'{zobrist_hash:#018x}  {position_visits:6}  {nodes}')
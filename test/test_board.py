@@ -226,6 +226,142 @@ class TestBoard(unittest.TestCase):
         """Hash value is a deterministic constant."""
         chessboard = board.Board()
         chessboard.initialize_pieces()
-        chessboard.update_zobrist_hash()
         self.assertEqual(chessboard.zobrist_hash,
                          14313509199228036511)
+
+    def test_fen_import_hash(self):
+        """FEN positions, en passant square included, hash the same as
+        when reached by play, so repetitions back to a FEN root are found.
+        """
+        chessboard = board.Board()
+        chessboard.initialize_pieces()
+        fen_board = chess_utilities.import_fen_to_board(
+            'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq')
+        self.assertEqual(fen_board.zobrist_hash, chessboard.zobrist_hash)
+
+        chessboard.squares[6].update_moves(chessboard)
+        chessboard.squares[6].move_piece(chessboard, 21)
+        fen_board = chess_utilities.import_fen_to_board(
+            'rnbqkbnr/pppppppp/8/8/8/5N2/PPPPPPPP/RNBQKB1R b KQkq')
+        self.assertEqual(fen_board.zobrist_hash, chessboard.zobrist_hash)
+
+        chessboard.squares[51].update_moves(chessboard)
+        chessboard.squares[51].move_piece(chessboard, 35)
+        chess_utilities.import_fen_to_board(
+            'rnbqkbnr/ppp1pppp/8/3p4/8/5N2/PPPPPPPP/RNBQKB1R w KQkq d6 0 2',
+            chessboard=fen_board)
+        self.assertEqual(fen_board.zobrist_hash, chessboard.zobrist_hash)
+        self.assertEqual(fen_board.last_move_from_to, (51, 35))
+        self.assertIs(fen_board.last_move_piece, fen_board.squares[35])
+        self.assertEqual(fen_board.halfmove_clock, 0)
+        self.assertEqual(fen_board.squares[51], ' ')
+        self.assertEqual(len(fen_board.black_pieces), 16)
+
+    def test_is_square_attacked(self):
+        """Attacked squares match the controlled squares of each color."""
+        chessboard = chess_utilities.import_fen_to_board(
+            'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w')
+        chessboard.update_white_controlled_squares()
+        chessboard.update_black_controlled_squares()
+        for square in range(64):
+            self.assertEqual(
+                chessboard.is_square_attacked(square, 'white'),
+                square in chessboard.white_controlled_squares)
+            self.assertEqual(
+                chessboard.is_square_attacked(square, 'black'),
+                square in chessboard.black_controlled_squares)
+
+    def test_find_attackers(self):
+        """Attackers are found directly and, with pieces removed from a
+        copy of the squares, behind other attackers.
+        """
+        chessboard = chess_utilities.import_fen_to_board(
+            'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w')
+        attackers = chessboard.find_attackers(35, 'black')
+        self.assertEqual(set(piece.name for piece in attackers),
+                         set(['n', 'p', 'n']))
+        self.assertEqual(len(attackers), 3)
+        self.assertEqual(
+            set(piece.square for piece in
+                chessboard.find_attackers(35, 'white')), set([18, 28]))
+        self.assertFalse(chessboard.find_attackers(35, 'white', [' '] * 64))
+
+        # The queen on f3 is behind the pawn on e4.
+        all_squares = list(chessboard.squares)
+        all_squares[28] = ' '
+        self.assertEqual(
+            set(piece.square for piece in
+                chessboard.find_attackers(35, 'white', all_squares)),
+            set([18, 21]))
+
+    def test_hash_history(self):
+        """Positions repeat only within the reversible plies since the
+        last capture or pawn move.
+        """
+        chessboard = board.Board()
+        chessboard.initialize_pieces()
+        start_hash = chessboard.zobrist_hash
+        for square_from, square_to in ((6, 21), (62, 45), (21, 6),
+                                       (45, 62)):
+            piece = chessboard.squares[square_from]
+            piece.update_moves(chessboard)
+            chessboard.push_history(False)
+            piece.move_piece(chessboard, square_to)
+        self.assertEqual(chessboard.zobrist_hash, start_hash)
+        self.assertEqual(chessboard.halfmove_clock, 4)
+        self.assertTrue(chessboard.is_repetition())
+
+        chessboard.halfmove_clock = 3
+        self.assertFalse(chessboard.is_repetition())
+        halfmove_clock = chessboard.push_history(True)
+        self.assertEqual((halfmove_clock, chessboard.halfmove_clock), (3, 0))
+        chessboard.pop_history(halfmove_clock)
+        self.assertEqual(len(chessboard.hash_history), 4)
+        self.assertEqual(chessboard.halfmove_clock, 3)
+
+    def test_material_key(self):
+        """Captures and promotions update the material key."""
+        chessboard = board.Board()
+        self.assertEqual(chessboard.material_key, 0)
+        chessboard.initialize_pieces()
+        shifts = board.Board.MATERIAL_KEY_SHIFTS
+        start_key = chessboard.material_key
+        self.assertEqual((start_key >> shifts['P']) & 15, 8)
+        self.assertEqual((start_key >> shifts['q']) & 15, 1)
+
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/1P6/8/8/8/8/8/Kq6 w', autopromote=True)
+        self.assertEqual(chessboard.material_key,
+                         (1 << shifts['P']) + (1 << shifts['q']))
+        pawn = chessboard.squares[49]
+        pawn.update_moves(chessboard)
+        pawn.move_piece(chessboard, 57)
+        self.assertEqual(chessboard.material_key,
+                         (1 << shifts['Q']) + (1 << shifts['q']))
+
+        king = chessboard.white_king
+        king.update_moves(chessboard)
+        king.move_piece(chessboard, 1)
+        self.assertEqual(chessboard.material_key, 1 << shifts['Q'])
+
+    def test_null_move(self):
+        """A null move flips the side to move and clears en passant."""
+        chessboard = board.Board()
+        chessboard.initialize_pieces()
+        chessboard.squares[12].update_moves(chessboard)
+        chessboard.squares[12].move_piece(chessboard, 28)
+        self.assertIsNotNone(chessboard.ep_hash_to_undo)
+        hash_before = chessboard.zobrist_hash
+        ep_hash = chessboard.ep_hash_to_undo
+
+        saved_state = chessboard.make_null_move()
+        self.assertEqual(chessboard.last_move_piece.color, 'black')
+        self.assertIsNone(chessboard.ep_hash_to_undo)
+        self.assertEqual(chessboard.zobrist_hash,
+                         hash_before ^ ep_hash ^ chessboard.hash_nums[12])
+
+        chessboard.undo_null_move(saved_state)
+        self.assertEqual(chessboard.last_move_piece.color, 'white')
+        self.assertEqual(chessboard.last_move_from_to, (12, 28))
+        self.assertEqual(chessboard.zobrist_hash, hash_before)
+        self.assertEqual(chessboard.ep_hash_to_undo, ep_hash)
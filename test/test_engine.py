@@ -1,7 +1,13 @@
 """Tests for engine.py, especially move tree search and node evaluation."""
+import asyncio
 import contextlib
 import cProfile
 import io
+import json
+import os
+import sys
+import tempfile
+import threading
 import time
 import unittest
 from unittest import mock
@@ -172,7 +178,6 @@ class TestEngine(unittest.TestCase):
         """Reverse hashes when undoing a move."""
         chessboard = board.Board()
         chessboard.initialize_pieces()
-        chessboard.update_zobrist_hash()
         initial_hash = chessboard.zobrist_hash
         initial_ep_hash_to_undo = chessboard.ep_hash_to_undo
 
@@ -197,28 +202,104 @@ class TestEngine(unittest.TestCase):
         self.assertEqual(response.getvalue(),
                          ''.join(['\n', str(chessboard), '\n']))
 
-    @mock.patch('engine.input', create=True)
-    def test_uci_quit(self, mocked_input):
+    def test_uci_quit(self):
         """UCI quit mid-calculation."""
-        mocked_input.side_effect = ['position startpos', 'go depth 4', 'quit']
-        with self.assertRaises(SystemExit):
-            engine.main()
+        async def run_loop(search_worker):
+            reader = asyncio.StreamReader()
+            reader.feed_data(b'position startpos\ngo depth 4\nquit\n')
+            await asyncio.wait_for(
+                engine.uci_loop(board.Board(), search_worker, reader),
+                timeout=10)
+
+        response = io.StringIO()
+        with contextlib.redirect_stdout(response):
+            search_worker = engine.SearchWorker()
+            asyncio.run(run_loop(search_worker))
         engine.transposition = {}
+        self.assertFalse(search_worker.process.is_alive())
+        self.assertNotIn('Unknown command.', response.getvalue())
 
     @mock.patch('engine.input', create=True)
-    def test_uci_go_depth_stop_quit(self, mocked_input):
+    def test_stdin_reader(self, mocked_input):
+        """Standard input without a file descriptor, like a test runner's
+        captured stdin, is read with input() until end of input.
+        """
+        mocked_input.side_effect = ['isready', EOFError]
+
+        async def read_lines():
+            reader = await engine.stdin_reader()
+            return [line async for line in reader]
+
+        with mock.patch.object(sys, 'stdin', io.StringIO()):
+            lines = asyncio.run(read_lines())
+        self.assertEqual(lines, [b'isready\n'])
+
+    def test_uci_go_depth_stop_quit(self):
         """UCI calculation returns response."""
-        # Side effect raises StopIteration when exhausted.
-        mocked_input.side_effect = ['position startpos', 'go depth 4', 'stop',
-                                    'quit']
+        async def run_loop(search_worker):
+            reader = asyncio.StreamReader()
+            reader.feed_data(b'position startpos\ngo depth 2\n')
+            loop_task = asyncio.create_task(
+                engine.uci_loop(board.Board(), search_worker, reader))
+            await asyncio.sleep(0.1)
+            await asyncio.get_running_loop().run_in_executor(
+                None, search_worker.wait, 10)
+            # After the bestmove, "stop" has no search to end.
+            reader.feed_data(b'stop\nquit\n')
+            await asyncio.wait_for(loop_task, timeout=10)
+
+        response = io.StringIO()
+        with contextlib.redirect_stdout(response):
+            search_worker = engine.SearchWorker()
+            asyncio.run(run_loop(search_worker))
+        engine.transposition = {}
+        # An info line for each completed iteration, then the best move.
+        lines = response.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertRegex(lines[0], r'^info depth 1 seldepth 1 score cp -184 '
+                         r'nodes 23 nps \d+ hashfull 0 time \d+ pv g1f3$')
+        self.assertRegex(lines[1], r'^info depth 2 seldepth 2 score cp 66 '
+                         r'nodes 222 nps \d+ hashfull 0 time \d+ '
+                         r'pv e2e4 g8f6$')
+        self.assertEqual(lines[2], 'bestmove e2e4 ponder g8f6')
+
+    def test_uci_go_no_limits(self):
+        """A bare UCI "go" searches until "stop", with no error."""
+        chessboard = board.Board()
+        chessboard.initialize_pieces(autopromote=['white', 'black'])
         response = io.StringIO()
+        stop = threading.Event()
         with contextlib.redirect_stdout(response):
-            with self.assertRaises(SystemExit):
-                engine.main()
+            engine.uci('go', stop, threading.Event(), chessboard)
+            time.sleep(0.2)
+            stop.set()
+            for _ in range(200):
+                if 'bestmove' in response.getvalue():
+                    break
+                time.sleep(0.05)
         engine.transposition = {}
-        self.assertTrue(response.getvalue() in ['bestmove b1c3\n',
-                                                'bestmove b1a3\n',
-                                                'bestmove g1f3\n'])
+        lines = response.getvalue().splitlines()
+        self.assertNotIn('Unknown command.', lines)
+        self.assertTrue(lines[-1].startswith('bestmove '))
+
+    def test_uci_score_mate(self):
+        """UCI reports mate scores in moves, and the search ends once the
+        mate is found.
+        """
+        chessboard = chess_utilities.import_fen_to_board(
+            'r5k1/5ppp/8/8/8/8/3R1PPP/3R2K1 w')
+        response = io.StringIO()
+        with contextlib.redirect_stdout(response):
+            engine.uci('go depth 6', threading.Event(), threading.Event(),
+                       chessboard)
+            while not response.getvalue().endswith('\n') \
+                    or 'bestmove' not in response.getvalue():
+                time.sleep(0.05)
+        engine.transposition = {}
+        lines = response.getvalue().splitlines()
+        self.assertRegex(lines[-2], r'^info depth 3 seldepth \d+ score mate 2 '
+                         r'nodes .* pv d2d8 a8d8 d1d8$')
+        self.assertEqual(lines[-1], 'bestmove d2d8 ponder a8d8')
 
     # 380knps depth 4, 30k depth 3, including pruned, etc.
     @unittest.skip('Performance analysis, not a test.')
@@ -246,23 +327,808 @@ class TestEngine(unittest.TestCase):
             autopromote=True)
         engine.negamax(chessboard, 1)
 
+    def test_evaluate_lone_edge_pawns(self):
+        """A lone a-pawn or h-pawn is isolated, and does not look at the
+        other edge of the board.
+        """
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/8/8/8/8/7P/K7 w')
+        self.assertEqual(
+            engine.evaluate_pawns_and_phase(chessboard,
+                                            engine.piece_phase_values)[0],
+            -100)
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/8/8/8/8/P6P/K7 w')
+        self.assertEqual(
+            engine.evaluate_pawns_and_phase(chessboard,
+                                            engine.piece_phase_values)[0],
+            -200)
+
     def test_iterative_deepening(self):
         """Move ordering from iterative deepening increases performance."""
+        chessboard = board.Board()
+        chessboard.initialize_pieces()
+        engine.transposition = {}
+        iter_deep_move = engine.iterative_deepening(chessboard, 3)[1]
+        iter_deep_nodes = engine.search_stats['nodes']
+
+        engine.transposition = {}
+        engine.search_stats.clear()
+        chessboard = board.Board()
+        chessboard.initialize_pieces()
+        normal_move = engine.negamax(chessboard, 3)[1]
+        normal_nodes = engine.search_stats['nodes']
+        engine.transposition = {}
+        self.assertLess(iter_deep_nodes, normal_nodes)
+        self.assertEqual(iter_deep_move, normal_move)
+
+    def test_principal_variation_search(self):
+        """Null window searches keep the best move of regression
+        positions.
+        """
+        positions = {
+            'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w':
+                (12, 40),
+            '4k3/4q3/bn3n2/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w': (36, 42),
+            'k7/8/8/8/6rR/8/8/K7 b': (30, 31)}
+        for fen, best_move in positions.items():
+            engine.transposition = {}
+            engine.search_stats.clear()
+            chessboard = chess_utilities.import_fen_to_board(
+                fen, autopromote=True)
+            # The best moves are from plain fixed depth searches.
+            with mock.patch.object(engine, 'EXTENSION_BUDGET', 0):
+                self.assertEqual(engine.negamax(chessboard, 3)[1],
+                                 best_move)
+            self.assertGreater(engine.search_stats['pvs_researches'], 0)
+        engine.transposition = {}
+
+    def test_aspiration_search(self):
+        """A window which misses the score is widened until it fits."""
         chessboard = chess_utilities.import_fen_to_board(
-            '4k3/4q3/bn3n2/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w',
-            autopromote=True)
+            'k7/8/8/8/6rR/8/8/K7 w')
+        engine.transposition = {}
+        score, best_move = engine.negamax(chessboard, 4)
+        engine.transposition = {}
+        engine.search_stats.clear()
+        for prev_score in (score - 500, score + 500):
+            self.assertEqual(
+                engine.aspiration_search(chessboard, 4, prev_score),
+                (score, best_move))
+        self.assertGreater(engine.search_stats['aspiration_researches'], 0)
         engine.transposition = {}
+
+    def test_parse_go_command(self):
+        """UCI "go" limits are parsed into a dict."""
+        limits = engine.parse_go_command(
+            'go wtime 60000 btime 55000 winc 1000 binc 1000 movestogo 20'
+            .split())
+        self.assertEqual(limits, {'wtime': 60000, 'btime': 55000,
+                                  'winc': 1000, 'binc': 1000,
+                                  'movestogo': 20})
+        self.assertEqual(
+            engine.parse_go_command('go infinite searchmoves e2e4'.split()),
+            {'infinite': True})
+        with self.assertRaises(ValueError):
+            engine.parse_go_command('go depth'.split())
+        with self.assertRaises(ValueError):
+            engine.parse_go_command('go depth four'.split())
+
+    def test_time_manager_limits(self):
+        """Soft and hard limits follow the clock of the side to move."""
+        time_manager = engine.TimeManager('white', movetime=1050)
+        self.assertAlmostEqual(time_manager.soft, 1.0)
+        self.assertAlmostEqual(time_manager.hard, 1.0)
+        time_manager = engine.TimeManager('black', wtime=1000, btime=30000,
+                                          winc=0, binc=0)
+        self.assertAlmostEqual(time_manager.soft, 1.0)
+        self.assertAlmostEqual(time_manager.hard, 4.0)
+        # Never plan to use more than the time left on the clock.
+        time_manager = engine.TimeManager('white', wtime=1000, movestogo=1)
+        self.assertLess(time_manager.hard, 1.0)
+        time_manager = engine.TimeManager('white', depth=5)
+        self.assertFalse(time_manager.is_timed())
+        self.assertEqual(time_manager.max_depth, 5)
+
+    def test_time_manager_ponder(self):
+        """A ponder search has no limits until the ponderhit, then the
+        clock starts.
+        """
+        self.assertEqual(engine.parse_go_command('go ponder wtime 900'
+                                                 .split()),
+                         {'ponder': True, 'wtime': 900})
+        ponderhit = threading.Event()
+        time_manager = engine.TimeManager('white', movetime=100, ponder=True,
+                                          ponderhit=ponderhit)
+        time_manager.start_time -= 10
+        time_manager.poll(0)
+        self.assertFalse(time_manager.iteration_done(0, (12, 28)))
+        self.assertFalse(time_manager.stop.is_set())
+        ponderhit.set()
+        time_manager.poll(0)
+        self.assertFalse(time_manager.stop.is_set())
+        self.assertFalse(time_manager.pondering)
+        self.assertGreaterEqual(time_manager.ponder_time, 10)
+        time_manager.start_time -= 1
+        time_manager.poll(0)
+        self.assertTrue(time_manager.stop.is_set())
+
+    def test_time_manager_soft_limit_scaling(self):
+        """Unstable best moves and fail lows extend the soft limit."""
+        time_manager = engine.TimeManager('white', movetime=10_000)
+        time_manager.iteration_done(50, (12, 28))
+        time_manager.iteration_done(50, (11, 27))
+        self.assertGreater(time_manager.soft_scale, 1)
+        scale = time_manager.soft_scale
+        time_manager.iteration_done(-50, (11, 27))
+        self.assertGreater(time_manager.soft_scale, scale)
+        time_manager.forced = True
+        self.assertTrue(time_manager.iteration_done(-50, (11, 27)))
+
+    def test_time_manager_hard_limit(self):
+        """The search stops near the hard limit."""
+        chessboard = board.Board()
+        chessboard.initialize_pieces()
+        engine.transposition = {}
+        time_manager = engine.TimeManager('white', movetime=300)
         start = time.time()
-        engine.iterative_deepening(chessboard, 3)
-        iter_deep_elapsed = time.time() - start
-        self.assertTrue(iter_deep_elapsed < 0.05)
+        best_move = engine.iterative_deepening(
+            chessboard, engine.MAX_DEPTH, time_manager=time_manager)[1]
+        elapsed = time.time() - start
+        engine.transposition = {}
+        self.assertLess(elapsed, 0.5)
+        self.assertIn(best_move, engine.legal_moves(chessboard))
 
+    def test_null_move_pruning(self):
+        """Null moves prune the tree, but never in pawn endgames."""
+        chessboard = board.Board()
+        chessboard.initialize_pieces()
         engine.transposition = {}
+        engine.search_stats.clear()
+        engine.negamax(chessboard, 4)
+        self.assertGreater(engine.search_stats['null_move_cutoffs'], 0)
+
+        chessboard = chess_utilities.import_fen_to_board(
+            '8/5k2/3p4/1p1Pp2p/pP2Pp1P/P4P1K/8/8 w')
+        engine.transposition = {}
+        engine.search_stats.clear()
+        engine.negamax(chessboard, 4)
+        engine.transposition = {}
+        self.assertEqual(engine.search_stats['null_move_tries'], 0)
+        self.assertFalse(engine.has_non_pawn_material(chessboard.white_pieces))
+
+    def test_null_move_verification(self):
+        """Verification searches keep the best move."""
+        chessboard = chess_utilities.import_fen_to_board(
+            'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w',
+            autopromote=True)
+        engine.transposition = {}
+        engine.search_stats.clear()
+        with mock.patch.multiple(engine, NULL_MOVE_VERIFICATION=True,
+                                 NULL_MOVE_VERIFICATION_DEPTH=2):
+            best_move = engine.negamax(chessboard, 4)[1]
+        engine.transposition = {}
+        self.assertGreater(engine.search_stats['null_move_verifications'], 0)
+        self.assertEqual(best_move, (12, 40))
+
+    def test_late_move_reductions(self):
+        """Late quiet moves are reduced or pruned without changing the
+        best move.
+        """
+        self.assertEqual(engine.LMR_TABLE[1][63], 0)
+        self.assertEqual(engine.late_move_reduction(3, 63, False), 1)
+        self.assertEqual(engine.late_move_reduction(3, 1, True), 0)
+        self.assertLessEqual(engine.late_move_reduction(64, 63, False), 62)
+        chessboard = chess_utilities.import_fen_to_board(
+            'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w',
+            autopromote=True)
+        engine.transposition = {}
+        engine.search_stats.clear()
+        best_move = engine.negamax(chessboard, 4)[1]
+        engine.transposition = {}
+        self.assertEqual(best_move, (12, 40))
+        self.assertGreater(engine.search_stats['lmr_reductions'], 0)
+        self.assertGreater(engine.search_stats['late_move_prunes'], 0)
+
+    def test_move_extension(self):
+        """Checks, recaptures and pawn pushes to the 7th rank are
+        extended within the budget of the path.
+        """
+        white_pawn = pieces.Pawn('P', 'white', 52)
+        black_pawn = pieces.Pawn('p', 'black', 12)
+        engine.search_stats.clear()
+        self.assertEqual(engine.move_extension(white_pawn, 52, False, None,
+                                               0), 1)
+        self.assertEqual(engine.move_extension(black_pawn, 12, False, None,
+                                               0), 1)
+        self.assertEqual(engine.move_extension(white_pawn, 44, False, None,
+                                               0), 0)
+        self.assertEqual(engine.move_extension(white_pawn, 44, True, None,
+                                               0), 1)
+        self.assertEqual(engine.move_extension(white_pawn, 44, False, 44,
+                                               0), 1)
+        self.assertEqual(engine.move_extension(
+            white_pawn, 44, True, None, engine.EXTENSION_BUDGET), 0)
+        self.assertEqual(engine.search_stats['pawn_push_extensions'], 2)
+        self.assertEqual(engine.search_stats['check_extensions'], 1)
+        self.assertEqual(engine.search_stats['recapture_extensions'], 1)
+
+    def test_singular_extension(self):
+        """A TT move much better than the alternatives is extended, and
+        iterative deepening finds multi-cuts.
+        """
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/8/8/6rR/8/8/K7 b')
+        engine.transposition = {}
+        score, best_move = engine.negamax(chessboard, 4)
+        # Black has to trade rooks. Pretend the node was searched a ply
+        # shallower, so the entry orders moves but cannot cut.
+        engine.transposition = {
+            chessboard.zobrist_hash: (best_move, score, 'pvnode', 3)}
+        engine.search_stats.clear()
+        self.assertEqual(engine.negamax(chessboard, 4, ply=1)[1], (30, 31))
+        self.assertEqual(engine.search_stats['singular_extensions'], 1)
+
+        with mock.patch.object(engine, 'SINGULAR_MIN_DEPTH', 99):
+            engine.transposition = {
+                chessboard.zobrist_hash: (best_move, score, 'pvnode', 3)}
+            engine.search_stats.clear()
+            engine.negamax(chessboard, 4, ply=1)
+        self.assertEqual(engine.search_stats['singular_searches'], 0)
+
         chessboard = chess_utilities.import_fen_to_board(
             '4k3/4q3/bn3n2/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w',
             autopromote=True)
-        start = time.time()
-        engine.negamax(chessboard, 3)
-        normal_elapsed = time.time() - start
-        self.assertTrue(normal_elapsed > 0.15)
         engine.transposition = {}
+        best_move = engine.iterative_deepening(chessboard, 5,
+                                               max_time=1000)[1]
+        engine.transposition = {}
+        self.assertEqual(best_move, (36, 42))
+        self.assertGreater(engine.search_stats['multi_cuts'], 0)
+
+    def test_static_exchange_evaluation(self):
+        """Exchanges on a square are resolved with the least valuable
+        attackers, including sliders behind them.
+        """
+        chessboard = chess_utilities.import_fen_to_board(
+            'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R b')
+        squares = chessboard.squares
+        self.assertEqual(
+            engine.static_exchange_evaluation(chessboard, squares[44], 35),
+            0)
+        self.assertEqual(
+            engine.static_exchange_evaluation(chessboard, squares[45], 28),
+            -200)
+        self.assertEqual(
+            engine.static_exchange_evaluation(chessboard, squares[25], 18),
+            200)
+        # The rook on e2 backs up the rook on e1.
+        chessboard = chess_utilities.import_fen_to_board(
+            '4k3/4r3/8/8/4p3/8/4R3/4RK2 w')
+        squares = chessboard.squares
+        self.assertEqual(
+            engine.static_exchange_evaluation(chessboard, squares[12], 28),
+            100)
+
+    def test_quiescence(self):
+        """Quiescence search wins hanging pieces but not defended ones."""
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/8/3q4/8/8/8/K2R4 w')
+        stand_pat = engine.evaluate_position(chessboard)
+        engine.search_stats.clear()
+        score = engine.quiescence(chessboard, float('-inf'), float('inf'))
+        self.assertGreater(score, stand_pat + 800)
+        self.assertGreater(engine.search_stats['qnodes'], 1)
+
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/4p3/3p4/8/8/8/K2R4 w')
+        stand_pat = engine.evaluate_position(chessboard)
+        self.assertEqual(
+            engine.quiescence(chessboard, float('-inf'), float('inf')),
+            stand_pat)
+
+    def test_probcut(self):
+        """Deep nodes are cut by ProbCut captures far above beta."""
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/8/8/6rR/8/8/K7 b')
+        engine.transposition = {}
+        best_move = engine.iterative_deepening(chessboard, 6,
+                                               max_time=1000)[1]
+        self.assertEqual(best_move, (30, 31))
+        self.assertGreater(engine.search_stats['probcut_cuts'], 0)
+        self.assertEqual(engine.search_stats['probcut_cuts'],
+                         engine.search_stats['probcut_cuts', 5])
+
+        engine.transposition = {}
+        with mock.patch.object(engine, 'PROBCUT_MIN_DEPTH', 99):
+            engine.iterative_deepening(chessboard, 6, max_time=1000)
+        engine.transposition = {}
+        self.assertEqual(engine.search_stats['probcut_tries'], 0)
+
+    def test_internal_iterative_deepening(self):
+        """Without a TT move, a reduced search picks the first move."""
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/8/8/6rR/8/8/K7 b')
+        engine.transposition = {}
+        engine.search_stats.clear()
+        best_move = engine.negamax(chessboard, 5)[1]
+        engine.transposition = {}
+        self.assertEqual(best_move, (30, 31))
+        self.assertGreater(engine.search_stats['iid_searches'], 0)
+        self.assertGreater(engine.search_stats['iid_nodes'], 0)
+        self.assertGreater(engine.search_stats['iid_move_best'], 0)
+
+        with mock.patch.object(engine, 'IID_MIN_DEPTH', 99):
+            engine.search_stats.clear()
+            engine.negamax(chessboard, 5)
+        engine.transposition = {}
+        self.assertEqual(engine.search_stats['iid_searches'], 0)
+
+    def test_mate_scores(self):
+        """Checkmate scores count plies from the root, stalemate is a draw,
+        and the TT stores mate scores relative to the node.
+        """
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/1K6/8/8/8/8/7R w')
+        engine.transposition = {}
+        self.assertEqual(engine.negamax(chessboard, 3),
+                         (engine.MATE_SCORE - 1, (7, 63)))
+        self.assertEqual(engine.search_stats['checkmates'] > 0, True)
+        engine.transposition = {}
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/2Q5/1K6/8/8/8/8/8 b')
+        self.assertEqual(engine.negamax(chessboard, 2), (0, None))
+        # Imported boards share a Zobrist hash.
+        engine.transposition = {}
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/1Q6/1K6/8/8/8/8/8 b')
+        self.assertEqual(engine.negamax(chessboard, 2, ply=3),
+                         (-1 * engine.MATE_SCORE + 3, None))
+        # Stored as mated at the node, read back at another ply.
+        self.assertEqual(engine.transposition[chessboard.zobrist_hash][1],
+                         -1 * engine.MATE_SCORE)
+        self.assertEqual(
+            engine.score_from_transposition(-1 * engine.MATE_SCORE, 5),
+            -1 * engine.MATE_SCORE + 5)
+        self.assertEqual(engine.score_from_transposition(250, 5), 250)
+        engine.transposition = {}
+
+        self.assertEqual(engine.format_uci_score(engine.MATE_SCORE - 1),
+                         'mate 1')
+        self.assertEqual(engine.format_uci_score(engine.MATE_SCORE - 3),
+                         'mate 2')
+        self.assertEqual(
+            engine.format_uci_score(-1 * engine.MATE_SCORE + 2), 'mate -1')
+        self.assertEqual(engine.format_uci_score(-35.5), 'cp -35')
+
+    def test_mate_distance_pruning(self):
+        """Nodes past a known mate are not searched."""
+        chessboard = chess_utilities.import_fen_to_board(
+            'r5k1/5ppp/8/8/8/8/3R1PPP/3R2K1 w')
+        engine.transposition = {}
+        score, best_move = engine.iterative_deepening(chessboard, 6,
+                                                      max_time=1000)
+        engine.transposition = {}
+        self.assertEqual((score, best_move), (engine.MATE_SCORE - 3,
+                                              (11, 59)))
+        self.assertGreater(engine.search_stats['mate_distance_prunes'], 0)
+        self.assertEqual(
+            engine.negamax(chessboard, 4, engine.MATE_SCORE - 1,
+                           engine.MATE_SCORE, ply=1),
+            (engine.MATE_SCORE - 1, None))
+
+    def test_uci_position(self):
+        """A move list extending the last one only makes the new moves,
+        and illegal moves are rejected.
+        """
+        chessboard = board.Board()
+        engine.uci('position startpos moves e2e4 e7e5', None, None,
+                   chessboard)
+        with mock.patch.object(engine, 'parse_uci_move',
+                               wraps=engine.parse_uci_move) as parse:
+            engine.uci('position startpos moves e2e4 e7e5 g1f3', None, None,
+                       chessboard)
+            self.assertEqual(parse.call_count, 1)
+            engine.uci('position startpos moves e2e4 c7c5', None, None,
+                       chessboard)
+            self.assertEqual(parse.call_count, 3)
+        self.assertEqual(chessboard.squares[28].name, 'P')
+        self.assertEqual(chessboard.squares[34].name, 'p')
+        self.assertEqual(chessboard.squares[36], ' ')
+        self.assertEqual(len(chessboard.hash_history), 2)
+        expected = board.Board()
+        expected.initialize_pieces()
+        for square_from, square_to in ((12, 28), (50, 34)):
+            expected.squares[square_from].update_moves(expected)
+            expected.squares[square_from].move_piece(expected, square_to)
+        self.assertEqual(chessboard.zobrist_hash, expected.zobrist_hash)
+
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/8/8/8/8/8/r3N2K w')
+        for move in ('e1f3', 'h1g1x', 'h1h3', 'h2h3', 'a8a7'):
+            self.assertIsNone(engine.parse_uci_move(chessboard, move))
+        self.assertFalse(engine.apply_uci_position(
+            chessboard, ['position', 'fen', '1k6/P7/8/8/8/8/8/K7', 'w', '-',
+                         'moves', 'a7a8n', 'b8a8', 'a1b1', 'b1b2']))
+        self.assertEqual(chessboard.squares[56].name, 'k')
+        self.assertEqual(chessboard.squares[1].name, 'K')
+        self.assertEqual(chessboard.material_key, 0)
+
+        # Full FENs keep the en passant square and halfmove clock.
+        original = chessboard
+        self.assertTrue(engine.apply_uci_position(
+            chessboard, ['position', 'fen', 'k7/8/8/3pP3/8/8/8/K7', 'w', '-',
+                         'd6', '7', '40', 'moves', 'a1b1']))
+        self.assertIs(chessboard, original)
+        self.assertEqual(chessboard.halfmove_clock, 8)
+        self.assertTrue(engine.apply_uci_position(
+            chessboard, ['position', 'fen', 'k7/8/8/3pP3/8/8/8/K7', 'w', '-',
+                         'd6', '7', '40', 'moves', 'e5d6']))
+        self.assertEqual(chessboard.squares[43].name, 'P')
+        self.assertEqual(chessboard.squares[35], ' ')
+        self.assertEqual(chessboard.halfmove_clock, 0)
+        self.assertFalse(engine.apply_uci_position(
+            chessboard, ['position', 'fen', 'k7/8/8/3pP3/8/8/8/K7', 'w', '-',
+                         'd3']))
+
+    def test_repetition_draws(self):
+        """UCI moves feed the hash history, and the search scores
+        repetitions as draws without storing them in the TT with a depth.
+        """
+        chessboard = board.Board()
+        engine.uci('position startpos moves g1f3 g8f6 f3g1 f6g8', None,
+                   None, chessboard)
+        self.assertEqual(len(chessboard.hash_history), 4)
+        self.assertEqual(chessboard.halfmove_clock, 4)
+        self.assertTrue(chessboard.is_repetition())
+        self.assertEqual(engine.negamax(chessboard, 2, ply=1), (0, None))
+
+        engine.transposition = {}
+        engine.search_stats.clear()
+        engine.negamax(chessboard, 4)
+        self.assertGreater(engine.search_stats['repetition_draws'], 0)
+        self.assertGreater(engine.search_stats['draw_tainted_stores'], 0)
+        self.assertIn(-1, [entry[3]
+                           for entry in engine.transposition.values()])
+        engine.transposition = {}
+        self.assertEqual(len(chessboard.hash_history), 4)
+
+        chessboard.hash_history = []
+        chessboard.halfmove_clock = 100
+        engine.search_stats.clear()
+        self.assertEqual(engine.negamax(chessboard, 2, ply=1), (0, None))
+        self.assertEqual(engine.search_stats['fifty_move_draws'], 1)
+
+    def test_material_table(self):
+        """The material key looks up the game phase, insufficient
+        material, and scaling for drawish endings.
+        """
+        chessboard = board.Board()
+        chessboard.initialize_pieces()
+        self.assertEqual(engine.material_info(chessboard.material_key),
+                         (0, False, 1, 1))
+        self.assertIn(chessboard.material_key, engine.material_table)
+
+        for fen in ('k7/8/8/8/8/8/8/K7 w', 'k7/8/8/8/8/8/8/KN6 w',
+                    'kb6/8/8/8/8/8/8/K7 w'):
+            chessboard = chess_utilities.import_fen_to_board(fen)
+            self.assertTrue(
+                engine.material_info(chessboard.material_key)[1])
+            self.assertEqual(engine.evaluate_position(chessboard), 0)
+        chessboard.update_black_controlled_squares()
+        engine.search_stats.clear()
+        self.assertEqual(engine.negamax(chessboard, 3, ply=1), (0, None))
+        self.assertEqual(
+            engine.search_stats['insufficient_material_draws'], 1)
+
+        # Rook against bishop, two knights, and a lone rook pawn.
+        for fen, scales in (('kb6/8/8/8/8/8/8/KR6 w', (0.25, 0)),
+                            ('k7/8/8/8/8/8/8/KNN5 w', (0, 0)),
+                            ('k7/8/8/8/8/8/P7/K7 w', (1, 0))):
+            chessboard = chess_utilities.import_fen_to_board(fen)
+            info = engine.material_info(chessboard.material_key)
+            self.assertEqual(info[:2], (1, False))
+            self.assertEqual(info[2:], scales)
+
+        # Undoing a capture restores the key.
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/8/8/8/8/8/Kq6 w')
+        king = chessboard.white_king
+        king.update_moves(chessboard)
+        saved_piece_loop, saved_move_loop = engine.make_move(
+            chessboard, king, 1, king.moves, None, chessboard.white_pieces)
+        self.assertEqual(chessboard.material_key, 0)
+        engine.undo_move(chessboard, saved_piece_loop, saved_move_loop)
+        self.assertEqual(chessboard.material_key,
+                         1 << board.Board.MATERIAL_KEY_SHIFTS['q'])
+
+    def test_pinned_piece_giving_check(self):
+        """A pinned knight which would give check is not searched. Both
+        kings in check used to recurse without end.
+        """
+        chessboard = chess_utilities.import_fen_to_board(
+            '3k4/4q3/bn6/3PN2B/8/2p3Qp/PPPB1PPP/R3K2R w', autopromote=True)
+        engine.transposition = {}
+        best_move = engine.negamax(chessboard, 2)[1]
+        engine.transposition = {}
+        self.assertNotEqual(best_move[0], 36)
+        self.assertFalse([move for move in engine.legal_moves(chessboard)
+                          if move[0] == 36])
+
+    def test_futility_pruning(self):
+        """Static eval margins prune near the leaves, but not around mate
+        scores.
+        """
+        chessboard = chess_utilities.import_fen_to_board(
+            'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w',
+            autopromote=True)
+        engine.transposition = {}
+        engine.search_stats.clear()
+        best_move = engine.negamax(chessboard, 4)[1]
+        self.assertEqual(best_move, (12, 40))
+        self.assertGreater(engine.search_stats['futility_prunes'], 0)
+        self.assertGreater(
+            engine.search_stats['reverse_futility_cutoffs'], 0)
+
+        # A depth 3 node far below alpha.
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/8/8/6rR/8/8/K7 b')
+        alpha = engine.evaluate_position(chessboard) + 1000
+        engine.transposition = {}
+        engine.search_stats.clear()
+        engine.negamax(chessboard, 3, alpha, alpha + 1, ply=1)
+        self.assertEqual(engine.search_stats['razoring_reductions'], 1)
+
+        engine.transposition = {}
+        engine.search_stats.clear()
+        engine.negamax(chessboard, 3, engine.MATE_SCORE - 1,
+                       engine.MATE_SCORE)
+        engine.transposition = {}
+        self.assertEqual(engine.search_stats['futility_prunes'], 0)
+        self.assertEqual(engine.search_stats['reverse_futility_cutoffs'], 0)
+
+    def test_principal_variation(self):
+        """The principal variation follows transposition table moves and
+        leaves the board as it was.
+        """
+        chessboard = board.Board()
+        chessboard.initialize_pieces()
+        engine.transposition = {}
+        best_move = engine.iterative_deepening(chessboard, 3)[1]
+        zobrist_hash = chessboard.zobrist_hash
+        pv = engine.principal_variation(chessboard, best_move)
+        engine.transposition = {}
+        self.assertEqual(pv[0], best_move)
+        self.assertGreater(len(pv), 1)
+        self.assertEqual(chessboard.zobrist_hash, zobrist_hash)
+        self.assertEqual(chessboard.hash_history, [])
+
+    def test_run_search(self):
+        """A UCI search sends an info line per iteration, then bestmove."""
+        chessboard = board.Board()
+        chessboard.initialize_pieces()
+        lines = []
+        engine.run_search(chessboard, {'depth': 2}, stop=threading.Event(),
+                          output=lines.append)
+        engine.transposition = {}
+        self.assertEqual(len(lines), 3)
+        self.assertRegex(lines[0], r'^info depth 1 seldepth 1 score cp ')
+        self.assertTrue(lines[-1].startswith('bestmove '))
+
+        # The ponder move comes from the last info line, even once the
+        # transposition table no longer holds its principal variation.
+        search = engine.iterative_deepening
+
+        def search_and_clear(*args, **kwargs):
+            values = search(*args, **kwargs)
+            engine.transposition = {}
+            return values
+
+        lines = []
+        with mock.patch.object(engine, 'iterative_deepening',
+                               search_and_clear):
+            engine.run_search(chessboard, {'depth': 2},
+                              stop=threading.Event(), output=lines.append)
+        pv = lines[1].split(' pv ')[1].split()
+        self.assertEqual(len(pv), 2)
+        self.assertEqual(lines[2], f'bestmove {pv[0]} ponder {pv[1]}')
+
+    def test_search_info(self):
+        """Search counters and the rates derived from them, as reported
+        in UCI info lines.
+        """
+        chessboard = chess_utilities.import_fen_to_board(
+            engine.BENCH_FENS[1], autopromote=True)
+        engine.transposition = {}
+        engine.iterative_deepening(chessboard, 3, max_time=float('inf'))
+        info = engine.search_info()
+        engine.transposition = {}
+        self.assertGreaterEqual(info['seldepth'], 3)
+        self.assertGreater(info['nodes'], 0)
+        self.assertGreater(info['tt_hits'], 0)
+        self.assertGreater(info['tt_probes'], info['tt_hits'])
+        self.assertGreater(info['first_move_cutoffs'], 0)
+        self.assertGreaterEqual(info['beta_cutoffs'],
+                                info['first_move_cutoffs'])
+        self.assertTrue(0 < info['first_move_cutoff_rate'] <= 1)
+        self.assertGreater(info['nps'], 0)
+        self.assertRegex(
+            engine.format_uci_info(3, 25, [(12, 28), (52, 36)], multipv=2),
+            r'^info depth 3 seldepth \d+ multipv 2 score cp 25 nodes \d+ '
+            r'nps \d+ hashfull 0 time \d+ pv e2e4 e7e5$')
+
+        output = []
+        time_manager = engine.TimeManager(output=output.append)
+        time_manager.poll(0)
+        self.assertEqual(output, [])
+        time_manager.info_time = 0
+        time_manager.poll(0)
+        time_manager.root_move(4, (12, 28), 2)
+        time_manager.poll(0)
+        time_manager.info_time = 0
+        time_manager.poll(0)
+        self.assertEqual(len(output), 2)
+        self.assertTrue(output[0].startswith('info nodes '))
+        self.assertTrue(output[1].startswith(
+            'info depth 4 currmove e2e4 currmovenumber 2 nodes '))
+
+    def test_search_analytics(self):
+        """Nodes by depth and cutoffs by move number, recorded only while
+        enabled, and the JSON report.
+        """
+        chessboard = chess_utilities.import_fen_to_board(
+            engine.BENCH_FENS[1], autopromote=True)
+        engine.transposition = {}
+        self.assertIsNone(engine.search_analytics_report())
+        engine.start_search_analytics()
+        engine.iterative_deepening(chessboard, 3, max_time=float('inf'))
+        nodes = engine.search_stats['nodes']
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'analytics.json')
+            engine.dump_search_analytics(path)
+            with open(path) as report_file:
+                report = json.load(report_file)
+        self.assertEqual(engine.stop_search_analytics(), report)
+        self.assertIsNone(engine.search_analytics)
+        engine.transposition = {}
+
+        self.assertEqual(report['searches'], 1)
+        self.assertEqual([depth['depth'] for depth in report['depths']],
+                         [1, 2, 3])
+        self.assertIsNone(report['depths'][0]['ebf'])
+        self.assertEqual(report['depths'][1]['ebf'], round(
+            report['depths'][1]['nodes'] / report['depths'][0]['nodes'], 3))
+        self.assertEqual(sum(depth['nodes'] for depth in report['depths']),
+                         nodes)
+        self.assertEqual(sum(report['plies'].values()), nodes)
+        self.assertEqual(sum(report['cutoff_move_numbers'].values()),
+                         report['cut_nodes'])
+        self.assertEqual(sum(draft['cut_nodes'] for draft
+                             in report['drafts']), report['cut_nodes'])
+        self.assertAlmostEqual(report['first_move_cutoff_rate'],
+                               report['cutoff_move_numbers']['1']
+                               / report['cut_nodes'], places=4)
+
+    def test_multipv_search(self):
+        """The best lines are kept with their scores, best first, and UCI
+        reports each as an "info multipv" line.
+        """
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/8/8/6rR/8/8/K7 w')
+        engine.transposition = {}
+        depths = []
+        lines = engine.multipv_search(
+            chessboard, 3, 3, max_time=float('inf'),
+            info=lambda depth, lines: depths.append((depth, len(lines))))
+        self.assertEqual(depths, [(1, 3), (2, 3), (3, 3)])
+        self.assertEqual(lines[0][1], (31, 30))
+        self.assertEqual(len({move for _, move in lines}), 3)
+        self.assertEqual([score for score, _ in lines],
+                         sorted([score for score, _ in lines], reverse=True))
+        self.assertGreater(lines[0][0], lines[1][0] + 300)
+        engine.transposition = {}
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/8/8/8/8/7P/K7 w')
+        self.assertEqual(len(engine.multipv_search(chessboard, 2, 64)), 5)
+
+        response = io.StringIO()
+        with contextlib.redirect_stdout(response):
+            engine.uci('setoption name MultiPV value 2', None, None,
+                       chessboard)
+        self.assertEqual(engine.uci_options['MultiPV'], 2)
+        output = []
+        engine.run_search(chessboard, {'depth': 2}, output=output.append)
+        engine.uci_options['MultiPV'] = 1
+        engine.transposition = {}
+        self.assertEqual(len(output), 5)
+        self.assertRegex(output[0], r'^info depth 1 seldepth 1 multipv 1 ')
+        self.assertRegex(output[3], r'^info depth 2 seldepth \d+ multipv 2 ')
+        self.assertTrue(output[4].startswith('bestmove '))
+
+    def test_search_worker(self):
+        """The search runs in another process, stops within 10 ms, and
+        the front end answers isready at once.
+        """
+        chessboard = board.Board()
+        chessboard.initialize_pieces()
+        response = io.StringIO()
+        with contextlib.redirect_stdout(response):
+            search_worker = engine.SearchWorker()
+            search_worker.go(chessboard, {'infinite': True})
+            time.sleep(0.5)
+            start = time.perf_counter()
+            engine.uci('isready', None, None, chessboard, search_worker)
+            self.assertLess(time.perf_counter() - start, 0.01)
+            search_worker.stop()
+            self.assertTrue(search_worker.wait(timeout=5))
+            search_worker.quit()
+        self.assertFalse(search_worker.process.is_alive())
+        self.assertEqual(len(search_worker.stop_latencies), 1)
+        self.assertLess(search_worker.stop_latencies[0], 0.01)
+        lines = response.getvalue().splitlines()
+        self.assertIn('readyok', lines)
+        self.assertTrue(lines[-1].startswith('bestmove '))
+
+    def test_search_worker_ponder(self):
+        """After a ponderhit the same search ends within its time limit.
+        A ponder search ended by "stop" is a miss.
+        """
+        chessboard = board.Board()
+        chessboard.initialize_pieces()
+        response = io.StringIO()
+        with contextlib.redirect_stdout(response):
+            search_worker = engine.SearchWorker()
+            search_worker.go(chessboard, {'ponder': True, 'movetime': 200})
+            time.sleep(0.5)
+            self.assertTrue(search_worker.searching.is_set())
+            start = time.perf_counter()
+            search_worker.ponderhit()
+            self.assertTrue(search_worker.wait(timeout=5))
+            self.assertLess(time.perf_counter() - start, 0.4)
+            search_worker.go(chessboard, {'ponder': True, 'movetime': 200})
+            time.sleep(0.3)
+            search_worker.stop()
+            self.assertTrue(search_worker.wait(timeout=5))
+            search_worker.quit()
+        self.assertEqual(search_worker.ponder_stats['searches'], 2)
+        self.assertEqual(search_worker.ponder_stats['hits'], 1)
+        self.assertEqual(search_worker.ponder_stats['misses'], 1)
+        self.assertGreater(search_worker.ponder_stats['saved_time'], 0.4)
+        lines = response.getvalue().splitlines()
+        reports = [i for i, line in enumerate(lines)
+                   if line.startswith('info string ')]
+        self.assertEqual(len(reports), 2)
+        self.assertTrue(lines[reports[0]].startswith(
+            'info string ponder hits 1 misses 0 saved '))
+        self.assertTrue(lines[reports[1]].startswith(
+            'info string ponder hits 1 misses 1 saved '))
+        for i in reports:
+            self.assertTrue(lines[i + 1].startswith('bestmove '))
+        self.assertIn(' ponder ', lines[-1])
+
+    def test_uci_loop(self):
+        """Commands are answered in order while a search runs, a new "go"
+        stops the running search first, and end of input quits.
+        """
+        async def run_loop(search_worker):
+            reader = asyncio.StreamReader()
+            reader.feed_data(b'position startpos\ngo infinite\n')
+            loop_task = asyncio.create_task(
+                engine.uci_loop(board.Board(), search_worker, reader))
+            await asyncio.sleep(0.5)
+            reader.feed_data(b'isready\nponderhit\ngo depth 1\n')
+            await asyncio.sleep(0.5)
+            reader.feed_eof()
+            await asyncio.wait_for(loop_task, timeout=10)
+
+        response = io.StringIO()
+        with contextlib.redirect_stdout(response):
+            search_worker = engine.SearchWorker()
+            asyncio.run(run_loop(search_worker))
+        self.assertFalse(search_worker.process.is_alive())
+        lines = response.getvalue().splitlines()
+        bestmoves = [i for i, line in enumerate(lines)
+                     if line.startswith('bestmove ')]
+        self.assertEqual(len(bestmoves), 2)
+        self.assertLess(lines.index('readyok'), bestmoves[0])
+        self.assertTrue(lines[bestmoves[0] + 1].startswith('info depth 1 '))
@@ -0,0 +1,281 @@
+"""Tests for parallel.py, the multi-process searches."""
+from collections import Counter
+import contextlib
+import io
+import multiprocessing
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+import board
+import chess_utilities
+import engine
+import parallel
+
+
+class TestParallel(unittest.TestCase):
+    """Shared transposition table entries and Lazy SMP searches."""
+
+    def setUp(self):
+        """Create a small shared table."""
+        self.table = parallel.SharedTranspositionTable(slots=1 << 4)
+
+    def tearDown(self):
+        """Release the shared table."""
+        self.table.close()
+        self.table.unlink()
+
+    def test_shared_table_entries(self):
+        """Entries round trip, and probes of other positions miss."""
+        entries = [((12, 28), 35, 'pvnode', 4),
+                   (None, -1 * (engine.MATE_SCORE - 3), 'cutnode', 64),
+                   ((63, 0), float('-inf'), 'allnode', -1),
+                   ((1, 18), float('inf'), 'cutnode', 0)]
+        for zobrist_hash, entry in enumerate(entries):
+            self.table[zobrist_hash] = entry
+            self.assertEqual(self.table[zobrist_hash], entry)
+        self.assertIn(3, self.table)
+        # Same slot as hash 1, different position.
+        self.assertIsNone(self.table.get(1 + (1 << 4)))
+        self.table[5] = ((8, 16), 12.6, 'pvnode', 2)
+        self.assertEqual(self.table[5][1], 13)
+
+        self.table.clear()
+        self.assertNotIn(0, self.table)
+        self.assertEqual(len(self.table), 0)
+
+    def test_torn_entry(self):
+        """A slot whose two words come from different writes is a miss,
+        including the all zero slot for hash 0.
+        """
+        self.assertIsNone(self.table.get(0))
+        self.table[7] = ((12, 28), 35, 'pvnode', 4)
+        self.table[7 + (1 << 4)] = ((12, 20), 10, 'allnode', 2)
+        check = self.table.words[14]
+        self.table[7] = ((12, 28), 35, 'pvnode', 4)
+        self.table.words[14] = check
+        self.assertIsNone(self.table.get(7))
+        self.assertIsNone(self.table.get(7 + (1 << 4)))
+
+        attached = parallel.SharedTranspositionTable(slots=1 << 4,
+                                                     name=self.table.name)
+        attached[9] = ((6, 21), -40, 'cutnode', 3)
+        attached.close()
+        self.assertEqual(self.table[9], ((6, 21), -40, 'cutnode', 3))
+
+    def test_lazy_smp_search(self):
+        """Helpers share the table and the deepest result is returned."""
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/8/8/6rR/8/8/K7 w')
+        engine.transposition = {}
+        parallel.get_shared_table().clear()
+        depths = []
+        score, best_move, pv = parallel.lazy_smp_search(
+            chessboard, 3, 2, max_time=float('inf'),
+            info=lambda depth, score, best_move: depths.append(depth))
+        self.assertEqual(best_move, (31, 30))
+        self.assertEqual(pv[0], best_move)
+        self.assertGreater(len(pv), 1)
+        self.assertEqual(depths, [1, 2, 3])
+        self.assertGreater(engine.search_stats['helper_nodes'], 0)
+        self.assertEqual(engine.transposition, {})
+        self.assertIn(chessboard.zobrist_hash, parallel.get_shared_table())
+
+    def test_root_split_search(self):
+        """Root moves split between workers merge into one best move and
+        principal variation.
+        """
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/8/8/6rR/8/8/K7 w')
+        engine.transposition = {}
+        depths = []
+        score, best_move, pv = parallel.root_split_search(
+            chessboard, 3, 2, max_time=float('inf'),
+            info=lambda depth, score, best_move: depths.append(depth))
+        self.assertEqual(best_move, (31, 30))
+        self.assertEqual(pv[0], (31, 30))
+        self.assertEqual(depths, [1, 2, 3])
+        self.assertGreater(engine.search_stats['nodes'], 0)
+        self.assertEqual(
+            parallel.search(chessboard, 2, 3, mode='rootsplit',
+                            max_time=float('inf')),
+            parallel.root_split_search(chessboard, 2, 1,
+                                       max_time=float('inf')))
+        with self.assertRaises(ValueError):
+            parallel.search(chessboard, 2, 2, mode='dts')
+
+    def test_root_split_node_limit(self):
+        """Nodes searched by the workers count toward a node limit
+        during an iteration, not only once it is done.
+        """
+        chessboard = chess_utilities.import_fen_to_board(
+            engine.BENCH_FENS[1], autopromote=True)
+        engine.transposition = {}
+        depths = []
+        time_manager = engine.TimeManager(nodes=2000)
+        best_move = parallel.root_split_search(
+            chessboard, 8, 2, time_manager=time_manager,
+            info=lambda depth, score, best_move: depths.append(depth))[1]
+        self.assertTrue(time_manager.stop.is_set())
+        self.assertEqual(depths, [1, 2])
+        self.assertLess(engine.search_stats['nodes'], 3000)
+        self.assertIsNotNone(best_move)
+
+    def test_ybwc_search(self):
+        """Moves after the first at split points are searched by workers,
+        and a fail high aborts the split point's other tasks.
+        """
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/8/8/6rR/8/8/K7 w')
+        engine.transposition = {}
+        depths = []
+        time_manager = engine.TimeManager()
+        score, best_move = parallel.ybwc_search(
+            chessboard, 4, 2, time_manager=time_manager,
+            info=lambda depth, score, best_move: depths.append(depth))
+        engine.transposition = {}
+        self.assertEqual(best_move, (31, 30))
+        self.assertEqual(depths, [1, 2, 3, 4])
+        self.assertGreater(engine.search_stats['split_points'], 0)
+        self.assertGreater(engine.search_stats['split_tasks'], 0)
+        # The root split point names its moves for UCI "currmove".
+        self.assertEqual(time_manager.currmove[0], 4)
+
+        # A split point takes transposition table cutoffs as negamax()
+        # does, without searching or handing out moves.
+        engine.reset_search_stats()
+        engine.transposition = {
+            chessboard.zobrist_hash: ((31, 30), 250, 'pvnode', 3)}
+        self.assertEqual(parallel._ybwc(chessboard, 3, -100, 100, 1, None,
+                                        None, None, None), (250, (31, 30)))
+        engine.transposition = {
+            chessboard.zobrist_hash: ((31, 30), 250, 'cutnode', 3)}
+        self.assertEqual(parallel._ybwc(chessboard, 3, -100, 100, 1, None,
+                                        None, None, None), (100, (31, 30)))
+        self.assertEqual(engine.search_stats['nodes'], 2)
+        self.assertEqual(engine.search_stats['tt_hits'], 2)
+        engine.transposition = {}
+
+        stop = parallel._SplitPointStop(2)
+        parallel._init_ybwc_worker(multiprocessing.RawArray('d', 4),
+                                   multiprocessing.RawArray('b', 4),
+                                   multiprocessing.Event())
+        self.assertFalse(stop.is_set())
+        parallel._split_aborts[2] = 1
+        self.assertTrue(stop.is_set())
+        self.assertEqual(parallel._ybwc_worker(b'', 3, 2, 100),
+                         (None, 0, 0, 0))
+        parallel._init_ybwc_worker(None, None, None)
+
+    def test_ybwc_repetition_draws(self):
+        """Split points do not store results which used repetition draws,
+        including those found by workers, with a depth.
+        """
+        chessboard = board.Board()
+        engine.uci('position startpos moves g1f3 g8f6 f3g1 f6g8', None,
+                   None, chessboard)
+        engine.transposition = {}
+        parallel.ybwc_search(chessboard, 4, 2, max_time=float('inf'))
+        self.assertGreater(engine.search_stats['repetition_draws'], 0)
+        self.assertGreater(engine.search_stats['draw_tainted_stores'], 0)
+        self.assertEqual(engine.transposition[chessboard.zobrist_hash][3],
+                         -1)
+        engine.transposition = {}
+
+    def test_threaded_search(self):
+        """Helper threads search their own board copies and share the
+        transposition table, only when the GIL is disabled.
+        """
+        self.assertEqual(parallel.gil_enabled(),
+                         getattr(sys, '_is_gil_enabled', lambda: True)())
+        chessboard = chess_utilities.import_fen_to_board(
+            'k7/8/8/8/6rR/8/8/K7 w')
+        zobrist_hash = chessboard.zobrist_hash
+        for gil, threads in ((True, 1), (False, 3)):
+            engine.transposition = {}
+            depths = []
+            with mock.patch.object(parallel, 'gil_enabled',
+                                   return_value=gil):
+                score, best_move, pv = parallel.search(
+                    chessboard, 3, 3, mode='threads', max_time=float('inf'),
+                    info=lambda depth, score, best_move: depths.append(depth))
+            self.assertEqual(best_move, (31, 30))
+            self.assertEqual(depths, [1, 2, 3])
+            self.assertEqual(engine.search_stats['search_threads'], threads)
+            self.assertIn(zobrist_hash, engine.transposition)
+            self.assertEqual(chessboard.zobrist_hash, zobrist_hash)
+        engine.transposition = {}
+
+        # Helper threads count in their own stats, so the calling thread's
+        # nodes are those of its own search.
+        engine.iterative_deepening(chessboard, 3, max_time=float('inf'))
+        nodes = engine.search_stats['nodes']
+        engine.transposition = {}
+
+        def helper_search(chessboard, depth, worker_id, stop, report):
+            engine.search_stats['nodes'] += 1000
+            stop.wait()
+
+        with mock.patch.object(parallel, 'gil_enabled',
+                               return_value=False):
+            with mock.patch.object(parallel, '_helper_search',
+                                   helper_search):
+                parallel.threaded_search(chessboard, 3, 3,
+                                         max_time=float('inf'))
+        engine.transposition = {}
+        self.assertEqual(engine.search_stats['nodes'], nodes)
+        self.assertEqual(engine.search_stats['helper_nodes'], 2000)
+        self.assertIsInstance(engine.search_stats, Counter)
+
+    def test_uci_threads(self):
+        """UCI "setoption" selects the number of workers and the parallel
+        search algorithm.
+        """
+        response = io.StringIO()
+        with contextlib.redirect_stdout(response):
+            engine.uci('uci', None, None, board.Board())
+            engine.uci('setoption name Threads value 99', None, None,
+                       board.Board())
+            engine.uci('setoption name ParallelMode value rootsplit', None,
+                       None, board.Board())
+        self.assertIn('option name Threads type spin default 1 min 1 max 16',
+                      response.getvalue())
+        self.assertIn('option name ParallelMode type combo default lazysmp '
+                      'var lazysmp var rootsplit var ybwc var threads',
+                      response.getvalue())
+        self.assertEqual(engine.uci_options,
+                         {'Threads': 16, 'ParallelMode': 'rootsplit',
+                          'MultiPV': 1})
+        engine.uci_options.update(Threads=1, ParallelMode='lazysmp')
+
+    def test_uci_script_threads(self):
+        """Run as a script, parallel searches share the engine module's
+        counters and table, so info lines report their nodes and principal
+        variation, and the shared table is released on quit.
+        """
+        engine_process = subprocess.Popen(
+            [sys.executable, engine.__file__], stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+            bufsize=1)
+        try:
+            engine_process.stdin.write('setoption name Threads value 2\n'
+                                       'position startpos moves e2e4\n'
+                                       'go depth 3\n')
+            engine_process.stdin.flush()
+            lines = []
+            while not lines or not lines[-1].startswith('bestmove'):
+                line = engine_process.stdout.readline()
+                self.assertTrue(line)
+                lines.append(line.strip())
+            errors = engine_process.communicate('quit\n', timeout=30)[1]
+        finally:
+            if engine_process.poll() is None:
+                engine_process.kill()
+        info = lines[-2].split()
+        self.assertEqual(info[:3], ['info', 'depth', '3'])
+        self.assertGreater(int(info[info.index('nodes') + 1]), 0)
+        self.assertGreater(len(info) - info.index('pv') - 1, 1)
+        self.assertIn(' ponder ', lines[-1])
+        # The search process releases the shared table before it exits.
+        self.assertNotIn('leaked shared_memory', errors)
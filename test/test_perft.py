@@ -1,105 +1,13 @@
 """Debug the move generating functions by counting nodes of move tree."""
 
-from collections import defaultdict
-import cProfile
 import unittest
 
 import board
 import chess_utilities
-from engine import replicate_promotion_moves, generate_move_tree
+from engine import perft
 import pieces
 
 
-pr = cProfile.Profile()
-pr.disable()
-
-square_to_alg_notation = board.Board.int_to_alg_notation
-
-
-def divide(chessboard, depth):
-    """DFS through move tree and print subtree node counts."""
-    if chessboard.last_move_piece.color == 'white':
-        friendly_king = chessboard.black_king
-        pieces_to_move = chessboard.black_pieces
-    else:
-        friendly_king = chessboard.white_king
-        pieces_to_move = chessboard.white_pieces
-
-    divided = defaultdict(int)
-    nodes = 0
-    for chessboard in generate_move_tree(chessboard, pieces_to_move):
-        if friendly_king.color == 'white':
-            chessboard.update_black_controlled_squares()
-        else:
-            chessboard.update_white_controlled_squares()
-        if friendly_king.check_if_in_check(
-                chessboard.white_controlled_squares,
-                chessboard.black_controlled_squares):
-            friendly_king.in_check = False
-            continue
-        else:
-            nodes = perft(chessboard, depth - 1)
-
-        piece_symbol = ''
-        try:
-            # Last move was a pawn promotion.
-            if chessboard.last_move_piece.name[1] == 'p':
-                move = chessboard.last_move_from_to[1]
-                piece_symbol = chessboard.last_move_piece.name[0].lower()
-        except IndexError:
-            move = chessboard.last_move_from_to[1]
-        prev_square = chessboard.last_move_from_to[0]
-        piece_name = chessboard.last_move_piece.name[0]
-        move = ' '.join([piece_name,
-                         square_to_alg_notation[prev_square],
-                         square_to_alg_notation[move],
-                         piece_symbol, ':'])
-        divided[move] += nodes
-    print('\n')
-    for k, v in divided.items():
-        print(k, v)
-    print('Total:', sum(divided.values()))
-
-
-def perft(chessboard, depth):
-    """DFS through move tree and return the node count."""
-    if chessboard.last_move_piece.color == 'white':
-        friendly_king = chessboard.black_king
-        pieces_to_move = chessboard.black_pieces
-    else:
-        friendly_king = chessboard.white_king
-        pieces_to_move = chessboard.white_pieces
-
-    nodes = 0
-    if depth == 1:
-        chessboard.update_white_controlled_squares()
-        chessboard.update_black_controlled_squares()
-        chessboard.white_king.update_moves(chessboard)
-        if chessboard.last_move_piece.color == 'white':
-            chessboard.remove_illegal_moves_for_pinned_pieces('black')
-        else:
-            chessboard.remove_illegal_moves_for_pinned_pieces('white')
-        replicate_promotion_moves(chessboard)
-        n_moves = sum([len(piece.moves) for piece in pieces_to_move])
-        return n_moves
-    # For divide(depth=1)
-    elif depth == 0:
-        return 1
-
-    for chessboard in generate_move_tree(chessboard, pieces_to_move):
-        if friendly_king.color == 'white':
-            chessboard.update_black_controlled_squares()
-        else:
-            chessboard.update_white_controlled_squares()
-        if friendly_king.check_if_in_check(
-                chessboard.white_controlled_squares,
-                chessboard.black_controlled_squares):
-            friendly_king.in_check = False
-        else:
-            nodes += perft(chessboard, depth - 1)
-    return nodes
-
-
 class TestPerft(unittest.TestCase):
     """Check Perft node counts from various positions."""
 
@@ -139,7 +47,6 @@ class TestPerft(unittest.TestCase):
         nodes = {1: 24, 2: 496, 3: 9483, 4: 182838, 5: 3605103}
         chessboard = chess_utilities.import_fen_to_board(
             'n1n5/PPPk4/8/8/8/8/4Kppp/5N1N b', autopromote=True)
-        chessboard.update_zobrist_hash()
         initial_hash = chessboard.zobrist_hash
         initial_ep_hash_to_undo = chessboard.ep_hash_to_undo
 
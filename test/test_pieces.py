@@ -69,7 +69,6 @@ class TestPieces(SetUpTearDown):
     def test_zobrist_hash_updates_on_piece_movement(self):
         """Piece moves update the hash."""
         chessboard = chess_utilities.import_fen_to_board('8/8/8/8/8/8/8/6NR w')
-        chessboard.update_zobrist_hash()
         expected = chessboard.hash_nums[1][6] ^ chessboard.hash_nums[3][7]
         self.assertEqual(chessboard.zobrist_hash, expected)
 
@@ -82,7 +81,6 @@ class TestPieces(SetUpTearDown):
     def test_zobrist_hash_updates_on_capture(self):
         """Captures update the hash."""
         chessboard = chess_utilities.import_fen_to_board('8/8/8/8/8/8/7q/7R w')
-        chessboard.update_zobrist_hash()
         expected = chessboard.hash_nums[10][15] ^ chessboard.hash_nums[3][7]
         self.assertEqual(chessboard.zobrist_hash, expected)
 
@@ -95,7 +93,6 @@ class TestPieces(SetUpTearDown):
     def test_zobrist_hash_updates_on_double_pawn_move(self):
         """Hash includes existence/expiration of an en passant square."""
         chessboard = chess_utilities.import_fen_to_board('8/8/8/8/8/8/7P/8 w')
-        chessboard.update_zobrist_hash()
         expected = chessboard.hash_nums[0][15]
         self.assertEqual(chessboard.zobrist_hash, expected)
         # Double pawn move. Switch turn to black.
@@ -114,7 +111,6 @@ class TestPieces(SetUpTearDown):
         """Hash includes any remaining castling rights."""
         chessboard = chess_utilities.import_fen_to_board(
             'r3k2r/8/8/8/8/8/8/R3K2R w')
-        chessboard.update_zobrist_hash()
         expected = chessboard.hash_nums[3][0] ^ chessboard.hash_nums[3][7] \
             ^ chessboard.hash_nums[5][4] ^ chessboard.hash_nums[11][60] \
             ^ chessboard.hash_nums[9][56] ^ chessboard.hash_nums[9][63]
@@ -278,6 +274,8 @@ class TestPieces(SetUpTearDown):
         black_pawn.move_piece(chessboard, 1)
         self.assertTrue(isinstance(chessboard.squares[57], pieces.Bishop))
         self.assertTrue(isinstance(chessboard.squares[1], pieces.Rook))
+        # Promoted rooks cannot castle.
+        self.assertTrue(chessboard.squares[1].has_moved)
         self.assertEqual(chessboard.white_pieces, [chessboard.squares[57]])
 
     def test_computer_pawn_promotion(self):
@@ -0,0 +1,73 @@
+"""Tests for profiling.py, the profiles of searches, bench and perft."""
+import contextlib
+import io
+import os
+import pstats
+import tempfile
+import unittest
+
+import board
+import engine
+import pieces
+import profiling
+
+
+class TestProfiling(unittest.TestCase):
+    """Profile files and the report by engine part."""
+
+    def setUp(self):
+        """Make a profile path and a board in the start position."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'profile')
+        self.chessboard = board.Board()
+        self.chessboard.last_move_piece = pieces.Pawn('p', 'black', 100)
+        self.chessboard.initialize_pieces(autopromote=['white', 'black'])
+
+    def tearDown(self):
+        """Empty the table and remove the profile files."""
+        engine.transposition = {}
+        self.directory.cleanup()
+
+    def test_profile_perft(self):
+        """The .pstats and .collapsed files are written, and the report
+        lists each part's functions.
+        """
+        report = io.StringIO()
+        nodes = profiling.profile(engine.perft, self.chessboard, 3,
+                                  path=self.path, top=3, stream=report)
+        self.assertEqual(nodes, 8902)
+        stats = pstats.Stats(self.path + '.pstats')
+        self.assertIn('perft', {name for _, _, name in stats.stats})
+        with open(self.path + '.collapsed') as collapsed:
+            lines = collapsed.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertGreater(int(count), 0)
+            self.assertNotIn('profiling.py:run', stack.split(';'))
+        self.assertTrue(any('engine.py:perft;' in line for line in lines))
+
+        report = report.getvalue()
+        for category in profiling.PROFILE_CATEGORIES:
+            self.assertIn(f'\n{category}: ', report)
+        self.assertIn('(update_white_controlled_squares)', report)
+        self.assertIn('(move_piece)', report)
+
+    def test_profiler_runs(self):
+        """A Profiler sums the runs given to it, as the SearchWorker's
+        does over searches, and UCI "bench" reports nodes per second.
+        """
+        profiler = profiling.Profiler(self.path)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            profiler.run(engine.uci, 'bench 1', None, None,
+                         self.chessboard)
+        self.assertRegex(output.getvalue(), r'^info string bench depth 1 '
+                                            r'nodes \d+ time \d+ nps \d+\n$')
+        profiler.run(engine.perft, self.chessboard, 2)
+        profiler.dump()
+        calls = {name: stats[1] for (_, _, name), stats
+                 in pstats.Stats(self.path + '.pstats').stats.items()}
+        self.assertEqual(calls['bench'], 1)
+        self.assertGreater(calls['evaluate_position'], 0)
+        self.assertGreater(calls['perft'], 1)
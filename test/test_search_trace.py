@@ -0,0 +1,79 @@
+"""Tests for search_trace.py, the binary search tree traces."""
+import os
+import tempfile
+import unittest
+
+import chess_utilities
+import engine
+import search_trace
+
+
+class TestSearchTrace(unittest.TestCase):
+    """Trace records, sampling and the rebuilt subtrees."""
+
+    def setUp(self):
+        """Make a trace path and a board, with an empty table."""
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'trace.bin')
+        self.chessboard = chess_utilities.import_fen_to_board(
+            engine.BENCH_FENS[1], autopromote=True)
+        engine.transposition = {}
+
+    def tearDown(self):
+        """Empty the table and remove the trace."""
+        engine.transposition = {}
+        self.directory.cleanup()
+
+    def test_trace_subtrees(self):
+        """Every node is traced once and the subtrees rebuild to one tree
+        per root search, only while the tracer is started.
+        """
+        search = engine.negamax
+        with search_trace.Tracer(self.path) as tracer:
+            engine.iterative_deepening(self.chessboard, 2,
+                                       max_time=float('inf'))
+        self.assertIs(engine.negamax, search)
+        nodes = engine.search_stats['nodes']
+        records = search_trace.read_trace(self.path)
+        self.assertEqual(len(records), nodes)
+        self.assertEqual(tracer.records, nodes)
+        self.assertEqual(os.path.getsize(self.path),
+                         nodes * search_trace.RECORD.size)
+
+        roots = search_trace.build_subtrees(records)
+        self.assertEqual([root.record.ply for root in roots], [0, 0])
+        self.assertEqual([root.record.depth for root in roots], [1, 2])
+        self.assertEqual(sum(root.size for root in roots), nodes)
+        self.assertEqual(roots[0].record.alpha, float('-inf'))
+        self.assertEqual(roots[0].record.node_type, 'pvnode')
+        for child in roots[1].children:
+            self.assertEqual(child.record.ply, 1)
+            self.assertIsNotNone(child.record.move)
+
+        report = search_trace.hot_spots(roots, top=3)
+        self.assertEqual(report['nodes'], nodes)
+        self.assertEqual(report['plies'][0], 2)
+        self.assertEqual(len(report['root_moves']), 3)
+        self.assertEqual(sum(report['node_types'].values()), nodes)
+        self.assertEqual(report['positions'][0],
+                         (self.chessboard.zobrist_hash, 2, nodes))
+
+        engine.iterative_deepening(self.chessboard, 1,
+                                   max_time=float('inf'))
+        self.assertEqual(len(search_trace.read_trace(self.path)), nodes)
+
+    def test_trace_sampling(self):
+        """Every Nth subtree at the sample ply is traced, with the nodes
+        above it.
+        """
+        with search_trace.Tracer(self.path, sample=3) as tracer:
+            engine.iterative_deepening(self.chessboard, 2,
+                                       max_time=float('inf'))
+        roots = search_trace.build_subtrees(
+            search_trace.read_trace(self.path))
+        self.assertEqual(len(roots), 2)
+        self.assertEqual(sum(len(root.children) for root in roots),
+                         (tracer.sampled_subtrees + 2) // 3)
+        self.assertLess(tracer.records, engine.search_stats['nodes'])
+        with self.assertRaises(ValueError):
+            search_trace.Tracer(self.path, sample=0)